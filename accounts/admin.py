@@ -1,4 +1,5 @@
 from django.contrib import admin
+from django.utils import timezone
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from unfold.admin import ModelAdmin
 from unfold.forms import AdminPasswordChangeForm, UserChangeForm, UserCreationForm
@@ -23,9 +24,9 @@ class UserProfileAdmin(ModelAdmin):
     list_filter = ('grade',)
 
 class VerificationCodeAdmin(ModelAdmin):
-    list_display = ('email', 'code', 'created_at', 'expires_at', 'is_used', 'is_expired')
-    list_filter = ('is_used', 'created_at')
-    search_fields = ('email', 'code')
+    list_display = ('email', 'phone_number', 'type', 'created_at', 'expires_at', 'is_used', 'is_expired')
+    list_filter = ('type', 'is_used', 'created_at')
+    search_fields = ('email', 'phone_number')
     readonly_fields = ('created_at',)
 
     def is_expired(self, obj):
@@ -34,10 +35,17 @@ class VerificationCodeAdmin(ModelAdmin):
     is_expired.short_description = 'Expired'
 
 class AIAccessAdmin(ModelAdmin):
-    list_display = ('user', 'questions_limit', 'access_duration', 'model', 'is_active', 'get_remaining_questions')
+    list_display = ('user', 'questions_limit', 'questions_used', 'window_started_at', 'access_duration', 'model', 'is_active', 'get_remaining_questions')
     search_fields = ('user__username', 'user__email')
     list_filter = ('model', 'access_duration')
-    readonly_fields = ('created_at', 'updated_at')
+    # The counter only changes through atomic updates (AIAccess.consume_question / the reset action)
+    readonly_fields = ('questions_used', 'window_started_at', 'created_at', 'updated_at')
+    actions = ['reset_usage']
+    
+    def reset_usage(self, request, queryset):
+        updated = queryset.update(questions_used=0, window_started_at=timezone.now())
+        self.message_user(request, f'سهمیه {updated} کاربر از نو شروع شد.')
+    reset_usage.short_description = 'شروع دوباره سهمیه کاربران انتخاب‌شده'
     
     def is_active(self, obj):
         return obj.is_active
@@ -0,0 +1,24 @@
+"""
+AI quota backfill.
+
+AIAccess.questions_used is the per-user usage counter behind the AI quota.
+`backfill_questions_used` recomputes it from the stored conversations: the
+user's own questions (AIMessage role 'user') that were not answered from
+the answer cache, since the start of the current window when
+AI_QUOTA_WINDOW_DAYS is set. It is one UPDATE, and takes the model classes so
+the migration that adds the counter can run it with historical models.
+"""
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_questions_used(access_model, message_model, windowed, queryset=None, using=None):
+    """Set questions_used on every AIAccess (or `queryset`) from its messages. Returns the rows updated."""
+    questions = message_model.objects.using(using).filter(
+        conversation__user=OuterRef('user'), role='user', cache_hit=False,
+    )
+    if windowed:
+        questions = questions.filter(created_at__gte=OuterRef('window_started_at'))
+    used = questions.order_by().values('conversation__user').annotate(n=Count('id')).values('n')
+    queryset = access_model.objects.using(using) if queryset is None else queryset
+    return queryset.update(questions_used=Coalesce(Subquery(used), 0))
@@ -0,0 +1,57 @@
+"""
+Short-lived cache of authenticated users.
+
+Every API request (api.auth.CookieJWTAuthentication) and websocket connect
+(chat.middleware.JWTAuthMiddleware) resolves the token's user id to a User.
+`get_cached_user` serves the User, with its profile already joined, from the
+cache for AUTH_USER_CACHE_TIMEOUT seconds.
+
+The cached User is loaded with the password hash deferred, so the hash never
+reaches the shared cache; code that needs it (check_password) loads it from
+the database on access.
+
+Entries are keyed by user id and a per-user version. Saving the user (which
+includes password changes and last_login updates) or their profile bumps the
+version, so the next request reloads from the database; see the receivers
+in accounts/models.py. Queryset updates (`User.objects.filter(...).update()`)
+send no signals: call `invalidate_cached_user` after them, or a deactivated
+user stays authenticated for up to AUTH_USER_CACHE_TIMEOUT seconds.
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+User = get_user_model()
+
+
+def _version_key(user_id):
+    return f'auth:user:{user_id}:version'
+
+
+def _user_key(user_id, version):
+    return f'auth:user:{user_id}:v{version}'
+
+
+def get_cached_user(user_id):
+    """Return the User (with profile) for `user_id`, or None if it does not exist."""
+    timeout = getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+    version = cache.get(_version_key(user_id), 0)
+    key = _user_key(user_id, version)
+    user = cache.get(key)
+    if user is None:
+        user = User.objects.select_related('profile').defer('password').filter(pk=user_id).first()
+        if user is None:
+            return None
+        cache.set(key, user, timeout)
+    return user
+
+
+def invalidate_cached_user(user_id):
+    """Drop the cached user; later lookups go to the database."""
+    key = _version_key(user_id)
+    # add() keeps the version counter alive past the user entries' TTL
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
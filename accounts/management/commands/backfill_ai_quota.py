@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.ai_quota import backfill_questions_used
+from accounts.models import AIAccess, ai_quota_window
+from tickets.models import AIMessage
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute AIAccess.questions_used from the users' stored questions (cache hits excluded), "
+        "since the current window's start when AI_QUOTA_WINDOW_DAYS is set"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='users', metavar='USERNAME',
+                            help='Only this user (repeatable)')
+        parser.add_argument('--reset', action='store_true',
+                            help='Start a new window with no questions used instead of recounting')
+
+    def handle(self, *args, **options):
+        queryset = AIAccess.objects.all()
+        if options['users']:
+            queryset = queryset.filter(user__username__in=options['users'])
+
+        if options['reset']:
+            updated = queryset.update(questions_used=0, window_started_at=timezone.now())
+            self.stdout.write(self.style.SUCCESS(f'Reset the AI quota of {updated} user(s).'))
+            return
+
+        updated = backfill_questions_used(AIAccess, AIMessage, ai_quota_window() is not None, queryset=queryset)
+        self.stdout.write(self.style.SUCCESS(f'Recounted the AI quota of {updated} user(s).'))
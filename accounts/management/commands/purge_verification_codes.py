@@ -0,0 +1,26 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.models import VerificationCode
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete VerificationCode rows that expired more than OTP_AUDIT_RETENTION_DAYS days ago "
+        "(codes themselves live in the cache, the rows are only an audit trail)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Keep rows that expired in the last DAYS days (default OTP_AUDIT_RETENTION_DAYS)')
+
+    def handle(self, *args, **options):
+        days = options['days']
+        if days is None:
+            days = getattr(settings, 'OTP_AUDIT_RETENTION_DAYS', 30)
+        cutoff = timezone.now() - timedelta(days=days)
+        deleted, _ = VerificationCode.objects.filter(expires_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} verification code(s).'))
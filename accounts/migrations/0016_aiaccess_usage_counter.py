@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-19 11:51
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+from accounts.ai_quota import backfill_questions_used
+
+
+def backfill(apps, schema_editor):
+    backfill_questions_used(
+        apps.get_model('accounts', 'AIAccess'), apps.get_model('tickets', 'AIMessage'),
+        windowed=bool(getattr(settings, 'AI_QUOTA_WINDOW_DAYS', 0)), using=schema_editor.connection.alias,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_alter_aiaccess_access_duration'),
+        ('tickets', '0003_ai_answer_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiaccess',
+            name='questions_used',
+            field=models.PositiveIntegerField(default=0, verbose_name='سوالات استفاده\u200cشده'),
+        ),
+        migrations.AddField(
+            model_name='aiaccess',
+            name='window_started_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='شروع دوره سهمیه'),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.db import models
+from django.db.models import F
 from django.contrib.auth.models import AbstractUser
 from django.contrib.auth.models import BaseUserManager
 from django.core.validators import RegexValidator
@@ -7,6 +9,8 @@ import random
 import string
 from datetime import timedelta
 from django.utils import timezone
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
 
 class UserManager(BaseUserManager):
@@ -204,12 +208,20 @@ class UserAddress(models.Model):
 def default_ai_access_duration():
     return timezone.now() + timedelta(days=365)
 
+def ai_quota_window():
+    """طول هر دوره سهمیه (AI_QUOTA_WINDOW_DAYS)؛ None یعنی سهمیه برای کل مدت دسترسی است"""
+    days = getattr(settings, 'AI_QUOTA_WINDOW_DAYS', 0)
+    return timedelta(days=days) if days else None
+
 class AIAccess(models.Model):
     """مدل دسترسی به هوش مصنوعی برای هر کاربر"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='ai_access', verbose_name='کاربر')
     questions_limit = models.PositiveIntegerField(default=50, verbose_name='محدودیت تعداد سوالات')
     access_duration = models.DateTimeField(default=default_ai_access_duration, verbose_name='مدت زمان دسترسی')
     model = models.CharField(max_length=50, default='gemini', verbose_name='مدل زبانی')
+    # Questions asked in the current window, changed only with atomic F() updates
+    questions_used = models.PositiveIntegerField(default=0, verbose_name='سوالات استفاده‌شده')
+    window_started_at = models.DateTimeField(default=timezone.now, verbose_name='شروع دوره سهمیه')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
 
     updated_at = models.DateTimeField(auto_now=True, verbose_name='تاریخ بروزرسانی')
@@ -226,13 +238,53 @@ class AIAccess(models.Model):
         """چک کردن فعال بودن دسترسی"""
         return timezone.now() <= self.access_duration
     
+    def window_ended(self, now=None):
+        window = ai_quota_window()
+        return window is not None and (now or timezone.now()) >= self.window_started_at + window
+
     def get_remaining_questions(self):
-        """محاسبه تعداد سوالات باقی مانده"""
-        from tickets.models import AIMessage
-        used_questions = AIMessage.objects.filter(conversation__user=self.user).count()
-        return max(0, self.questions_limit - used_questions)
-    
+        """محاسبه تعداد سوالات باقی مانده (بدون کوئری)"""
+        if self.window_ended():
+            return self.questions_limit
+        return max(0, self.questions_limit - self.questions_used)
+
+    def consume_question(self):
+        """
+        کم کردن یک سوال از سهمیه به صورت اتمیک؛ اگر سهمیه تمام شده یا دسترسی منقضی شده باشد False
+        """
+        now = timezone.now()
+        if self.window_ended(now):
+            # Only one concurrent request starts the new window
+            AIAccess.objects.filter(
+                pk=self.pk, window_started_at=self.window_started_at
+            ).update(questions_used=0, window_started_at=now)
+        consumed = AIAccess.objects.filter(
+            pk=self.pk, access_duration__gte=now, questions_used__lt=F('questions_limit')
+        ).update(questions_used=F('questions_used') + 1)
+        self.refresh_from_db(fields=['questions_used', 'window_started_at'])
+        return bool(consumed)
+
+    def refund_question(self):
+        """برگرداندن سوالی که پاسخ آن دریافت نشد (در همان دوره)"""
+        AIAccess.objects.filter(
+            pk=self.pk, window_started_at=self.window_started_at, questions_used__gt=0
+        ).update(questions_used=F('questions_used') - 1)
+        self.refresh_from_db(fields=['questions_used', 'window_started_at'])
+
+    def reset_usage(self):
+        AIAccess.objects.filter(pk=self.pk).update(questions_used=0, window_started_at=timezone.now())
+        self.refresh_from_db(fields=['questions_used', 'window_started_at'])
 
 
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user_on_user_change(sender, instance, **kwargs):
+    from .auth_cache import invalidate_cached_user
+    invalidate_cached_user(instance.pk)
 
 
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_cached_user_on_profile_change(sender, instance, **kwargs):
+    from .auth_cache import invalidate_cached_user
+    invalidate_cached_user(instance.user_id)
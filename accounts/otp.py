@@ -0,0 +1,202 @@
+"""
+One-time codes for phone/email verification and password reset.
+
+Codes live in the shared cache (api/cache.py), not in VerificationCode rows:
+`issue()` stores a salted HMAC of the code under the purpose and target
+(phone number or email) for OTP_TTL seconds, and `verify()` checks it,
+counting attempts so a code is dropped after OTP_MAX_ATTEMPTS wrong guesses.
+A verified code leaves a marker for OTP_VERIFIED_TTL seconds, which the next
+step (CompleteRegistrationView, ResetPasswordView) checks with
+`is_verified()` and removes with `clear_verified()`.
+
+`issue()` raises RateLimited when the target already got a code in the last
+OTP_RESEND_INTERVAL seconds, or when the target or the client IP asked for
+more than OTP_TARGET_LIMIT / OTP_IP_LIMIT codes in a sliding window of
+OTP_TARGET_WINDOW / OTP_IP_WINDOW seconds. Windows are two fixed buckets
+counted with cache incr, the previous one weighted by how much of it still
+overlaps the window. If the code cannot be delivered, `release()` drops it
+and the resend interval, but not the window counts: a failed send may still
+have reached the phone, so every attempt counts against the limits.
+
+The limits are only race-free and shared by all workers with the `sqlite`
+(default) or `redis` CACHE_BACKEND, whose add/incr are atomic across
+processes. FileBasedCache (`file`) increments with a separate get and set,
+and LocMemCache (`locmem`) is per process, so under either each worker
+enforces its own, approximate limits.
+
+With OTP_AUDIT_DB, every issued code is also recorded as a VerificationCode
+row (without the code) and marked used when verified; expired rows are
+removed by `manage.py purge_verification_codes`.
+"""
+import math
+import secrets
+import string
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+from rest_framework.throttling import BaseThrottle
+
+from .models import VerificationCode
+
+REGISTER = 'register'
+RESET_PASSWORD = 'reset'
+EMAIL = 'email'
+
+VERIFIED = 'verified'
+EXPIRED = 'expired'
+INVALID = 'invalid'
+LOCKED = 'locked'
+
+ERRORS = {
+    EXPIRED: 'کد تایید منقضی شده است',
+    INVALID: 'کد تایید نامعتبر است',
+    LOCKED: 'تعداد تلاش‌های نادرست بیش از حد مجاز است. لطفاً کد جدید درخواست کنید',
+}
+RATE_LIMITED_ERROR = 'تعداد درخواست‌های کد تایید بیش از حد مجاز است. لطفاً کمی بعد دوباره تلاش کنید'
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f'Retry after {retry_after} seconds')
+        self.retry_after = retry_after
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _key(kind, purpose, target):
+    return f'otp:{kind}:{purpose}:{target}'
+
+
+def _hash(purpose, target, code):
+    return salted_hmac('accounts.otp', f'{purpose}:{target}:{code}').hexdigest()
+
+
+def client_ip(request):
+    """The client address the DRF throttles use (honours NUM_PROXIES)."""
+    return BaseThrottle().get_ident(request)
+
+
+def _hit(key, limit, window):
+    """
+    Count one request against `limit` per sliding `window` seconds. Returns
+    the counted bucket key, or raises RateLimited (without counting it).
+    """
+    bucket, offset = divmod(time.time(), window)
+    current_key, previous_key = f'{key}:{int(bucket)}', f'{key}:{int(bucket) - 1}'
+    cache.add(current_key, 0, window * 2)
+    current = cache.incr(current_key)
+    previous = cache.get(previous_key, 0)
+    if current + previous * (1 - offset / window) <= limit:
+        return current_key
+
+    cache.decr(current_key)
+    earlier = current - 1
+    if earlier < limit and previous:
+        # Wait until enough of the previous bucket slides out of the window
+        wait = window * (1 - (limit - 1 - earlier) / previous) - offset
+    else:
+        wait = window - offset
+    raise RateLimited(max(1, math.ceil(wait)))
+
+
+def _check_limits(purpose, target, ip):
+    limits = [(f'otp:limit:target:{target}', _setting('OTP_TARGET_LIMIT', 5), _setting('OTP_TARGET_WINDOW', 3600))]
+    if ip:
+        limits.append((f'otp:limit:ip:{ip}', _setting('OTP_IP_LIMIT', 20), _setting('OTP_IP_WINDOW', 3600)))
+
+    counted = []
+    try:
+        for key, limit, window in limits:
+            if limit:
+                counted.append(_hit(key, limit, window))
+        interval = _setting('OTP_RESEND_INTERVAL', 60)
+        if interval and not cache.add(_key('sent', purpose, target), 1, interval):
+            raise RateLimited(interval)
+    except RateLimited:
+        _uncount(counted)
+        raise
+
+
+def _uncount(keys):
+    for key in keys:
+        try:
+            cache.decr(key)
+        except ValueError:
+            # The bucket already expired
+            pass
+
+
+def issue(purpose, target, ip=None):
+    """Store a new code for `target` (replacing any previous one) and return it for sending."""
+    _check_limits(purpose, target, ip)
+
+    ttl = _setting('OTP_TTL', 600)
+    code = ''.join(secrets.choice(string.digits) for _ in range(6))
+    audit_id = None
+    if _setting('OTP_AUDIT_DB', False):
+        target_field = 'email' if purpose == EMAIL else 'phone_number'
+        audit_id = VerificationCode.objects.create(
+            **{target_field: target},
+            code='',
+            type=VerificationCode.EMAIL if purpose == EMAIL else VerificationCode.PHONE,
+            expires_at=timezone.now() + timedelta(seconds=ttl),
+        ).pk
+
+    entry = {'hash': _hash(purpose, target, code), 'audit_id': audit_id}
+    cache.set(_key('code', purpose, target), entry, ttl)
+    cache.set(_key('attempts', purpose, target), 0, ttl)
+    return code
+
+
+def release(purpose, target):
+    """
+    Withdraw the code just issued for `target` because it could not be sent,
+    and lift the resend interval so the user can retry right away. The window
+    slots stay used, so retries are still bounded by OTP_TARGET_LIMIT and
+    OTP_IP_LIMIT.
+    """
+    cache.delete_many([_key(kind, purpose, target) for kind in ('code', 'attempts', 'sent')])
+
+
+def verify(purpose, target, code):
+    """Check `code` for `target`: VERIFIED, EXPIRED (no live code), INVALID or LOCKED (too many attempts)."""
+    code_key, attempts_key = _key('code', purpose, target), _key('attempts', purpose, target)
+    entry = cache.get(code_key)
+    if entry is None:
+        return EXPIRED
+
+    cache.add(attempts_key, 0, _setting('OTP_TTL', 600))
+    attempts = cache.incr(attempts_key)
+    max_attempts = _setting('OTP_MAX_ATTEMPTS', 5)
+    if attempts > max_attempts:
+        cache.delete(code_key)
+        return LOCKED
+    if not constant_time_compare(entry['hash'], _hash(purpose, target, code)):
+        if attempts == max_attempts:
+            cache.delete(code_key)
+            return LOCKED
+        return INVALID
+
+    cache.delete_many([code_key, attempts_key])
+    cache.set(_key('verified', purpose, target), entry['hash'], _setting('OTP_VERIFIED_TTL', 600))
+    if entry['audit_id']:
+        VerificationCode.objects.filter(pk=entry['audit_id']).update(is_used=True)
+    return VERIFIED
+
+
+def is_verified(purpose, target, code=None):
+    """Whether `target` verified a code for `purpose` recently (that code, if given)."""
+    verified = cache.get(_key('verified', purpose, target))
+    if verified is None:
+        return False
+    return code is None or constant_time_compare(verified, _hash(purpose, target, code))
+
+
+def clear_verified(purpose, target):
+    cache.delete(_key('verified', purpose, target))
@@ -1,3 +1,256 @@
-from django.test import TestCase
+import io
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from tickets.models import AIConversation, AIMessage
+from . import otp
+from .models import AIAccess, User, UserProfile, VerificationCode
+
+
+class AuthenticatedUserCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='alice', password='x')
+        UserProfile.objects.create(user=self.user, phone_number='09120000000', national_id='0012345678')
+        self.client = APIClient()
+        self.client.cookies['access'] = str(AccessToken.for_user(self.user))
+
+    def test_repeat_requests_skip_user_lookup(self):
+        response = self.client.get('/api/profile/complete/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['profile_completed'])
+
+        # Token decoded once, user and profile served from the cache
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/profile/complete/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_password_hash_is_not_cached(self):
+        self.client.get('/api/profile/complete/')
+
+        version = cache.get(f'auth:user:{self.user.pk}:version', 0)
+        cached = cache.get(f'auth:user:{self.user.pk}:v{version}')
+        self.assertEqual(cached.pk, self.user.pk)
+        self.assertNotIn('password', cached.__dict__)
+
+        response = self.client.post('/api/change-password/', {
+            'old_password': 'x', 'new_password': 'new-secret', 'new_password_confirm': 'new-secret',
+        })
+        self.assertEqual(response.status_code, 200)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('new-secret'))
+
+    def test_profile_save_invalidates_cached_user(self):
+        self.client.get('/api/profile/complete/')
+
+        self.user.profile.national_id = None
+        self.user.profile.save()
+
+        response = self.client.get('/api/profile/complete/')
+        self.assertFalse(response.data['profile_completed'])
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get('/api/profile/complete/')
+
+        self.user.is_active = False
+        self.user.save()
+
+        response = self.client.get('/api/profile/complete/')
+        self.assertEqual(response.status_code, 401)
+
+
+class AIQuotaTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='student', password='x', role='student')
+        self.access = AIAccess.objects.get(user=self.user)
+        AIAccess.objects.filter(pk=self.access.pk).update(questions_limit=2)
+        self.access.refresh_from_db()
+
+    def test_remaining_questions_need_no_query(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.access.get_remaining_questions(), 2)
+
+    def test_consume_stops_at_the_limit_across_stale_copies(self):
+        other = AIAccess.objects.get(pk=self.access.pk)
+        self.assertTrue(self.access.consume_question())
+        # `other` still thinks nothing was used; the conditional UPDATE does not
+        self.assertTrue(other.consume_question())
+        self.assertFalse(self.access.consume_question())
+        self.assertEqual(AIAccess.objects.get(pk=self.access.pk).questions_used, 2)
+
+        self.access.refund_question()
+        self.assertEqual(self.access.get_remaining_questions(), 1)
+
+    def test_expired_access_consumes_nothing(self):
+        AIAccess.objects.filter(pk=self.access.pk).update(access_duration=timezone.now() - timedelta(days=1))
+        self.assertFalse(self.access.consume_question())
+
+    @override_settings(AI_QUOTA_WINDOW_DAYS=7)
+    def test_window_resets_usage(self):
+        AIAccess.objects.filter(pk=self.access.pk).update(
+            questions_used=2, window_started_at=timezone.now() - timedelta(days=8),
+        )
+        self.access.refresh_from_db()
+        self.assertEqual(self.access.get_remaining_questions(), 2)
+        self.assertTrue(self.access.consume_question())
+        self.assertEqual(self.access.questions_used, 1)
+        self.assertGreater(self.access.window_started_at, timezone.now() - timedelta(minutes=1))
+
+    def test_backfill_counts_uncached_questions(self):
+        conversation = AIConversation.objects.create(user=self.user, title='t')
+        AIMessage.objects.bulk_create([
+            AIMessage(conversation=conversation, role='user', content='q1'),
+            AIMessage(conversation=conversation, role='ai', content='a1'),
+            AIMessage(conversation=conversation, role='user', content='q2', cache_hit=True),
+            AIMessage(conversation=conversation, role='ai', content='a2', cache_hit=True),
+            AIMessage(conversation=conversation, role='user', content='q3'),
+        ])
+        call_command('backfill_ai_quota', stdout=io.StringIO())
+        self.access.refresh_from_db()
+        self.assertEqual(self.access.questions_used, 2)
+
+        call_command('backfill_ai_quota', reset=True, users=['student'], stdout=io.StringIO())
+        self.access.refresh_from_db()
+        self.assertEqual(self.access.questions_used, 0)
+
+
+@mock.patch('accounts.views.send_reset_password_sms', return_value=True)
+@mock.patch('accounts.views.send_verification_sms', return_value=True)
+class OTPTestCase(TestCase):
+    phone = '09121112233'
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def send(self, phone=None, ip='10.0.0.1'):
+        return self.client.post('/api/send-phone-verification/', {'phone_number': phone or self.phone}, REMOTE_ADDR=ip)
+
+    def verify(self, code):
+        return self.client.post('/api/verify-phone/', {'phone_number': self.phone, 'code': code})
+
+    def test_registration_uses_no_verification_rows(self, send_sms, send_reset_sms):
+        self.assertEqual(self.send().status_code, 200)
+        code = send_sms.call_args.args[1]
+        self.assertNotIn(code, str(cache.get(f'otp:code:register:{self.phone}')))
+
+        self.assertEqual(self.verify(code).status_code, 200)
+        # The code is single use
+        self.assertEqual(self.verify(code).status_code, 400)
+
+        response = self.client.post('/api/complete-registration/', {
+            'phone_number': self.phone, 'username': 'newbie', 'password': 'secret1', 'password_confirm': 'secret1',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(UserProfile.objects.filter(phone_number=self.phone).exists())
+        self.assertFalse(otp.is_verified(otp.REGISTER, self.phone))
+        self.assertFalse(VerificationCode.objects.exists())
+
+    def test_registration_requires_verified_phone(self, send_sms, send_reset_sms):
+        self.send()
+        response = self.client.post('/api/complete-registration/', {
+            'phone_number': self.phone, 'username': 'newbie', 'password': 'secret1', 'password_confirm': 'secret1',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.filter(username='newbie').exists())
+
+    @override_settings(OTP_MAX_ATTEMPTS=3)
+    def test_wrong_guesses_drop_the_code(self, send_sms, send_reset_sms):
+        self.send()
+        code = send_sms.call_args.args[1]
+        wrong = '000000' if code != '000000' else '111111'
+
+        self.assertEqual(self.verify(wrong).data['error'], otp.ERRORS[otp.INVALID])
+        self.assertEqual(self.verify(wrong).data['error'], otp.ERRORS[otp.INVALID])
+        self.assertEqual(self.verify(wrong).data['error'], otp.ERRORS[otp.LOCKED])
+        self.assertEqual(self.verify(code).data['error'], otp.ERRORS[otp.EXPIRED])
+
+    @override_settings(OTP_RESEND_INTERVAL=60, OTP_TARGET_LIMIT=2)
+    def test_resend_interval_and_phone_limit(self, send_sms, send_reset_sms):
+        self.assertEqual(self.send().status_code, 200)
+        response = self.send()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+        self.assertEqual(send_sms.call_count, 1)
+
+        cache.delete(f'otp:sent:register:{self.phone}')
+        self.assertEqual(self.send().status_code, 200)
+        cache.delete(f'otp:sent:register:{self.phone}')
+        response = self.send(ip='10.0.0.2')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        self.assertEqual(send_sms.call_count, 2)
+
+    @override_settings(OTP_TARGET_LIMIT=2, OTP_IP_LIMIT=2)
+    def test_undelivered_codes_skip_the_resend_wait_but_count(self, send_sms, send_reset_sms):
+        send_sms.return_value = False
+        self.assertEqual(self.send().status_code, 500)
+        self.assertEqual(self.verify(send_sms.call_args.args[1]).data['error'], otp.ERRORS[otp.EXPIRED])
+
+        # No resend interval after a failed send, but the window slot stays used
+        send_sms.return_value = True
+        self.assertEqual(self.send().status_code, 200)
+        cache.delete(f'otp:sent:register:{self.phone}')
+        self.assertEqual(self.send().status_code, 429)
+        self.assertEqual(send_sms.call_count, 2)
+
+    @override_settings(OTP_IP_LIMIT=2)
+    def test_ip_limit_spans_phones(self, send_sms, send_reset_sms):
+        self.assertEqual(self.send('09120000001').status_code, 200)
+        self.assertEqual(self.send('09120000002').status_code, 200)
+        self.assertEqual(self.send('09120000003').status_code, 429)
+        self.assertEqual(self.send('09120000003', ip='10.0.0.9').status_code, 200)
+
+    def test_sliding_window_weights_previous_bucket(self, send_sms, send_reset_sms):
+        with mock.patch('accounts.otp.time.time', return_value=1000 * 60 + 59):
+            for _ in range(4):
+                otp._hit('otp:limit:test', 4, 60)
+        # Just after the bucket boundary almost all of the previous bucket still counts
+        with mock.patch('accounts.otp.time.time', return_value=1001 * 60 + 1):
+            with self.assertRaises(otp.RateLimited):
+                otp._hit('otp:limit:test', 4, 60)
+        # Three quarters into the next bucket only a quarter of it does
+        with mock.patch('accounts.otp.time.time', return_value=1001 * 60 + 45):
+            for _ in range(3):
+                otp._hit('otp:limit:test', 4, 60)
+
+    def test_reset_password_needs_the_verified_code(self, send_sms, send_reset_sms):
+        user = User.objects.create_user(username='forgetful', password='old-password')
+        UserProfile.objects.create(user=user, phone_number=self.phone)
+        self.assertEqual(self.client.post('/api/send-reset-password/', {'phone_number': self.phone}).status_code, 200)
+        code = send_reset_sms.call_args.args[1]
+        # A registration code is not a reset code
+        self.assertEqual(self.verify(code).status_code, 400)
+
+        reset = {'phone_number': self.phone, 'new_password': 'new-password', 'new_password_confirm': 'new-password'}
+        self.assertEqual(self.client.post('/api/reset-password/', {**reset, 'code': code}).status_code, 400)
+        response = self.client.post('/api/verify-reset-password/', {'phone_number': self.phone, 'code': code})
+        self.assertEqual(response.status_code, 200)
+        other = '000000' if code != '000000' else '111111'
+        self.assertEqual(self.client.post('/api/reset-password/', {**reset, 'code': other}).status_code, 400)
+
+        self.assertEqual(self.client.post('/api/reset-password/', {**reset, 'code': code}).status_code, 200)
+        user.refresh_from_db()
+        self.assertTrue(user.check_password('new-password'))
+        self.assertEqual(self.client.post('/api/reset-password/', {**reset, 'code': code}).status_code, 400)
+
+    @override_settings(OTP_AUDIT_DB=True)
+    def test_audit_rows_and_purge(self, send_sms, send_reset_sms):
+        self.send()
+        audit = VerificationCode.objects.get()
+        self.assertEqual((audit.phone_number, audit.type, audit.code, audit.is_used), (self.phone, 'phone', '', False))
+
+        self.verify(send_sms.call_args.args[1])
+        audit.refresh_from_db()
+        self.assertTrue(audit.is_used)
+
+        VerificationCode.objects.create(email='old@example.com', code='', expires_at=timezone.now() - timedelta(days=40))
+        call_command('purge_verification_codes', stdout=io.StringIO())
+        self.assertEqual(list(VerificationCode.objects.all()), [audit])
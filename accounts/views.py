@@ -7,7 +7,8 @@ from rest_framework.exceptions import AuthenticationFailed
 from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
 from rest_framework import viewsets, permissions
 from rest_framework.decorators import action
-from .models import UserProfile, User, VerificationCode, UserAddress
+from . import otp
+from .models import UserProfile, User, UserAddress
 from .serializers import (
     UserProfileSerializer, 
     UserSerializer, 
@@ -27,6 +28,14 @@ from .utils import send_verification_email, send_verification_sms, send_reset_pa
 from django.core.cache import cache
 
 
+def otp_rate_limited_response(error):
+    return Response(
+        {"error": otp.RATE_LIMITED_ERROR, "retry_after": error.retry_after},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
 class SendVerificationCodeView(APIView):
     permission_classes = [permissions.AllowAny]
     
@@ -54,13 +63,15 @@ class SendVerificationCodeView(APIView):
             #         status=status.HTTP_400_BAD_REQUEST
             #     )
             
-            VerificationCode.objects.filter(email=email).delete()
             # Create verification code
-            verification_code = VerificationCode.create_for_email(email)
+            try:
+                code = otp.issue(otp.EMAIL, email, otp.client_ip(request))
+            except otp.RateLimited as error:
+                return otp_rate_limited_response(error)
             
             # Send email
             # user_name = f"{first_name} {last_name}".strip() if first_name or last_name else username
-            # email_sent = send_verification_email(email, verification_code.code, user_name)
+            # email_sent = send_verification_email(email, code, user_name)
             email_sent = True
 
             if email_sent:
@@ -73,6 +84,7 @@ class SendVerificationCodeView(APIView):
                     "email": email
                 }, status=status.HTTP_200_OK)
             else:
+                otp.release(otp.EMAIL, email)
                 return Response(
                     {"error": "خطا در ارسال ایمیل. لطفاً دوباره تلاش کنید"}, 
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -99,12 +111,14 @@ class SendPhoneVerificationCodeView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            VerificationCode.objects.filter(phone_number=phone_number).delete()
             # Create verification code
-            verification_code = VerificationCode.create_for_phone(phone_number)
+            try:
+                code = otp.issue(otp.REGISTER, phone_number, otp.client_ip(request))
+            except otp.RateLimited as error:
+                return otp_rate_limited_response(error)
             
             # Send SMS
-            sms_sent = send_verification_sms(phone_number, verification_code.code)
+            sms_sent = send_verification_sms(phone_number, code)
             print("\n\n",20*"-", "sms_sent:", sms_sent)
 
             if sms_sent:
@@ -113,6 +127,8 @@ class SendPhoneVerificationCodeView(APIView):
                     "phone_number": phone_number
                 }, status=status.HTTP_200_OK)
             else:
+                # Not delivered: no resend wait, but the attempt still counts against the limits
+                otp.release(otp.REGISTER, phone_number)
                 return Response(
                     {"error": "خطا در ارسال پیامک. لطفاً دوباره تلاش کنید"}, 
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -133,46 +149,28 @@ class VerifyEmailView(APIView):
             email = serializer.validated_data['email']
             code = serializer.validated_data['code']
             
-            try:
-                verification_code = VerificationCode.objects.get(email=email, code=code)
-                
-                if not verification_code.is_valid():
-                    if verification_code.is_expired():
-                        return Response(
-                            {"error": "کد تایید منقضی شده است"}, 
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-                    else:
-                        return Response(
-                            {"error": "کد تایید نامعتبر است"}, 
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-                
-                # Mark code as used
-                verification_code.is_used = True
-                verification_code.save()
-                
-                # Get registration data from cache
-                # cache_key = f"registration_data_{email}"
-                # registration_data = cache.get(cache_key)
-                
-                # if not registration_data:
-                #     return Response(
-                #         {"error": "داده‌های ثبت‌نام یافت نشد. لطفاً دوباره تلاش کنید"}, 
-                #         status=status.HTTP_400_BAD_REQUEST
-                #     )
-                
-                return Response({
-                    "message": "ایمیل با موفقیت تایید شد",
-                    "email": email,
-                    # "registration_data": registration_data
-                }, status=status.HTTP_200_OK)
-                
-            except VerificationCode.DoesNotExist:
+            result = otp.verify(otp.EMAIL, email, code)
+            if result != otp.VERIFIED:
                 return Response(
-                    {"error": "کد تایید نامعتبر است"}, 
+                    {"error": otp.ERRORS[result]}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            
+            # Get registration data from cache
+            # cache_key = f"registration_data_{email}"
+            # registration_data = cache.get(cache_key)
+            
+            # if not registration_data:
+            #     return Response(
+            #         {"error": "داده‌های ثبت‌نام یافت نشد. لطفاً دوباره تلاش کنید"}, 
+            #         status=status.HTTP_400_BAD_REQUEST
+            #     )
+            
+            return Response({
+                "message": "ایمیل با موفقیت تایید شد",
+                "email": email,
+                # "registration_data": registration_data
+            }, status=status.HTTP_200_OK)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -189,35 +187,17 @@ class VerifyPhoneView(APIView):
             phone_number = serializer.validated_data['phone_number']
             code = serializer.validated_data['code']
             
-            try:
-                verification_code = VerificationCode.objects.get(phone_number=phone_number, code=code)
-                
-                if not verification_code.is_valid():
-                    if verification_code.is_expired():
-                        return Response(
-                            {"error": "کد تایید منقضی شده است"}, 
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-                    else:
-                        return Response(
-                            {"error": "کد تایید نامعتبر است"}, 
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-                
-                # Mark code as used
-                verification_code.is_used = True
-                verification_code.save()
-                
-                return Response({
-                    "message": "شماره موبایل با موفقیت تایید شد",
-                    "phone_number": phone_number
-                }, status=status.HTTP_200_OK)
-                
-            except VerificationCode.DoesNotExist:
+            result = otp.verify(otp.REGISTER, phone_number, code)
+            if result != otp.VERIFIED:
                 return Response(
-                    {"error": "کد تایید نامعتبر است"}, 
+                    {"error": otp.ERRORS[result]}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            
+            return Response({
+                "message": "شماره موبایل با موفقیت تایید شد",
+                "phone_number": phone_number
+            }, status=status.HTTP_200_OK)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -234,14 +214,7 @@ class CompleteRegistrationView(APIView):
             phone_number = serializer.validated_data['phone_number']
             
             # Check if phone was verified
-            verification_code = (
-                VerificationCode.objects
-                .filter(phone_number=phone_number, is_used=True)
-                .order_by('-created_at')
-                .first()
-            )
-
-            if not verification_code:
+            if not otp.is_verified(otp.REGISTER, phone_number):
                 return Response(
                     {"error": "لطفاً ابتدا شماره موبایل خود را تایید کنید"}, 
                     status=status.HTTP_400_BAD_REQUEST
@@ -285,8 +258,8 @@ class CompleteRegistrationView(APIView):
                 request.session.modified = True
                 cart_message = f" محصولات انتخابی شما ({len(pending_cart)} محصول) در سبد خرید شما قرار گرفت."
             
-            # Clear verification codes
-            VerificationCode.objects.filter(phone_number=phone_number).delete()
+            # Clear the verification
+            otp.clear_verified(otp.REGISTER, phone_number)
             
             response = Response({
                 "message": f"ثبت‌نام با موفقیت انجام شد.{cart_message}",
@@ -701,14 +674,14 @@ class SendResetPasswordCodeView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             
-            # Delete any existing unused reset codes for this phone
-            VerificationCode.objects.filter(phone_number=phone_number, type=VerificationCode.PHONE).delete()
-            
             # Create verification code
-            verification_code = VerificationCode.create_for_phone(phone_number)
+            try:
+                code = otp.issue(otp.RESET_PASSWORD, phone_number, otp.client_ip(request))
+            except otp.RateLimited as error:
+                return otp_rate_limited_response(error)
             
             # Send SMS with reset password template
-            sms_sent = send_reset_password_sms(phone_number, verification_code.code)
+            sms_sent = send_reset_password_sms(phone_number, code)
             print("\n\n",20*"-", "reset password sms_sent:", sms_sent)
 
             if sms_sent:
@@ -717,6 +690,8 @@ class SendResetPasswordCodeView(APIView):
                     "phone_number": phone_number
                 }, status=status.HTTP_200_OK)
             else:
+                # Not delivered: no resend wait, but the attempt still counts against the limits
+                otp.release(otp.RESET_PASSWORD, phone_number)
                 return Response(
                     {"error": "خطا در ارسال پیامک. لطفاً دوباره تلاش کنید"}, 
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
@@ -737,34 +712,17 @@ class VerifyResetPasswordCodeView(APIView):
             phone_number = serializer.validated_data['phone_number']
             code = serializer.validated_data['code']
             
-            # Find the verification code
-            try:
-                verification_code = VerificationCode.objects.get(
-                    phone_number=phone_number,
-                    code=code,
-                    type=VerificationCode.PHONE,
-                    is_used=False
-                )
-                
-                if verification_code.is_valid():
-                    verification_code.is_used = True
-                    verification_code.save()
-                    
-                    return Response({
-                        "message": "کد تایید صحیح است. اکنون می‌توانید رمز عبور جدید خود را تنظیم کنید.",
-                        "phone_number": phone_number
-                    }, status=status.HTTP_200_OK)
-                else:
-                    return Response(
-                        {"error": "کد تایید منقضی شده است"}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                    
-            except VerificationCode.DoesNotExist:
+            result = otp.verify(otp.RESET_PASSWORD, phone_number, code)
+            if result != otp.VERIFIED:
                 return Response(
-                    {"error": "کد تایید نامعتبر است"}, 
+                    {"error": otp.ERRORS[result]}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
+            
+            return Response({
+                "message": "کد تایید صحیح است. اکنون می‌توانید رمز عبور جدید خود را تنظیم کنید.",
+                "phone_number": phone_number
+            }, status=status.HTTP_200_OK)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -782,46 +740,28 @@ class ResetPasswordView(APIView):
             code = serializer.validated_data['code']
             new_password = serializer.validated_data['new_password']
             
-            # Verify the code is valid and recent
-            try:
-                verification_code = VerificationCode.objects.get(
-                    phone_number=phone_number,
-                    code=code,
-                    type=VerificationCode.PHONE,
-                    is_used=True
+            # The code must have been verified in the last OTP_VERIFIED_TTL seconds
+            if not otp.is_verified(otp.RESET_PASSWORD, phone_number, code):
+                return Response(
+                    {"error": "کد تایید منقضی شده است. لطفاً دوباره درخواست کد دهید."}, 
+                    status=status.HTTP_400_BAD_REQUEST
                 )
+            
+            # Get user profile and update password
+            try:
+                user_profile = UserProfile.objects.get(phone_number=phone_number)
+                user = user_profile.user
+                user.set_password(new_password)
+                user.save()
+                otp.clear_verified(otp.RESET_PASSWORD, phone_number)
                 
-                # Check if code was used recently (within last 10 minutes)
-                from django.utils import timezone
-                from datetime import timedelta
-                time_threshold = timezone.now() - timedelta(minutes=10)
-                
-                if verification_code.created_at < time_threshold:
-                    return Response(
-                        {"error": "کد تایید منقضی شده است. لطفاً دوباره درخواست کد دهید."}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
+                return Response({
+                    "message": "رمز عبور با موفقیت تغییر یافت. اکنون می‌توانید وارد شوید."
+                }, status=status.HTTP_200_OK)
                 
-                # Get user profile and update password
-                try:
-                    user_profile = UserProfile.objects.get(phone_number=phone_number)
-                    user = user_profile.user
-                    user.set_password(new_password)
-                    user.save()
-                    
-                    return Response({
-                        "message": "رمز عبور با موفقیت تغییر یافت. اکنون می‌توانید وارد شوید."
-                    }, status=status.HTTP_200_OK)
-                    
-                except UserProfile.DoesNotExist:
-                    return Response(
-                        {"error": "کاربر یافت نشد"}, 
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                    
-            except VerificationCode.DoesNotExist:
+            except UserProfile.DoesNotExist:
                 return Response(
-                    {"error": "کد تایید نامعتبر است"}, 
+                    {"error": "کاربر یافت نشد"}, 
                     status=status.HTTP_400_BAD_REQUEST
                 )
         
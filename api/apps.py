@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class ApiConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'api'
+
+    def ready(self):
+        from .db_routers import connect_shard_integrity, shard_alias
+        if shard_alias() is not None:
+            connect_shard_integrity()
@@ -18,12 +18,16 @@ from channels.auth import AuthMiddlewareStack
 from channels.routing import ProtocolTypeRouter, URLRouter
 from chat.middleware import JWTAuthMiddleware
 import chat.routing
+import tests.routing
+import tickets.routing
 
 application = ProtocolTypeRouter({
     "http": get_asgi_application(),
     "websocket": JWTAuthMiddleware(
         URLRouter(
             chat.routing.websocket_urlpatterns
+            + tests.routing.websocket_urlpatterns
+            + tickets.routing.websocket_urlpatterns
         )
     ),
 })
@@ -1,19 +1,45 @@
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, TokenError
 from django.conf import settings
 
+from accounts.auth_cache import get_cached_user
+
+
+def get_access_token(request):
+    """
+    Validate the `access` cookie once per request.
+
+    Returns the AccessToken, or None when the cookie is missing or invalid.
+    The result is stored on the underlying HttpRequest, so
+    RefreshTokenMiddleware and CookieJWTAuthentication share one decode.
+    """
+    http_request = getattr(request, '_request', request)
+    if not hasattr(http_request, '_access_token'):
+        raw_token = http_request.COOKIES.get("access")
+        token = None
+        if raw_token:
+            try:
+                token = AccessToken(raw_token)
+            except TokenError:
+                token = None
+        http_request._access_token = token
+    return http_request._access_token
+
+
 class CookieJWTAuthentication(JWTAuthentication):
     def authenticate(self, request):
-        raw_token = request.COOKIES.get("access")
+        validated_token = get_access_token(request)
         
         # if settings.DEBUG:
         #     print(f"[DEBUG] All cookies: {request.COOKIES}")
         #     print(f"[DEBUG] Access token from cookie: {raw_token}")
         
-        if raw_token is None:
+        if validated_token is None:
             return None
             
         try:
-            validated_token = self.get_validated_token(raw_token)
             user = self.get_user(validated_token)
             # if settings.DEBUG:
                 # print(f"[DEBUG] Authenticated user: {user}")
@@ -22,3 +48,17 @@ class CookieJWTAuthentication(JWTAuthentication):
             # if settings.DEBUG:
                 # print(f"[DEBUG] Token validation failed: {e}")
             return None
+
+    def get_user(self, validated_token):
+        """Resolve the token's user through the short-lived user cache."""
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed("User not found", code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed("User is inactive", code="user_inactive")
+        return user
@@ -0,0 +1,412 @@
+"""
+Cache subsystem.
+
+`default` is a TieredCache: a small in-process LRU in front of a cache shared
+by every worker on the host (`shared` in CACHES). Only keys under
+LOCAL_PREFIXES (query results from `cached_query`) are kept in the local tier,
+for at most LOCAL_TIMEOUT seconds; everything else (throttle histories, auth
+versions, locks, counters) always reads the shared tier so it stays consistent
+across processes.
+
+The shared tier is selected with CACHE_BACKEND:
+
+- `sqlite` (default): SQLiteCache, a WAL-mode SQLite file with atomic
+  add/incr, so locks and counters work across processes without a server
+- `redis`: Django's RedisCache (needs the redis package and a local Redis)
+- `file` / `locmem`: Django's FileBasedCache / LocMemCache
+
+`cached_query` is the cache-aside helper for read endpoints: versioned keys
+(bumped per tag with `invalidate_query`), stampede protection and hit/miss
+metrics (`cache_metrics`).
+"""
+import functools
+import hashlib
+import math
+import pickle
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.db import transaction
+
+_MISSING = object()
+
+
+# Metrics
+
+_metrics_lock = threading.Lock()
+_metrics = defaultdict(lambda: {'hits': 0, 'misses': 0, 'stale': 0, 'local_hits': 0})
+
+
+def _record(name, outcome):
+    with _metrics_lock:
+        _metrics[name][outcome] += 1
+
+
+def cache_metrics():
+    """Per-name hit/miss counters of this process, with hit ratios."""
+    with _metrics_lock:
+        snapshot = {name: dict(counts) for name, counts in _metrics.items()}
+    for counts in snapshot.values():
+        lookups = counts['hits'] + counts['misses']
+        counts['hit_ratio'] = round(counts['hits'] / lookups, 3) if lookups else None
+    return snapshot
+
+
+def reset_cache_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+# Backends
+
+class SQLiteCache(BaseCache):
+    """
+    Cache stored in a SQLite file shared by all processes on the host.
+
+    add() and incr() run in one IMMEDIATE transaction, so they are atomic
+    across processes (unlike FileBasedCache). A sample of writes checks the
+    size and culls expired, then soonest-expiring, rows past MAX_ENTRIES.
+    """
+
+    CULL_SAMPLE = 0.05
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self._path, timeout=10, isolation_level=None, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS cache '
+                '(key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL) WITHOUT ROWID'
+            )
+            self._local.db = db
+        return db
+
+    def _expiry(self, timeout):
+        # Absolute expiry time (None = never), as BaseCache computes it
+        return self.get_backend_timeout(timeout)
+
+    def _get(self, db, key):
+        row = db.execute(
+            'SELECT value FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)', (key, time.time())
+        ).fetchone()
+        return _MISSING if row is None else pickle.loads(row[0])
+
+    def _write(self, db, key, value, timeout):
+        db.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expiry(timeout)),
+        )
+
+    def _cull(self, db):
+        (count,) = db.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if count <= self._max_entries:
+            return
+        db.execute('DELETE FROM cache WHERE expires IS NOT NULL AND expires <= ?', (time.time(),))
+        (count,) = db.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if count > self._max_entries:
+            excess = count - self._max_entries + self._max_entries // max(self._cull_frequency, 1)
+            db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires IS NULL, expires LIMIT ?)',
+                (excess,),
+            )
+
+    def _atomic(self, func):
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            result = func(db)
+            db.execute('COMMIT')
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        return result
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        value = self._get(self._db(), key)
+        return default if value is _MISSING else value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+
+        def write(db):
+            self._write(db, key, value, timeout)
+            # Counting rows is O(n); check the size on a sample of writes
+            if random.random() < self.CULL_SAMPLE:
+                self._cull(db)
+        self._atomic(write)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+
+        def add(db):
+            if self._get(db, key) is not _MISSING:
+                return False
+            self._write(db, key, value, timeout)
+            return True
+        return self._atomic(add)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        cursor = self._db().execute(
+            'UPDATE cache SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (self._expiry(timeout), key, time.time()),
+        )
+        return cursor.rowcount == 1
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._db().execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount == 1
+
+    def has_key(self, key, version=None):
+        return self.get(key, _MISSING, version=version) is not _MISSING
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+
+        def incr(db):
+            row = db.execute(
+                'SELECT value, expires FROM cache WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            db.execute(
+                'UPDATE cache SET value = ? WHERE key = ?', (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key)
+            )
+            return value
+        return self._atomic(incr)
+
+    def clear(self):
+        self._db().execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Connections are per thread and reused for the life of the process
+        pass
+
+
+class _LocalLRU:
+    """Thread-safe in-process LRU with a per-entry expiry."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return _MISSING
+            expires, value = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TieredCache(BaseCache):
+    """
+    In-process LRU in front of a shared cache alias.
+
+    OPTIONS: SHARED (alias, default 'shared'), LOCAL_MAX_ENTRIES (1000),
+    LOCAL_TIMEOUT (seconds, 5), LOCAL_PREFIXES (keys eligible for the local
+    tier, default ('q:',)). Writes always go to the shared tier.
+    """
+
+    def __init__(self, location, params):
+        options = dict(params.get('OPTIONS', {}))
+        self._shared_alias = options.pop('SHARED', 'shared')
+        self._local_timeout = options.pop('LOCAL_TIMEOUT', 5)
+        self._local_prefixes = tuple(options.pop('LOCAL_PREFIXES', ('q:',)))
+        local_max_entries = options.pop('LOCAL_MAX_ENTRIES', 1000)
+        super().__init__(dict(params, OPTIONS=options))
+        self._local = _LocalLRU(local_max_entries)
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _local_key(self, key, version):
+        if not key.startswith(self._local_prefixes):
+            return None
+        return self.make_key(key, version=version)
+
+    def get(self, key, default=None, version=None):
+        local_key = self._local_key(key, version)
+        if local_key is not None:
+            value = self._local.get(local_key)
+            if value is not _MISSING:
+                _record('tiered', 'local_hits')
+                return value
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            return default
+        if local_key is not None:
+            self._local.set(local_key, value, self._local_timeout)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout=timeout, version=version)
+        local_key = self._local_key(key, version)
+        if local_key is not None:
+            self._local.set(local_key, value, self._local_timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout=timeout, version=version)
+        local_key = self._local_key(key, version)
+        if added and local_key is not None:
+            self._local.set(local_key, value, self._local_timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout=timeout, version=version)
+
+    def delete(self, key, version=None):
+        local_key = self._local_key(key, version)
+        if local_key is not None:
+            self._local.pop(local_key)
+        return self.shared.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        return self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        local_key = self._local_key(key, version)
+        if local_key is not None:
+            self._local.pop(local_key)
+        return self.shared.incr(key, delta=delta, version=version)
+
+    def get_many(self, keys, version=None):
+        return self.shared.get_many(keys, version=version)
+
+    def clear(self):
+        self._local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+
+# Cache-aside helper
+
+def _tag_key(tag):
+    return f'qv:{tag}'
+
+
+def _tag_versions(tags):
+    if not tags:
+        return ''
+    versions = cache.get_many([_tag_key(tag) for tag in tags])
+    return '.'.join(str(versions.get(_tag_key(tag), 0)) for tag in tags)
+
+
+def invalidate_query(*tags):
+    """Bump the version of each tag; every cached_query result depending on it is recomputed."""
+    for tag in tags:
+        key = _tag_key(tag)
+        cache.add(key, 0, None)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def invalidate_on_commit(*tags):
+    """invalidate_query once the current transaction commits, so no request re-caches the old rows."""
+    transaction.on_commit(lambda: invalidate_query(*tags))
+
+
+def cached_query(name, timeout=300, tags=(), key=None, lock_timeout=10, beta=1.0):
+    """
+    Cache a function's return value (cache-aside).
+
+    The key combines `name`, the current versions of `name` and `tags` and the
+    call arguments (or `key(*args, **kwargs)` when given), so
+    invalidate_query(tag) or `func.invalidate()` retires every variant at once. On a miss only one caller recomputes while
+    others wait briefly for its result; close to expiry a caller may recompute
+    early (probabilistic early expiration, weighted by how long the last
+    computation took) while everyone else keeps getting the cached value.
+    Return plain picklable data (lists/dicts), not querysets.
+    """
+    # The name is an implicit tag, so invalidate_query(name) retires all variants
+    all_tags = (name, *tags)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            arguments = key(*args, **kwargs) if key else repr((args, sorted(kwargs.items())))
+            digest = hashlib.md5(str(arguments).encode()).hexdigest()
+            cache_key = f'q:{name}:{_tag_versions(all_tags)}:{digest}'
+            lock_key = f'lock:{cache_key}'
+
+            locked = False
+            entry = cache.get(cache_key)
+            if entry is not None:
+                value, expires_at, cost = entry
+                early = time.time() - cost * beta * math.log(random.random() or 1e-12) >= expires_at
+                if not early:
+                    _record(name, 'hits')
+                    return value
+                locked = cache.add(lock_key, 1, lock_timeout)
+                if not locked:
+                    # Someone else is already refreshing it
+                    _record(name, 'hits')
+                    return value
+                _record(name, 'stale')
+            else:
+                locked = cache.add(lock_key, 1, lock_timeout)
+                if not locked:
+                    # Someone else is computing: wait for their result
+                    deadline = time.monotonic() + lock_timeout
+                    while time.monotonic() < deadline:
+                        time.sleep(0.05)
+                        entry = cache.get(cache_key)
+                        if entry is not None:
+                            _record(name, 'hits')
+                            return entry[0]
+                _record(name, 'misses')
+
+            try:
+                started = time.monotonic()
+                value = func(*args, **kwargs)
+                cost = time.monotonic() - started
+                cache.set(cache_key, (value, time.time() + timeout, cost), timeout)
+            finally:
+                if locked:
+                    cache.delete(lock_key)
+            return value
+
+        wrapper.cache_name = name
+        wrapper.invalidate = lambda: invalidate_query(name)
+        return wrapper
+    return decorator
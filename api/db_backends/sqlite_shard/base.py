@@ -0,0 +1,29 @@
+"""
+SQLite backend for the exam shard (see api.db_routers.ExamShardRouter).
+
+The shard holds only the high-churn tables. Their foreign keys point at
+tables in the default database, which SQLite cannot enforce across files,
+so constraint checking stays off here and the router's integrity hooks
+check parents on save and cascade deletes instead. The default database is
+attached to every connection so joins and select_related() onto its tables
+keep working.
+"""
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.sqlite3 import base
+
+ATTACHED_SCHEMA = 'default_db'
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        conn.execute('PRAGMA foreign_keys = OFF')
+        # Resolved per connection so test runs attach the test database
+        conn.execute(f'ATTACH DATABASE ? AS {ATTACHED_SCHEMA}', [connections[DEFAULT_DB_ALIAS].settings_dict['NAME']])
+        return conn
+
+    def enable_constraint_checking(self):
+        pass
+
+    def check_constraints(self, table_names=None):
+        pass
@@ -0,0 +1,224 @@
+"""
+Database routers.
+
+ReplicaRouter sends the reads of views wrapped in `use_replica` to the
+REPLICA_DATABASE alias: a streaming replica on PostgreSQL (DB_REPLICA_HOST)
+or, on SQLite, a read-only connection to the same file (DB_READ_SNAPSHOT),
+which reads from its own WAL snapshot instead of sharing a connection with
+the exam writes. Everything else, and every write, stays on `default`.
+
+Reads fall back to `default` when no replica is configured or when the
+replica is more than DB_REPLICA_MAX_LAG_SECONDS behind. The lag is measured
+at most once every DB_REPLICA_LAG_CHECK_SECONDS per process.
+
+ExamShardRouter (DB_EXAM_SHARD, SQLite only) keeps the high-churn tables in
+SHARDED_MODELS in their own WAL file, so answer, log and chat writes stop
+queueing behind catalog and commerce writes on the main file. `default`
+keeps empty copies of those tables so ORM cascades from their parents still
+run; `connect_shard_integrity()` replaces the foreign keys SQLite cannot
+enforce across files by checking parents on save and cascading parent
+deletes into the shard after commit. bulk_create() skips the save check;
+the batched writers (tests/answers.py, chat/writer.py) only write for the
+sessions and courses they validated themselves.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, IntegrityError, connections, models, transaction
+from django.db.models.signals import post_delete, pre_save
+
+logger = logging.getLogger(__name__)
+
+_reading_from_replica = ContextVar('reading_from_replica', default=False)
+
+_lag_lock = threading.Lock()
+_lag_state = {'checked_at': None, 'healthy': False}
+
+
+def replica_alias():
+    alias = getattr(settings, 'REPLICA_DATABASE', 'replica')
+    return alias if alias in connections.databases else None
+
+
+def replica_lag(alias):
+    """Seconds the replica is behind its primary; 0 for SQLite snapshots and primaries."""
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT CASE WHEN NOT pg_is_in_recovery() "
+            "OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+        )
+        return float(cursor.fetchone()[0])
+
+
+def replica_is_healthy(alias):
+    """Whether the replica is within DB_REPLICA_MAX_LAG_SECONDS, re-checked at most every DB_REPLICA_LAG_CHECK_SECONDS."""
+    now = time.monotonic()
+    interval = getattr(settings, 'DB_REPLICA_LAG_CHECK_SECONDS', 5)
+    with _lag_lock:
+        checked_at = _lag_state['checked_at']
+        if checked_at is not None and now - checked_at < interval:
+            return _lag_state['healthy']
+        # Claim the check so concurrent requests keep using the previous answer
+        _lag_state['checked_at'] = now
+
+    max_lag = getattr(settings, 'DB_REPLICA_MAX_LAG_SECONDS', 30)
+    try:
+        lag = replica_lag(alias)
+    except DatabaseError:
+        logger.warning("Replica %s is unreachable, reading from the primary", alias, exc_info=True)
+        healthy = False
+    else:
+        healthy = lag <= max_lag
+        if not healthy:
+            logger.warning("Replica %s is %.1f s behind, reading from the primary", alias, lag)
+    _lag_state['healthy'] = healthy
+    return healthy
+
+
+def reset_replica_health():
+    with _lag_lock:
+        _lag_state.update(checked_at=None, healthy=False)
+
+
+@contextmanager
+def replica_reads():
+    """Route the reads made inside the block to the replica (when it is usable)."""
+    token = _reading_from_replica.set(True)
+    try:
+        yield
+    finally:
+        _reading_from_replica.reset(token)
+
+
+def use_replica(view):
+    """Decorator for read-only view functions and methods; see replica_reads()."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        with replica_reads():
+            return view(*args, **kwargs)
+    return wrapped
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not _reading_from_replica.get():
+            return None
+        alias = replica_alias()
+        if alias is None or not replica_is_healthy(alias):
+            return None
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # Rows read from the replica are saved to the primary, not where they came from
+        alias = replica_alias()
+        instance = hints.get('instance')
+        if alias is not None and instance is not None and instance._state.db == alias:
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        aliases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db == replica_alias():
+            return False
+        return None
+
+
+SHARDED_MODELS = frozenset({
+    'tests.studentanswer',
+    'tests.studenttestsessionlog',
+    'chat.chatmessage',
+    'finance.paymentlog',
+    'finance.smsnotificationlog',
+})
+
+
+def shard_alias():
+    alias = getattr(settings, 'EXAM_SHARD_DATABASE', 'exam')
+    return alias if alias in connections.databases else None
+
+
+def is_sharded(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+class ExamShardRouter:
+    def db_for_read(self, model, **hints):
+        return shard_alias() if is_sharded(model) else None
+
+    def db_for_write(self, model, **hints):
+        return shard_alias() if is_sharded(model) else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        alias = shard_alias()
+        if alias is not None and alias in (obj1._state.db, obj2._state.db):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db != shard_alias():
+            return None
+        return model_name is not None and f'{app_label}.{model_name}' in SHARDED_MODELS
+
+
+def _relations(model):
+    return [field for field in model._meta.concrete_fields if field.is_relation]
+
+
+def check_shard_parents(sender, instance, raw=False, **kwargs):
+    """pre_save: refuse a sharded row whose parent does not exist in its database."""
+    if raw:
+        return
+    for field in _relations(sender):
+        value = getattr(instance, field.attname)
+        if value is None:
+            continue
+        if field.is_cached(instance) and not field.get_cached_value(instance)._state.adding:
+            continue
+        if not field.related_model._base_manager.filter(**{field.target_field.attname: value}).exists():
+            raise IntegrityError(
+                f'{sender._meta.label}.{field.name} refers to a missing {field.related_model._meta.label} ({value}).'
+            )
+
+
+def _cascade_into_shard(model, field):
+    set_null = field.remote_field.on_delete is models.SET_NULL
+
+    def cascade(sender, instance, using, **kwargs):
+        value = getattr(instance, field.target_field.attname)
+
+        def apply():
+            rows = model._base_manager.filter(**{field.attname: value})
+            if set_null:
+                rows.update(**{field.attname: None})
+            else:
+                rows.delete()
+
+        transaction.on_commit(apply, using=using)
+    return cascade
+
+
+def connect_shard_integrity():
+    for label in SHARDED_MODELS:
+        model = apps.get_model(label)
+        pre_save.connect(check_shard_parents, sender=model, dispatch_uid=f'shard-parents:{label}')
+        for field in _relations(model):
+            post_delete.connect(
+                _cascade_into_shard(model, field), sender=field.related_model, weak=False,
+                dispatch_uid=f'shard-cascade:{label}.{field.name}',
+            )
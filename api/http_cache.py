@@ -0,0 +1,101 @@
+"""
+Response cache for public, read-mostly endpoints.
+
+`cache_response` wraps a DRF handler (a viewset action or an @api_view
+function). A 200 JSON response is rendered once and stored in the default
+cache together with a strong ETag (SHA-1 of the bytes); later requests get the
+stored bytes without touching the database, and a matching If-None-Match gets
+a 304 without a body. Responses carry Cache-Control max-age and
+stale-while-revalidate (HTTP_CACHE_MAX_AGE, HTTP_CACHE_STALE_WHILE_REVALIDATE).
+
+Keys are versioned like `cached_query` keys: `tags` may name the object being
+served ('test:{test_id}' is filled from the URL kwargs), and model signal
+receivers call `invalidate_on_commit(tag)` so the next request re-renders.
+"""
+import functools
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .cache import _record, _tag_versions
+
+
+def public_variant(request):
+    """Cache one variant for everyone."""
+    return ''
+
+
+def anonymous_variant(request):
+    """Cache only anonymous requests; authenticated users get the live view."""
+    return None if request.user.is_authenticated else ''
+
+
+def _headers(response, etag, private):
+    response['ETag'] = etag
+    patch_cache_control(
+        response,
+        private=private,
+        public=not private,
+        max_age=getattr(settings, 'HTTP_CACHE_MAX_AGE', 60),
+        stale_while_revalidate=getattr(settings, 'HTTP_CACHE_STALE_WHILE_REVALIDATE', 300),
+    )
+    return response
+
+
+def _not_modified(request, etag):
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag in etags
+
+
+def cache_response(name, tags=(), timeout=300, variant=public_variant, private=False):
+    """
+    Cache the rendered response of a DRF GET handler.
+
+    `variant(request)` returns a string that is part of the key, or None to
+    bypass the cache for that request (e.g. users who see drafts or
+    per-user fields). `private=True` keeps shared proxies from storing the
+    response; the server-side cache is used either way.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            request = args[0] if isinstance(args[0], Request) else args[1]
+            renderer = getattr(request, 'accepted_renderer', None)
+            variation = variant(request)
+            # The browsable API renders per user; only JSON bodies are stored
+            if variation is None or getattr(renderer, 'format', None) != 'json':
+                return func(*args, **kwargs)
+
+            key_tags = (name, *(tag.format(**kwargs) for tag in tags))
+            digest = hashlib.md5(f'{variation}|{request.build_absolute_uri()}'.encode()).hexdigest()
+            cache_key = f'q:http:{name}:{_tag_versions(key_tags)}:{digest}'
+
+            entry = cache.get(cache_key)
+            if entry is not None:
+                _record(name, 'hits')
+                content, content_type, etag = entry
+            else:
+                _record(name, 'misses')
+                response = func(*args, **kwargs)
+                if not isinstance(response, Response) or response.status_code != 200:
+                    return response
+                content = renderer.render(response.data, request.accepted_media_type, {'request': request})
+                content_type = renderer.media_type
+                etag = '"%s"' % hashlib.sha1(content).hexdigest()
+                cache.set(cache_key, (content, content_type, etag), timeout)
+
+            if _not_modified(request, etag):
+                return _headers(HttpResponseNotModified(), etag, private)
+            return _headers(HttpResponse(content, content_type=content_type), etag, private)
+
+        return wrapper
+    return decorator
@@ -0,0 +1,85 @@
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a worker imports before serving its first request
+TARGETS = {
+    'urls': 'import django; django.setup(); from django.urls import get_resolver; get_resolver().url_patterns',
+    'asgi': 'import api.asgi',
+    'wsgi': 'import api.wsgi',
+}
+
+# Heavy SDKs that should only load when their feature is used
+DEFAULT_FORBIDDEN = ('openai', 'google.generativeai', 'grpc')
+
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def parse_importtime(stderr):
+    """(module, self_us, cumulative_us, depth) for each line of `python -X importtime` output."""
+    rows = []
+    for line in stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure what starting a worker imports with `python -X importtime`: total import time, the slowest '
+        'modules and packages, and whether any SDK that should be imported lazily was loaded'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=sorted(TARGETS), default='urls',
+                            help='What to import: Django setup plus URLconf (default), or the ASGI/WSGI app')
+        parser.add_argument('--runs', type=int, default=3, help='Fresh interpreters to time; the fastest counts (default: 3)')
+        parser.add_argument('--limit', type=int, default=15, help='Modules and packages to list (default: 15)')
+        parser.add_argument('--forbid', nargs='*', default=list(DEFAULT_FORBIDDEN),
+                            help=f'Fail if any of these modules is imported (default: {" ".join(DEFAULT_FORBIDDEN)})')
+
+    def handle(self, *args, **options):
+        runs = [self.run(TARGETS[options['target']]) for _ in range(max(1, options['runs']))]
+        rows = min(runs, key=lambda rows: sum(row[2] for row in rows if row[3] == 0))
+        total_us = sum(cumulative for _, _, cumulative, depth in rows if depth == 0)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{options["target"]}: {total_us / 1000:.0f} ms importing {len(rows)} modules '
+            f'(fastest of {len(runs)} runs)'
+        ))
+
+        packages = defaultdict(int)
+        for module, self_us, _, _ in rows:
+            packages[module.split('.')[0]] += self_us
+        self.stdout.write(f'\n{"package":<40} {"ms":>8} {"share":>6}')
+        for package, self_us in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:options['limit']]:
+            self.stdout.write(f'{package:<40} {self_us / 1000:>8.1f} {self_us / total_us:>6.1%}')
+
+        self.stdout.write(f'\n{"module (cumulative)":<60} {"ms":>8}')
+        for module, _, cumulative_us, _ in sorted(rows, key=lambda row: row[2], reverse=True)[:options['limit']]:
+            self.stdout.write(f'{module[:60]:<60} {cumulative_us / 1000:>8.1f}')
+
+        imported = {module for module, _, _, _ in rows}
+        loaded = [
+            name for name in options['forbid']
+            if any(module == name or module.startswith(name + '.') for module in imported)
+        ]
+        if loaded:
+            raise CommandError(f'Imported at startup but should load lazily: {", ".join(loaded)}')
+
+    def run(self, code):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'api.settings'))
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', code],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(f'Import failed:\n{result.stderr[-2000:]}')
+        return parse_importtime(result.stderr)
@@ -0,0 +1,144 @@
+import os
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+
+SOURCE_ALIAS = 'copy_source'
+
+# Recreated by `migrate` on the target with their own ids; replaced by the
+# source rows so generic relations and permissions keep pointing at the same ids.
+REPLACED_MODELS = ('contenttypes.ContentType', 'auth.Permission')
+
+
+def copy_order(models):
+    """Order models so the tables they reference come first (cycles are left as found)."""
+    included = set(models)
+    ordered, seen = [], set()
+
+    def visit(model):
+        if model in seen:
+            return
+        seen.add(model)
+        for field in model._meta.concrete_fields:
+            if field.is_relation and field.related_model in included:
+                visit(field.related_model)
+        ordered.append(model)
+
+    for model in models:
+        visit(model)
+    return ordered
+
+
+@contextmanager
+def _keep_timestamps(model):
+    """bulk_create would overwrite auto_now/auto_now_add values with the current time."""
+    fields = [field for field in model._meta.concrete_fields
+              if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy every table from another database (a DATABASES alias or a SQLite file) into a freshly '
+        'migrated database in bulk, e.g. to move a SQLite deployment to PostgreSQL'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('source', help='DATABASES alias or path to a SQLite file')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Target alias (default: default)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per INSERT (default: 2000)')
+
+    def handle(self, *args, **options):
+        source = self.resolve_source(options['source'])
+        try:
+            self.copy(source, options['database'], options['batch_size'], options['verbosity'])
+        finally:
+            if source == SOURCE_ALIAS:
+                connections[SOURCE_ALIAS].close()
+                del connections[SOURCE_ALIAS]
+                del connections.databases[SOURCE_ALIAS]
+
+    def copy(self, source, target, batch_size, verbosity):
+        if connections[source].settings_dict['NAME'] == connections[target].settings_dict['NAME']:
+            raise CommandError('Source and target are the same database.')
+
+        models = copy_order([
+            model for model in apps.get_models(include_auto_created=True)
+            if model._meta.managed and not model._meta.proxy and router.allow_migrate_model(target, model)
+        ])
+        replaced = [model for model in models if model._meta.label in REPLACED_MODELS]
+
+        not_empty = [
+            model._meta.db_table for model in models
+            if model not in replaced and model._base_manager.using(target).exists()
+        ]
+        if not_empty:
+            raise CommandError(
+                f'Target database is not empty ({", ".join(not_empty[:10])}). '
+                'Run it against a freshly migrated database.'
+            )
+
+        total = 0
+        with transaction.atomic(using=target):
+            # Foreign keys are deferred until commit, so rows inside a cycle can go in any order
+            for model in reversed(replaced):
+                model._base_manager.using(target).all().delete()
+            for model in models:
+                copied = self.copy_model(model, source, target, batch_size)
+                total += copied
+                if verbosity > 1:
+                    self.stdout.write(f'{model._meta.label:<45} {copied:>10}')
+
+            with connections[target].cursor() as cursor:
+                for sql in connections[target].ops.sequence_reset_sql(no_style(), models):
+                    cursor.execute(sql)
+
+        mismatched = [
+            model._meta.label for model in models
+            if model._base_manager.using(source).count() != model._base_manager.using(target).count()
+        ]
+        if mismatched:
+            raise CommandError(f'Row counts differ after the copy: {", ".join(mismatched)}')
+        self.stdout.write(self.style.SUCCESS(f'Copied {total} rows in {len(models)} tables from {source} to {target}.'))
+
+    def resolve_source(self, source):
+        if source in connections.databases:
+            return source
+        if not os.path.isfile(source):
+            raise CommandError(f'{source!r} is neither a database alias nor a SQLite file.')
+        connections.databases[SOURCE_ALIAS] = {
+            **connections.databases[DEFAULT_DB_ALIAS],
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': source,
+            'OPTIONS': {},
+            'CONN_MAX_AGE': 0,
+            'CONN_HEALTH_CHECKS': False,
+        }
+        return SOURCE_ALIAS
+
+    def copy_model(self, model, source, target, batch_size):
+        rows = model._base_manager.using(source).order_by('pk').iterator(chunk_size=batch_size)
+        manager = model._base_manager.using(target)
+        copied = 0
+        with _keep_timestamps(model):
+            batch = []
+            for row in rows:
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    manager.bulk_create(batch)
+                    copied += len(batch)
+                    batch = []
+            if batch:
+                manager.bulk_create(batch)
+                copied += len(batch)
+        return copied
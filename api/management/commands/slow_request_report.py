@@ -0,0 +1,108 @@
+import json
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from api.profiling import fingerprint
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[int(fraction * (len(values) - 1))]
+
+
+class Command(BaseCommand):
+    help = 'Rank endpoints by the slow requests recorded in the slow-request log'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', default=getattr(settings, 'SLOW_REQUEST_LOG', None),
+                            help='Slow-request log to read (default: SLOW_REQUEST_LOG)')
+        parser.add_argument('--hours', type=float, help='Only requests from the last N hours')
+        parser.add_argument('--sort', choices=['total', 'p95', 'max', 'count'], default='total',
+                            help='Ranking key (default: total time spent)')
+        parser.add_argument('--limit', type=int, default=20)
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(hours=options['hours']) if options['hours'] else None
+        records = list(self.read(options['file'], since))
+        if not records:
+            self.stdout.write('No slow requests recorded.')
+            return
+
+        report = self.aggregate(records)
+        sort_key = {'total': 'total_ms', 'p95': 'p95_ms', 'max': 'max_ms', 'count': 'count'}[options['sort']]
+        report.sort(key=lambda row: row[sort_key], reverse=True)
+        report = report[:options['limit']]
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, ensure_ascii=False, indent=2))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f'Slow requests: {len(records)}'))
+        self.stdout.write(f'{"view":<40} {"count":>6} {"p50":>8} {"p95":>8} {"max":>8} {"queries":>8} {"db %":>6}')
+        for row in report:
+            self.stdout.write(
+                f'{row["view"][:40]:<40} {row["count"]:>6} {row["p50_ms"]:>8.0f} {row["p95_ms"]:>8.0f} '
+                f'{row["max_ms"]:>8.0f} {row["queries_avg"]:>8.0f} {row["db_share"]:>6.0%}'
+            )
+            if row['top_query']:
+                self.stdout.write(f'    slowest SQL ({row["top_query"]["ms"]:.0f} ms total): {row["top_query"]["sql"][:160]}')
+            if row['top_frame']:
+                self.stdout.write(f'    hottest frame ({row["top_frame"]["samples"]} samples): {row["top_frame"]["frame"]}')
+            self.stdout.write(f'    roles: {", ".join(f"{role} {count}" for role, count in row["roles"].items())}')
+
+    def read(self, path, since):
+        try:
+            lines = open(path, encoding='utf-8')
+        except (OSError, TypeError) as exc:
+            raise CommandError(f'Cannot read the slow-request log {path!r}: {exc}')
+        with lines:
+            for line in lines:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if since is not None:
+                    ts = parse_datetime(record.get('ts', ''))
+                    if ts is None or ts < since:
+                        continue
+                yield record
+
+    def aggregate(self, records):
+        by_view = defaultdict(list)
+        for record in records:
+            by_view[record.get('view') or 'unresolved'].append(record)
+
+        report = []
+        for view, rows in by_view.items():
+            durations = [row['duration_ms'] for row in rows]
+            total = sum(durations)
+            query_time = Counter()
+            frames = Counter()
+            for row in rows:
+                for query in row.get('slowest_queries', []):
+                    query_time[fingerprint(query['sql'])] += query['ms']
+                for stack in row.get('stacks', []):
+                    # The innermost frame is where the time was actually spent
+                    frames[stack['stack'].rsplit(';', 1)[-1]] += stack['samples']
+            top_query = query_time.most_common(1)
+            top_frame = frames.most_common(1)
+            report.append({
+                'view': view,
+                'count': len(rows),
+                'total_ms': round(total, 1),
+                'p50_ms': _percentile(durations, 0.5),
+                'p95_ms': _percentile(durations, 0.95),
+                'max_ms': max(durations),
+                'queries_avg': round(sum(row.get('queries', 0) for row in rows) / len(rows), 1),
+                'db_share': round(sum(row.get('db_ms', 0) for row in rows) / total, 3) if total else 0,
+                'roles': dict(Counter(row.get('role') or 'unknown' for row in rows).most_common()),
+                'top_query': {'sql': top_query[0][0], 'ms': round(top_query[0][1], 1)} if top_query else None,
+                'top_frame': {'frame': top_frame[0][0], 'samples': top_frame[0][1]} if top_frame else None,
+            })
+        return report
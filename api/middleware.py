@@ -1,8 +1,14 @@
-from rest_framework_simplejwt.tokens import RefreshToken, AccessToken, TokenError
+import time
+
+from rest_framework_simplejwt.tokens import RefreshToken, TokenError
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.utils.deprecation import MiddlewareMixin
 from django.http import JsonResponse
 
+from .auth import get_access_token
+from .profiling import log_slow_request, profile_queries, record_request, stack_sampler
+
+
 class RefreshTokenMiddleware(MiddlewareMixin):
     def process_request(self, request):
         access_token = request.COOKIES.get("access")
@@ -11,9 +17,8 @@ class RefreshTokenMiddleware(MiddlewareMixin):
         if not access_token:
             return None  # No token, let view handle it
 
-        try:
-            AccessToken(access_token)  # Try to validate
-        except TokenError:
+        # Validated once and reused by CookieJWTAuthentication
+        if get_access_token(request) is None:
             if refresh_token:
                 try:
                     new_access = RefreshToken(refresh_token).access_token
@@ -36,3 +41,48 @@ class RefreshTokenMiddleware(MiddlewareMixin):
                 domain=".ariantafazolizadeh.ir" if not settings.DEBUG else None,
             )
         return response
+
+
+class QueryProfileMiddleware:
+    """
+    Counts the queries, DB time and duplicate queries of every request and
+    adds them to the per-endpoint summary (see api/profiling.py). With
+    QUERY_PROFILE_HEADERS the numbers are also sent as X-DB-* headers and a
+    Server-Timing header. Requests over SLOW_REQUEST_MS, or with a statement
+    over SLOW_QUERY_MS, go to the slow-request log.
+    """
+
+    def __init__(self, get_response):
+        from django.conf import settings
+
+        self.get_response = get_response
+        self.headers = getattr(settings, "QUERY_PROFILE_HEADERS", settings.DEBUG)
+        self.window = getattr(settings, "QUERY_PROFILE_WINDOW", 200)
+        self.slow_request = getattr(settings, "SLOW_REQUEST_MS", 1000) / 1000
+        self.slow_query = getattr(settings, "SLOW_QUERY_MS", 300) / 1000
+        self.top_queries = getattr(settings, "SLOW_REQUEST_TOP_QUERIES", 5)
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        stack_sampler.start()
+        try:
+            with profile_queries(top=self.top_queries) as profile:
+                response = self.get_response(request)
+        finally:
+            stacks = stack_sampler.stop()
+        wall_time = time.perf_counter() - started
+
+        match = request.resolver_match
+        name = match.view_name if match else "unresolved"
+        record_request(name, profile, wall_time, window=self.window)
+
+        slowest_query = profile.slowest[0][0] if profile.slowest else 0
+        if wall_time >= self.slow_request or slowest_query >= self.slow_query:
+            log_slow_request(request, response, name, profile, wall_time, stacks)
+
+        if self.headers:
+            response["X-DB-Queries"] = str(profile.count)
+            response["X-DB-Duplicate-Queries"] = str(sum(profile.duplicates.values()))
+            response["X-DB-Time-Ms"] = f"{profile.db_time * 1000:.1f}"
+            response["Server-Timing"] = f"db;dur={profile.db_time * 1000:.1f}, total;dur={wall_time * 1000:.1f}"
+        return response
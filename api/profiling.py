@@ -0,0 +1,240 @@
+"""
+Per-request database profiling.
+
+QueryProfileMiddleware runs every request inside `profile_queries()`, which
+installs an execute wrapper on each database connection and counts the
+queries, their total time and their fingerprints (the SQL with literals and
+IN lists folded), so a loop issuing the same query per row shows up as one
+fingerprint with a high count.
+
+Each finished request is added to a rolling window per URL name
+(`record_request`); `endpoint_summary()` backs /api/admin/query-stats/. With
+QUERY_PROFILE_HEADERS (on in DEBUG) the numbers are also returned as
+response headers.
+
+Requests slower than SLOW_REQUEST_MS, or running a statement slower than
+SLOW_QUERY_MS, are written as one JSON line to the `api.slow_requests`
+logger (`log_slow_request`) with their slowest statements and, for requests
+that ran long enough to be sampled, their hottest Python stacks
+(`stack_sampler`). `manage.py slow_request_report` ranks the endpoints in
+that log.
+"""
+import heapq
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.utils import timezone
+
+slow_logger = logging.getLogger('api.slow_requests')
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """Normalize a statement so the same query with different values compares equal."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class QueryProfile:
+    """Execute wrapper collecting query counts, time, fingerprints and the `top` slowest statements."""
+
+    def __init__(self, top=5):
+        self.count = 0
+        self.db_time = 0.0
+        self.fingerprints = Counter()
+        self.top = top
+        self._slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.db_time += duration
+            self.fingerprints[fingerprint(sql)] += 1
+            if len(self._slowest) < self.top:
+                heapq.heappush(self._slowest, (duration, self.count, sql))
+            elif duration > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, (duration, self.count, sql))
+
+    @property
+    def slowest(self):
+        """[(seconds, sql)] of the slowest statements, slowest first."""
+        return [(duration, sql) for duration, _, sql in sorted(self._slowest, reverse=True)]
+
+    @property
+    def duplicates(self):
+        """Fingerprints that ran more than once, with their counts."""
+        return {sql: count for sql, count in self.fingerprints.items() if count > 1}
+
+
+@contextmanager
+def profile_queries(top=5):
+    profile = QueryProfile(top=top)
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(profile))
+        yield profile
+
+
+# Rolling per-endpoint summary
+
+_lock = threading.Lock()
+_windows = {}
+_totals = Counter()
+
+
+def record_request(name, profile, wall_time, window=200):
+    sample = (profile.count, profile.db_time, wall_time, profile.duplicates)
+    with _lock:
+        samples = _windows.get(name)
+        if samples is None:
+            samples = _windows[name] = deque(maxlen=window)
+        samples.append(sample)
+        _totals[name] += 1
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+def endpoint_summary(top=5):
+    """Per URL name: query count, DB time and wall time over the last requests, worst first."""
+    with _lock:
+        windows = {name: list(samples) for name, samples in _windows.items()}
+        totals = dict(_totals)
+
+    summary = {}
+    for name, samples in windows.items():
+        queries = [sample[0] for sample in samples]
+        db_times = [sample[1] for sample in samples]
+        wall_times = sorted(sample[2] for sample in samples)
+        duplicates = Counter()
+        for sample in samples:
+            duplicates.update(sample[3])
+        summary[name] = {
+            'requests': totals[name],
+            'sampled': len(samples),
+            'queries_avg': round(sum(queries) / len(samples), 1),
+            'queries_max': max(queries),
+            'db_ms_avg': _ms(sum(db_times) / len(samples)),
+            'db_ms_max': _ms(max(db_times)),
+            'wall_ms_avg': _ms(sum(wall_times) / len(samples)),
+            'wall_ms_p95': _ms(wall_times[int(0.95 * (len(wall_times) - 1))]),
+            'wall_ms_max': _ms(wall_times[-1]),
+            'duplicate_queries': [
+                {'sql': sql, 'count': count} for sql, count in duplicates.most_common(top)
+            ],
+        }
+    return dict(sorted(summary.items(), key=lambda item: item[1]['queries_max'], reverse=True))
+
+
+def reset_endpoint_summary():
+    with _lock:
+        _windows.clear()
+        _totals.clear()
+
+
+# Slow-request log
+
+def _frame_label(frame):
+    filename = frame.f_code.co_filename
+    if 'site-packages' in filename:
+        filename = filename.split('site-packages' + os.sep, 1)[-1]
+    else:
+        filename = os.path.relpath(filename)
+    return f'{filename}:{frame.f_code.co_name}:{frame.f_lineno}'
+
+
+def collapse_stack(frame, max_depth=40):
+    """`outer;...;inner` frame labels (the collapsed format flame graph tools read)."""
+    labels = []
+    while frame is not None and len(labels) < max_depth:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+class StackSampler:
+    """
+    Samples the Python stack of every request running longer than `after`
+    seconds, every `interval` seconds, from one daemon thread. Requests that
+    finish sooner are never sampled, so fast requests only pay for start()
+    and stop().
+    """
+
+    def __init__(self, interval=None, after=None):
+        self.interval = (interval or getattr(settings, 'SLOW_REQUEST_SAMPLE_INTERVAL_MS', 20)) / 1000
+        self.after = (after or getattr(settings, 'SLOW_REQUEST_SAMPLE_AFTER_MS', 250)) / 1000
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            self._active[threading.get_ident()] = (time.monotonic(), Counter())
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Stop sampling the calling thread. Returns {collapsed stack: samples}."""
+        with self._lock:
+            entry = self._active.pop(threading.get_ident(), None)
+        return entry[1] if entry else Counter()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            now = time.monotonic()
+            with self._lock:
+                due = [(ident, samples) for ident, (started, samples) in self._active.items()
+                       if now - started >= self.after]
+            if not due:
+                continue
+            frames = sys._current_frames()
+            for ident, samples in due:
+                frame = frames.get(ident)
+                if frame is not None:
+                    samples[collapse_stack(frame)] += 1
+
+
+stack_sampler = StackSampler()
+
+
+def log_slow_request(request, response, view_name, profile, wall_time, stacks, top_stacks=5):
+    user = getattr(request, 'user', None)
+    authenticated = user is not None and user.is_authenticated
+    slow_logger.warning(json.dumps({
+        'ts': timezone.now().isoformat(),
+        'method': request.method,
+        'path': request.path,
+        'view': view_name,
+        'status': response.status_code,
+        'user_id': user.pk if authenticated else None,
+        'role': getattr(user, 'role', None) if authenticated else 'anonymous',
+        'duration_ms': _ms(wall_time),
+        'db_ms': _ms(profile.db_time),
+        'queries': profile.count,
+        'duplicate_queries': sum(profile.duplicates.values()),
+        'slowest_queries': [{'ms': _ms(duration), 'sql': sql} for duration, sql in profile.slowest],
+        'stack_samples': sum(stacks.values()),
+        'stacks': [{'stack': stack, 'samples': count} for stack, count in stacks.most_common(top_stacks)],
+    }, ensure_ascii=False, default=str))
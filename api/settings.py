@@ -56,6 +56,9 @@ except UndefinedValueError:
 # SMS settings for sms.ir
 SMS_IR_API_KEY = config('SMS_IR_API_KEY', default='')
 SMS_IR_LINE_NUMBER = config('SMS_IR_LINE_NUMBER', default='')
+SMS_IR_BASE_URL = config('SMS_IR_BASE_URL', default='https://api.sms.ir/v1/send')
+# Concurrent pattern (verify) sends and pooled connections to sms.ir
+SMS_MAX_WORKERS = config('SMS_MAX_WORKERS', cast=int, default=8)
 
 # Zibal Payment Gateway Settings
 # Use 'zibal' as merchant ID for sandbox/testing, or the real merchant ID for production
@@ -170,9 +173,14 @@ INSTALLED_APPS = [
     'knowledge',
     'blog',
     'chat',
+    'jobs',
+    # Project package itself, for its management commands
+    'api',
 ]
 
 MIDDLEWARE = [
+    # First, so queries made by the other middleware are counted too
+    'api.middleware.QueryProfileMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -184,6 +192,22 @@ MIDDLEWARE = [
     'api.middleware.RefreshTokenMiddleware',
 ]
 
+# Query profiling (api/profiling.py): per-request numbers as response headers,
+# and how many recent requests per URL name /api/admin/query-stats/ summarizes
+QUERY_PROFILE_HEADERS = config('QUERY_PROFILE_HEADERS', cast=bool, default=DEBUG)
+QUERY_PROFILE_WINDOW = config('QUERY_PROFILE_WINDOW', cast=int, default=200)
+
+# Slow-request log (logs/slow_requests.log, one JSON object per line; rank it
+# with `manage.py slow_request_report`). Requests running longer than
+# SLOW_REQUEST_SAMPLE_AFTER_MS have their Python stack sampled every
+# SLOW_REQUEST_SAMPLE_INTERVAL_MS.
+SLOW_REQUEST_MS = config('SLOW_REQUEST_MS', cast=int, default=1000)
+SLOW_QUERY_MS = config('SLOW_QUERY_MS', cast=int, default=300)
+SLOW_REQUEST_TOP_QUERIES = config('SLOW_REQUEST_TOP_QUERIES', cast=int, default=5)
+SLOW_REQUEST_SAMPLE_AFTER_MS = config('SLOW_REQUEST_SAMPLE_AFTER_MS', cast=int, default=250)
+SLOW_REQUEST_SAMPLE_INTERVAL_MS = config('SLOW_REQUEST_SAMPLE_INTERVAL_MS', cast=int, default=20)
+SLOW_REQUEST_LOG = config('SLOW_REQUEST_LOG', default=str(BASE_DIR / 'logs' / 'slow_requests.log'))
+
 ROOT_URLCONF = 'api.urls'
 
 TEMPLATES = [
@@ -269,9 +293,28 @@ elif _db_engine.startswith('django.db.backends.mysql'):
     _db_options = {
         'charset': 'utf8mb4',
     }
+elif _db_engine.startswith('django.db.backends.postgresql'):
+    _db_options = {
+        'connect_timeout': config('DB_CONNECT_TIMEOUT', cast=int, default=5),
+    }
+    # Cancel runaway statements instead of letting them hold a connection. It
+    # applies to every connection of the process, migrate and copy_database
+    # included, so set it only in the web servers' environment.
+    _statement_timeout = config('DB_STATEMENT_TIMEOUT_MS', cast=int, default=0)
+    if _statement_timeout:
+        _db_options['options'] = f'-c statement_timeout={_statement_timeout}'
+    if config('DB_POOL', cast=bool, default=False):
+        # psycopg 3 connection pool per process; replaces CONN_MAX_AGE
+        _db_options['pool'] = {
+            'min_size': config('DB_POOL_MIN_SIZE', cast=int, default=2),
+            'max_size': config('DB_POOL_MAX_SIZE', cast=int, default=20),
+            'timeout': config('DB_POOL_TIMEOUT', cast=int, default=10),
+        }
 else:
     _db_options = {}
 
+_db_persistent = _db_engine != 'django.db.backends.sqlite3' and 'pool' not in _db_options
+
 DATABASES = {
     'default': {
         'ENGINE': _db_engine,
@@ -281,9 +324,51 @@ DATABASES = {
         'HOST': config('DB_HOST', default=''),
         'PORT': config('DB_PORT', default=''),
         'OPTIONS': _db_options,
+        # Keep server connections open between requests (pooling must use 0)
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', cast=int, default=60) if _db_persistent else 0,
+        'CONN_HEALTH_CHECKS': _db_persistent,
     }
 }
 
+# Read replica for the analytics and reporting views wrapped in
+# api.db_routers.use_replica; reads fall back to `default` when it lags.
+REPLICA_DATABASE = 'replica'
+DB_REPLICA_MAX_LAG_SECONDS = config('DB_REPLICA_MAX_LAG_SECONDS', cast=int, default=30)
+DB_REPLICA_LAG_CHECK_SECONDS = config('DB_REPLICA_LAG_CHECK_SECONDS', cast=int, default=5)
+
+if config('DB_REPLICA_HOST', default=''):
+    DATABASES[REPLICA_DATABASE] = {
+        **DATABASES['default'],
+        'HOST': config('DB_REPLICA_HOST'),
+        'PORT': config('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'USER': config('DB_REPLICA_USER', default=DATABASES['default']['USER']),
+        'PASSWORD': config('DB_REPLICA_PASSWORD', default=DATABASES['default']['PASSWORD']),
+        'TEST': {'MIRROR': 'default'},
+    }
+elif _db_engine == 'django.db.backends.sqlite3' and config('DB_READ_SNAPSHOT', cast=bool, default=False):
+    # A read-only connection to the same file reads from its own WAL snapshot
+    DATABASES[REPLICA_DATABASE] = {
+        **DATABASES['default'],
+        'NAME': f"file:{DATABASES['default']['NAME']}?mode=ro",
+        'OPTIONS': {**_db_options, 'uri': True},
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['api.db_routers.ReplicaRouter']
+
+# SQLite exam mode: answers, session logs, chat and payment/SMS logs live in
+# their own WAL file (api.db_routers.ExamShardRouter). Create it with
+# `migrate --database exam`; move existing rows with `copy_database default --database exam`.
+EXAM_SHARD_DATABASE = 'exam'
+
+if _db_engine == 'django.db.backends.sqlite3' and config('DB_EXAM_SHARD', cast=bool, default=False):
+    DATABASES[EXAM_SHARD_DATABASE] = {
+        **DATABASES['default'],
+        'ENGINE': 'api.db_backends.sqlite_shard',
+        'NAME': config('DB_EXAM_SHARD_NAME', default=str(BASE_DIR / 'exam.sqlite3')),
+    }
+    DATABASE_ROUTERS.insert(0, 'api.db_routers.ExamShardRouter')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -354,6 +439,77 @@ SIMPLE_JWT = {
     'AUTH_HEADER_NAME': 'HTTP_AUTHORIZATION',
 }
 
+# Cache: in-process LRU in front of a cache shared by all workers (api/cache.py).
+# CACHE_BACKEND picks the shared tier: sqlite (default), redis, file or locmem.
+CACHE_BACKEND = config('CACHE_BACKEND', default='sqlite')
+CACHE_TIMEOUT = config('CACHE_TIMEOUT', cast=int, default=300)
+if CACHE_BACKEND == 'redis':
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config('CACHE_LOCATION', default='redis://127.0.0.1:6379/1'),
+    }
+elif CACHE_BACKEND == 'file':
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / 'cache')),
+    }
+elif CACHE_BACKEND == 'locmem':
+    SHARED_CACHE = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+else:
+    SHARED_CACHE = {
+        'BACKEND': 'api.cache.SQLiteCache',
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / 'cache.sqlite3')),
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    }
+SHARED_CACHE['TIMEOUT'] = CACHE_TIMEOUT
+CACHES = {
+    'default': {
+        'BACKEND': 'api.cache.TieredCache',
+        'TIMEOUT': CACHE_TIMEOUT,
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 5,
+        },
+    },
+    'shared': SHARED_CACHE,
+}
+
+# The test suite swaps the shared tier for a per-process LocMem cache, so it
+# never clears or reads the host's cache (api/test_runner.py)
+TEST_RUNNER = 'api.test_runner.TestRunner'
+
+# Cache-Control of responses served through api.http_cache.cache_response:
+# browsers/CDNs may reuse them for HTTP_CACHE_MAX_AGE seconds and serve them
+# stale for HTTP_CACHE_STALE_WHILE_REVALIDATE more while revalidating.
+HTTP_CACHE_MAX_AGE = config('HTTP_CACHE_MAX_AGE', cast=int, default=60)
+HTTP_CACHE_STALE_WHILE_REVALIDATE = config('HTTP_CACHE_STALE_WHILE_REVALIDATE', cast=int, default=300)
+
+# Seconds an authenticated User (with profile) is served from the cache
+# instead of the database (see accounts/auth_cache.py)
+AUTH_USER_CACHE_TIMEOUT = config('AUTH_USER_CACHE_TIMEOUT', cast=int, default=60)
+
+# One-time verification codes (see accounts/otp.py): kept hashed in the cache
+# for OTP_TTL seconds and dropped after OTP_MAX_ATTEMPTS wrong guesses; a
+# verified code is honoured by the next step for OTP_VERIFIED_TTL seconds.
+# Codes per phone/email and per client IP are limited in sliding windows
+# (0 disables a limit); the limits are only exact and shared across workers
+# with the sqlite or redis CACHE_BACKEND. OTP_AUDIT_DB also records issued codes (without the
+# code) as VerificationCode rows, kept OTP_AUDIT_RETENTION_DAYS days after
+# they expire by `manage.py purge_verification_codes`.
+OTP_TTL = config('OTP_TTL', cast=int, default=600)
+OTP_VERIFIED_TTL = config('OTP_VERIFIED_TTL', cast=int, default=600)
+OTP_MAX_ATTEMPTS = config('OTP_MAX_ATTEMPTS', cast=int, default=5)
+OTP_RESEND_INTERVAL = config('OTP_RESEND_INTERVAL', cast=int, default=60)
+OTP_TARGET_LIMIT = config('OTP_TARGET_LIMIT', cast=int, default=5)
+OTP_TARGET_WINDOW = config('OTP_TARGET_WINDOW', cast=int, default=3600)
+OTP_IP_LIMIT = config('OTP_IP_LIMIT', cast=int, default=20)
+OTP_IP_WINDOW = config('OTP_IP_WINDOW', cast=int, default=3600)
+OTP_AUDIT_DB = config('OTP_AUDIT_DB', cast=bool, default=False)
+OTP_AUDIT_RETENTION_DAYS = config('OTP_AUDIT_RETENTION_DAYS', cast=int, default=30)
+
 # SpotPlayer DRM Settings
 # https://spotplayer.ir/ — API key is copied from the panel dashboard
 SPOTPLAYER_API_KEY = config('SPOTPLAYER_API_KEY', default='')
@@ -384,6 +540,41 @@ except (ImportError, UndefinedValueError):
     LLM_BASE_URL = config('LLM_BASE_URL', default='https://arvancloudai.ir/gateway/models/DeepSeek-V4-Pro/XDSfG8DZnRv7J3fkDqL-w0BgaO__UP8UvQj3lJvG9IZCGm-wENAH5nIRVPrrsk7rnM8ddC7ZIcL_aNxBpRTfRmNy7X3N3CKEiKc4Rzol8liTH7WDcDovs3YQmVqUfWdXWvoWy9yTENirsPA6Wdbk2wq1DsOBFJbfP9yQh9Qfv8xArG7Q3RqqBr3XnhR-8QzWYmBe8dLF4l7spJYnp0s6ES9Y1-qWpB3vTZaTwvcGPEWcrIB6uWDhNXeWXeNcsxJteDJy1A/v1')
     LLM_MODEL = config('LLM_MODEL', default='DeepSeek-V4-Pro')
 
+# AI tutor provider (tickets/providers.py): 'openai' (LLM_* endpoint) or 'gemini'.
+# Empty picks the first one with an API key. The SDKs load on first use.
+AI_PROVIDER = config('AI_PROVIDER', default='')
+GEMINI_MODEL = config('GEMINI_MODEL', default='gemini-1.5-flash')
+# Streaming tutor (ws/ai/conversations/<id>/): pooled provider connections per
+# worker, the read timeout between streamed chunks, and how many answers a
+# worker streams at once (further questions wait up to AI_STREAM_QUEUE_TIMEOUT).
+AI_HTTP_MAX_CONNECTIONS = config('AI_HTTP_MAX_CONNECTIONS', default=20, cast=int)
+AI_HTTP_TIMEOUT = config('AI_HTTP_TIMEOUT', default=30.0, cast=float)
+AI_HTTP_CONNECT_TIMEOUT = config('AI_HTTP_CONNECT_TIMEOUT', default=5.0, cast=float)
+AI_STREAM_CONCURRENCY = config('AI_STREAM_CONCURRENCY', default=8, cast=int)
+AI_STREAM_QUEUE_TIMEOUT = config('AI_STREAM_QUEUE_TIMEOUT', default=30.0, cast=float)
+
+# Answer cache for stand-alone tutor questions (tickets/answer_cache.py), per
+# course. AI_CACHE_SIMILARITY is the MinHash similarity a near-identical
+# question needs to reuse an answer; 0 keeps exact (normalized) matches only.
+AI_CACHE_ENABLED = config('AI_CACHE_ENABLED', default=True, cast=bool)
+AI_CACHE_TTL = config('AI_CACHE_TTL', default=7 * 24 * 3600, cast=int)
+AI_CACHE_SIMILARITY = config('AI_CACHE_SIMILARITY', default=0.85, cast=float)
+AI_CACHE_MAX_CANDIDATES = config('AI_CACHE_MAX_CANDIDATES', default=200, cast=int)
+# Seconds between the jobs that store the cache's hit/miss counters and
+# delete expired answers
+AI_CACHE_MAINTENANCE_INTERVAL = config('AI_CACHE_MAINTENANCE_INTERVAL', default=300, cast=int)
+
+# AI quota windows: AIAccess.questions_used starts again from zero every
+# AI_QUOTA_WINDOW_DAYS days. 0 = one quota for the whole access period.
+AI_QUOTA_WINDOW_DAYS = config('AI_QUOTA_WINDOW_DAYS', default=0, cast=int)
+
+# Conversation context (tickets/context.py): approximate tokens of history sent
+# with each question (rolling summary + newest messages); older messages are
+# summarized in the background, at most AI_SUMMARY_MAX_INPUT_TOKENS per call.
+AI_CONTEXT_TOKEN_BUDGET = config('AI_CONTEXT_TOKEN_BUDGET', default=2000, cast=int)
+AI_CONTEXT_MAX_MESSAGES = config('AI_CONTEXT_MAX_MESSAGES', default=50, cast=int)
+AI_SUMMARY_MAX_INPUT_TOKENS = config('AI_SUMMARY_MAX_INPUT_TOKENS', default=6000, cast=int)
+
 # Logging Configuration
 LOGGING = {
     'version': 1,
@@ -401,6 +592,10 @@ LOGGING = {
             'format': '{asctime} {message}',
             'style': '{',
         },
+        'json_line': {
+            'format': '{message}',
+            'style': '{',
+        },
     },
     'handlers': {
         'file': {
@@ -420,6 +615,12 @@ LOGGING = {
             'filename': BASE_DIR / 'logs' / 'requests.log',
             'formatter': 'request',
         },
+        'slow_request_file': {
+            'level': 'INFO',
+            'class': 'logging.FileHandler',
+            'filename': SLOW_REQUEST_LOG,
+            'formatter': 'json_line',
+        },
     },
     'root': {
         'handlers': ['console', 'file'],
@@ -446,6 +647,11 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': False,
         },
+        'api.slow_requests': {
+            'handlers': ['slow_request_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
 
@@ -456,14 +662,60 @@ os.makedirs(BASE_DIR / 'logs', exist_ok=True)
 ASGI_APPLICATION = 'api.asgi.application'
 
 # InMemoryChannelLayer works fine with a single Daphne process.
-# If you ever scale to multiple workers, switch to RedisChannelLayer:
+# CHANNEL_LAYER=sqlite shares groups and messages between all Daphne processes
+# on one host through a WAL-mode SQLite file (see chat/layers.py).
+# For several hosts, switch to RedisChannelLayer:
 #   'BACKEND': 'channels_redis.core.RedisChannelLayer',
 #   'CONFIG': {"hosts": [(config('REDIS_HOST', default='127.0.0.1'), 6379)]},
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-    },
-}
+CHANNEL_LAYER = config('CHANNEL_LAYER', default='memory')
+if CHANNEL_LAYER == 'sqlite':
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'chat.layers.SQLiteChannelLayer',
+            'CONFIG': {
+                'path': config('CHANNEL_LAYER_PATH', default=str(BASE_DIR / 'channels.sqlite3')),
+                'capacity': config('CHANNEL_LAYER_CAPACITY', cast=int, default=100),
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+
+# Chat messages are broadcast immediately and written in batches (chat/writer.py)
+CHAT_FLUSH_BATCH_SIZE = config('CHAT_FLUSH_BATCH_SIZE', cast=int, default=100)
+CHAT_FLUSH_INTERVAL_MS = config('CHAT_FLUSH_INTERVAL_MS', cast=int, default=200)
+CHAT_MAX_PENDING = 5000
+# Per-user send limit: CHAT_RATE_LIMIT messages per CHAT_RATE_WINDOW seconds
+CHAT_RATE_LIMIT = config('CHAT_RATE_LIMIT', cast=int, default=5)
+CHAT_RATE_WINDOW = 3
+
+# Exam answer websocket (tests/consumers.py): answers are written in batches
+# (tests/answers.py) and the remaining time is pushed every EXAM_TICK_SECONDS
+ANSWER_FLUSH_BATCH_SIZE = config('ANSWER_FLUSH_BATCH_SIZE', cast=int, default=200)
+ANSWER_FLUSH_INTERVAL_MS = config('ANSWER_FLUSH_INTERVAL_MS', cast=int, default=250)
+EXAM_TICK_SECONDS = 10
+# Live exam monitor (tests/monitor.py): minimum seconds between two pushes
+EXAM_MONITOR_PUSH_SECONDS = 1
+# Exam login/logout audit rows are queued and written in batches
+# (tests/session_logs.py). With SESSION_LOG_SINK='file' they go to hourly
+# JSONL files in SESSION_LOG_DIR, loaded by `manage.py load_session_logs`.
+SESSION_LOG_SINK = config('SESSION_LOG_SINK', default='db')
+SESSION_LOG_DIR = config('SESSION_LOG_DIR', default=str(BASE_DIR / 'logs' / 'session_logs'))
+SESSION_LOG_BATCH_SIZE = config('SESSION_LOG_BATCH_SIZE', cast=int, default=500)
+SESSION_LOG_FLUSH_INTERVAL_MS = config('SESSION_LOG_FLUSH_INTERVAL_MS', cast=int, default=1000)
+
+
+# Background jobs (see jobs/queue.py). Run the worker with `python manage.py run_jobs`.
+# When True, jobs also run in-process right after the request's transaction
+# commits — handy for local development without a worker.
+JOBS_RUN_EAGERLY = config('JOBS_RUN_EAGERLY', cast=bool, default=False)
+# Succeeded jobs are deleted by the worker this many days after they finish
+# (0 keeps them forever). Dead jobs are kept for inspection.
+JOB_RETENTION_DAYS = config('JOB_RETENTION_DAYS', cast=int, default=7)
 
 
 # ---------------------------------------------------------------------------
@@ -740,6 +992,22 @@ UNFOLD = {
                     },
                 ],
             },
+            {
+                "title": "System",
+                "separator": True,
+                "items": [
+                    {
+                        "title": "Background Jobs",
+                        "icon": "pending_actions",
+                        "link": reverse_lazy("admin:jobs_job_changelist"),
+                    },
+                    {
+                        "title": "Dead Letter Jobs",
+                        "icon": "error",
+                        "link": reverse_lazy("admin:jobs_deadletterjob_changelist"),
+                    },
+                ],
+            },
         ],
     },
 }
@@ -0,0 +1,28 @@
+"""
+Test runner that keeps the suite off the host's shared cache.
+
+The default shared tier is a file (or Redis) that outlives the run and is
+shared with the running site, so `cache.clear()` in a test's setUp would wipe
+it and entries such as throttle histories or OTP rate-limit buckets would
+leak from one run into the next. The suite runs with a per-process LocMem
+shared tier instead; api/tests.py exercises SQLiteCache directly.
+"""
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        shared = {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'test-shared',
+            'TIMEOUT': settings.CACHE_TIMEOUT,
+        }
+        self._cache_settings = override_settings(CACHES={**settings.CACHES, 'shared': shared})
+        self._cache_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._cache_settings.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,314 @@
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from tests.models import StudentAnswer, StudentTestSession
+from .cache import (
+    SQLiteCache, TieredCache, cache_metrics, cached_query, invalidate_query, reset_cache_metrics,
+)
+from .db_routers import (
+    ExamShardRouter, ReplicaRouter, _cascade_into_shard, check_shard_parents, replica_reads, reset_replica_health,
+    use_replica,
+)
+from .profiling import StackSampler, fingerprint, reset_endpoint_summary
+
+
+class SQLiteCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.cache = SQLiteCache(os.path.join(directory, 'cache.sqlite3'), {})
+
+    def test_get_set_delete_expiry(self):
+        self.cache.set('a', {'x': 1})
+        self.assertEqual(self.cache.get('a'), {'x': 1})
+        self.cache.set('b', 1, timeout=-1)
+        self.assertIsNone(self.cache.get('b'))
+        self.assertTrue(self.cache.delete('a'))
+        self.assertEqual(self.cache.get('a', 'gone'), 'gone')
+
+    def test_add_and_incr_are_atomic_across_threads(self):
+        self.cache.set('counter', 0)
+        added = []
+
+        def worker():
+            added.append(self.cache.add('lock', 1))
+            for _ in range(20):
+                self.cache.incr('counter')
+
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(added.count(True), 1)
+        self.assertEqual(self.cache.get('counter'), 100)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+
+class TieredCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.tiered = TieredCache('', {'OPTIONS': {'SHARED': 'shared', 'LOCAL_TIMEOUT': 60}})
+        self.tiered.clear()
+
+    def test_suite_does_not_use_the_host_cache(self):
+        # api.test_runner.TestRunner: clearing caches in tests must not wipe the site's cache file
+        self.assertNotIsInstance(caches['shared'], SQLiteCache)
+
+    def test_only_query_keys_are_kept_locally(self):
+        self.tiered.set('q:test', 'cached')
+        self.tiered.set('throttle:test', 'shared')
+        self.tiered.shared.set('q:test', 'changed elsewhere')
+        self.tiered.shared.set('throttle:test', 'changed elsewhere')
+
+        self.assertEqual(self.tiered.get('q:test'), 'cached')
+        self.assertEqual(self.tiered.get('throttle:test'), 'changed elsewhere')
+
+        self.tiered.delete('q:test')
+        self.assertIsNone(self.tiered.get('q:test'))
+
+
+class CachedQueryTestCase(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        reset_cache_metrics()
+        self.calls = []
+
+        @cached_query('test-courses', tags=('courses',))
+        def list_courses(category):
+            self.calls.append(category)
+            return [category, len(self.calls)]
+
+        self.list_courses = list_courses
+
+    def test_hits_misses_and_metrics(self):
+        self.assertEqual(self.list_courses('math'), ['math', 1])
+        self.assertEqual(self.list_courses('math'), ['math', 1])
+        self.assertEqual(self.list_courses('physics'), ['physics', 2])
+
+        metrics = cache_metrics()['test-courses']
+        self.assertEqual(metrics['hits'], 1)
+        self.assertEqual(metrics['misses'], 2)
+        self.assertEqual(metrics['hit_ratio'], 0.333)
+
+    def test_invalidation_by_tag_and_name(self):
+        self.list_courses('math')
+        invalidate_query('courses')
+        self.assertEqual(self.list_courses('math'), ['math', 2])
+
+        self.list_courses.invalidate()
+        self.assertEqual(self.list_courses('math'), ['math', 3])
+        self.assertEqual(self.list_courses('math'), ['math', 3])
+
+
+class CacheStatsViewTestCase(TestCase):
+    def test_admin_only(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user(username='student', password='x', role='student'))
+        self.assertEqual(client.get('/api/admin/cache-stats/').status_code, 403)
+
+        client.force_authenticate(User.objects.create_user(username='admin', password='x', role='admin'))
+        response = client.get('/api/admin/cache-stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('caches', response.data)
+
+
+class QueryProfileTestCase(TestCase):
+    def setUp(self):
+        reset_endpoint_summary()
+        self.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_fingerprint_folds_literals(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'x'"),
+            fingerprint("SELECT  *  FROM t WHERE id IN (4, 5) AND name = 'it''s'"),
+        )
+        self.assertEqual(fingerprint('SELECT * FROM t WHERE id IN (%s, %s)'), 'SELECT * FROM t WHERE id IN (...)')
+
+    @override_settings(QUERY_PROFILE_HEADERS=True)
+    def test_headers_and_summary(self):
+        response = self.client.get('/api/admin/cache-stats/')
+        self.assertEqual(response['X-DB-Queries'], '0')
+        self.assertIn('db;dur=', response['Server-Timing'])
+
+        endpoints = self.client.get('/api/admin/query-stats/').json()['endpoints']
+        self.assertEqual(endpoints['cache-stats']['requests'], 1)
+        self.assertEqual(endpoints['cache-stats']['queries_max'], 0)
+
+        self.assertEqual(self.client.delete('/api/admin/query-stats/').status_code, 204)
+        self.assertNotIn('cache-stats', self.client.get('/api/admin/query-stats/').json()['endpoints'])
+
+    def test_admin_only(self):
+        self.client.force_authenticate(User.objects.create_user(username='student', password='x', role='student'))
+        self.assertEqual(self.client.get('/api/admin/query-stats/').status_code, 403)
+
+
+class SlowRequestLogTestCase(TestCase):
+    def setUp(self):
+        self.admin = User.objects.create_user(username='admin', password='x', role='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_request_is_logged(self):
+        with self.assertLogs('api.slow_requests', 'WARNING') as logs:
+            self.client.get('/api/admin/query-stats/')
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'query-stats')
+        self.assertEqual(record['role'], 'admin')
+        self.assertEqual(record['status'], 200)
+        self.assertIn('slowest_queries', record)
+
+    def test_fast_request_is_not_logged(self):
+        with self.assertNoLogs('api.slow_requests', 'WARNING'):
+            self.client.get('/api/admin/query-stats/')
+
+    def test_sampler_records_long_running_stacks(self):
+        sampler = StackSampler(interval=5, after=1)
+        sampler.start()
+        deadline = time.monotonic() + 0.2
+        while time.monotonic() < deadline:
+            pass
+        stacks = sampler.stop()
+        self.assertTrue(stacks)
+        self.assertIn('test_sampler_records_long_running_stacks', stacks.most_common(1)[0][0])
+
+    def test_report_ranks_endpoints(self):
+        path = os.path.join(tempfile.mkdtemp(), 'slow.log')
+        with open(path, 'w') as log:
+            for view, duration in (('create-report', 40000), ('create-report', 20000), ('folders-tree', 1500)):
+                log.write(json.dumps({
+                    'ts': '2026-01-01T00:00:00+00:00', 'view': view, 'role': 'teacher',
+                    'duration_ms': duration, 'db_ms': duration / 2, 'queries': 100,
+                    'slowest_queries': [{'ms': 50, 'sql': 'SELECT * FROM t WHERE id = 1'}],
+                    'stacks': [{'stack': 'a.py:f:1;b.py:g:2', 'samples': 3}],
+                }) + '\n')
+            log.write('not json\n')
+
+        out = io.StringIO()
+        call_command('slow_request_report', file=path, json=True, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual([row['view'] for row in report], ['create-report', 'folders-tree'])
+        self.assertEqual(report[0]['count'], 2)
+        self.assertEqual(report[0]['max_ms'], 40000)
+        self.assertEqual(report[0]['top_query']['sql'], 'SELECT * FROM t WHERE id = ?')
+        self.assertEqual(report[0]['top_frame'], {'frame': 'b.py:g:2', 'samples': 6})
+
+        out = io.StringIO()
+        call_command('slow_request_report', file=path, stdout=out)
+        self.assertIn('create-report', out.getvalue())
+
+
+class CopyDatabaseTestCase(TestCase):
+    def test_referenced_tables_are_copied_first(self):
+        from django.apps import apps
+        from tests.models import StudentAnswer, StudentTestSession, Test
+        from .management.commands.copy_database import copy_order
+
+        order = copy_order(list(reversed(apps.get_models(include_auto_created=True))))
+        self.assertEqual(len(order), len(set(order)))
+        positions = [order.index(model) for model in (User, Test, StudentTestSession, StudentAnswer)]
+        self.assertEqual(positions, sorted(positions))
+
+    def test_refuses_a_non_empty_target(self):
+        User.objects.create_user(username='existing', password='x')
+        source = os.path.join(tempfile.mkdtemp(), 'source.sqlite3')
+        open(source, 'w').close()
+        with self.assertRaisesMessage(CommandError, 'Target database is not empty'):
+            call_command('copy_database', source, stdout=io.StringIO())
+
+    def test_unknown_source(self):
+        with self.assertRaisesMessage(CommandError, 'neither a database alias nor a SQLite file'):
+            call_command('copy_database', '/nonexistent/db.sqlite3')
+
+
+@override_settings(REPLICA_DATABASE='default')
+class ReplicaRouterTestCase(TestCase):
+    def setUp(self):
+        reset_replica_health()
+        self.addCleanup(reset_replica_health)
+        self.router = ReplicaRouter()
+
+    def test_only_wrapped_reads_use_the_replica(self):
+        self.assertIsNone(self.router.db_for_read(User))
+        with replica_reads():
+            self.assertEqual(self.router.db_for_read(User), 'default')
+        self.assertIsNone(self.router.db_for_read(User))
+
+        @use_replica
+        def view():
+            return self.router.db_for_read(User)
+
+        self.assertEqual(view(), 'default')
+
+    @override_settings(REPLICA_DATABASE='missing')
+    def test_without_a_replica_reads_stay_on_the_primary(self):
+        with replica_reads():
+            self.assertIsNone(self.router.db_for_read(User))
+
+    def test_lagging_or_unreachable_replica_falls_back(self):
+        with mock.patch('api.db_routers.replica_lag', return_value=120) as lag, replica_reads():
+            self.assertIsNone(self.router.db_for_read(User))
+            self.assertIsNone(self.router.db_for_read(User))
+        # Measured once per DB_REPLICA_LAG_CHECK_SECONDS
+        self.assertEqual(lag.call_count, 1)
+
+        reset_replica_health()
+        with mock.patch('api.db_routers.replica_lag', side_effect=OperationalError), replica_reads():
+            self.assertIsNone(self.router.db_for_read(User))
+
+    def test_dashboard_served_through_the_router(self):
+        admin = User.objects.create_user(username='admin', password='x', role='admin')
+        client = APIClient()
+        client.force_authenticate(admin)
+        self.assertEqual(client.get('/api/finance/admin/dashboard/').status_code, 200)
+
+
+@override_settings(EXAM_SHARD_DATABASE='default')
+class ExamShardRouterTestCase(TestCase):
+    def setUp(self):
+        from tests.testing import create_exam
+        teacher = User.objects.create_user(username='teacher', password='x', role='teacher')
+        self.student = User.objects.create_user(username='student', password='x', role='student')
+        self.session = StudentTestSession.objects.create(user=self.student, test=create_exam(teacher), status='active')
+        self.router = ExamShardRouter()
+
+    def test_routes_only_sharded_models(self):
+        self.assertEqual(self.router.db_for_write(StudentAnswer), 'default')
+        self.assertIsNone(self.router.db_for_read(StudentTestSession))
+        self.assertTrue(self.router.allow_migrate('default', 'tests', 'studentanswer'))
+        self.assertFalse(self.router.allow_migrate('default', 'tests', 'studenttestsession'))
+        self.assertIsNone(self.router.allow_migrate('other', 'tests', 'studenttestsession'))
+        with override_settings(EXAM_SHARD_DATABASE='missing'):
+            self.assertIsNone(self.router.db_for_write(StudentAnswer))
+
+    def test_rows_need_an_existing_parent(self):
+        check_shard_parents(StudentAnswer, StudentAnswer(session_id=self.session.id, question_number=1))
+        with self.assertRaises(IntegrityError):
+            check_shard_parents(StudentAnswer, StudentAnswer(session_id=self.session.id + 1, question_number=1))
+
+    def test_parent_deletes_cascade_after_commit(self):
+        StudentAnswer.objects.create(session=self.session, question_number=1, answer=1)
+        cascade = _cascade_into_shard(StudentAnswer, StudentAnswer._meta.get_field('session'))
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            cascade(sender=StudentTestSession, instance=self.session, using='default')
+        self.assertTrue(StudentAnswer.objects.exists())
+
+        for callback in callbacks:
+            callback()
+        self.assertFalse(StudentAnswer.objects.exists())
@@ -19,6 +19,8 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from .views import CacheStatsView, QueryStatsView
+
 # Enhanced admin configuration
 admin.site.site_header = "سیستم مدیریت آرین تفضلی‌زاده"
 admin.site.site_title = "پنل مدیریت آرین تفضلی‌زاده"
@@ -41,7 +43,10 @@ urlpatterns = [
     path("api/spotplayer/", include("spotplayer.urls")),
     path("api/support/", include("tickets.urls")),
     path("api/knowledge/", include("knowledge.urls")),
+    path("api/chat/", include("chat.urls")),
     path("api/", include("blog.urls")),
+    path("api/admin/cache-stats/", CacheStatsView.as_view(), name="cache-stats"),
+    path("api/admin/query-stats/", QueryStatsView.as_view(), name="query-stats"),
     path('admin/', admin.site.urls),
 ]
 
@@ -0,0 +1,40 @@
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from accounts.permissions import IsAdmin
+from .cache import cache_metrics
+from .profiling import endpoint_summary, reset_endpoint_summary
+
+
+class CacheStatsView(APIView):
+    """
+    GET /api/admin/cache-stats/
+
+    Hit/miss counters of `cached_query` functions and local-tier hits, for
+    the worker process that serves the request. Admin only.
+    """
+
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        return Response({"caches": cache_metrics()})
+
+
+class QueryStatsView(APIView):
+    """
+    GET /api/admin/query-stats/
+
+    Query count, DB time, wall time and most repeated queries per URL name
+    over the recent requests of this worker process, worst first. DELETE
+    clears the window. Admin only.
+    """
+
+    permission_classes = [permissions.IsAuthenticated, IsAdmin]
+
+    def get(self, request):
+        return Response({"endpoints": endpoint_summary()})
+
+    def delete(self, request):
+        reset_endpoint_summary()
+        return Response(status=204)
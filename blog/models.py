@@ -2,6 +2,8 @@ from django.db import models
 from django.utils import timezone
 from django.utils.text import slugify
 from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
 
 
 class TimeStampedModel(models.Model):
@@ -111,3 +113,52 @@ class Comment(TimeStampedModel):
 	def __str__(self) -> str:
 		return f"Comment by {self.user} on {self.post}"
 
+
+
+# Cached post pages (see PostViewSet) are retired once the change commits
+
+@receiver(pre_save, sender=Post)
+def invalidate_renamed_post_page(sender, instance, **kwargs):
+	if instance.pk is None:
+		return
+	from api.cache import invalidate_on_commit
+	old_slug = Post.objects.filter(pk=instance.pk).values_list("slug", flat=True).first()
+	if old_slug and old_slug != instance.slug:
+		invalidate_on_commit(f"blog-post:{old_slug}")
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_pages(sender, instance, **kwargs):
+	from api.cache import invalidate_on_commit
+	invalidate_on_commit("blog-posts", f"blog-post:{instance.slug}")
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+@receiver(m2m_changed, sender=Post.categories.through)
+def invalidate_post_pages_on_taxonomy_change(sender, instance, action, reverse, **kwargs):
+	if not action.startswith("post_"):
+		return
+	from api.cache import invalidate_on_commit
+	if reverse:
+		invalidate_on_commit("blog-taxonomy")
+	else:
+		invalidate_on_commit("blog-posts", f"blog-post:{instance.slug}")
+
+
+@receiver(post_save, sender=PostImage)
+@receiver(post_delete, sender=PostImage)
+def invalidate_post_page_on_image_change(sender, instance, **kwargs):
+	from api.cache import invalidate_on_commit
+	slug = Post.objects.filter(pk=instance.post_id).values_list("slug", flat=True).first()
+	if slug:
+		invalidate_on_commit(f"blog-post:{slug}")
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_post_pages_on_taxonomy_edit(sender, instance, **kwargs):
+	from api.cache import invalidate_on_commit
+	invalidate_on_commit("blog-taxonomy")
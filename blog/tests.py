@@ -1,3 +1,59 @@
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from accounts.models import User
+from .models import Post, Tag
+
+
+class PostResponseCacheTestCase(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.author = User.objects.create_user(username="teacher", password="x", role="teacher")
+		self.post = Post.objects.create(
+			title="Hello", content="Body", author=self.author, status=Post.Status.PUBLISHED
+		)
+		self.client = APIClient()
+
+	def test_cached_detail_with_etag(self):
+		response = self.client.get(f"/api/blog/posts/{self.post.slug}/")
+		self.assertEqual(response.status_code, 200)
+		etag = response["ETag"]
+		self.assertIn("stale-while-revalidate=", response["Cache-Control"])
+		self.assertIn("public", response["Cache-Control"])
+
+		with self.assertNumQueries(0):
+			response = self.client.get(f"/api/blog/posts/{self.post.slug}/")
+		self.assertEqual(response["ETag"], etag)
+		self.assertEqual(response.json()["title"], "Hello")
+
+		with self.assertNumQueries(0):
+			response = self.client.get(f"/api/blog/posts/{self.post.slug}/", HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 304)
+		self.assertEqual(response.content, b"")
+
+	def test_saves_invalidate_cached_pages(self):
+		self.client.get("/api/blog/posts/")
+		etag = self.client.get(f"/api/blog/posts/{self.post.slug}/")["ETag"]
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.post.title = "Updated"
+			self.post.save()
+		response = self.client.get(f"/api/blog/posts/{self.post.slug}/", HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response.json()["title"], "Updated")
+		self.assertEqual(self.client.get("/api/blog/posts/").json()["results"][0]["title"], "Updated")
+
+		with self.captureOnCommitCallbacks(execute=True):
+			self.post.tags.add(Tag.objects.create(name="news"))
+		self.assertEqual(self.client.get(f"/api/blog/posts/{self.post.slug}/").json()["tags"][0]["name"], "news")
+
+	def test_drafts_are_not_cached_for_their_author(self):
+		draft = Post.objects.create(title="Draft", content="Body", author=self.author)
+		self.client.force_authenticate(self.author)
+		response = self.client.get(f"/api/blog/posts/{draft.slug}/")
+		self.assertEqual(response.status_code, 200)
+		self.assertNotIn("ETag", response)
+
+		self.client.force_authenticate(None)
+		self.assertEqual(self.client.get(f"/api/blog/posts/{draft.slug}/").status_code, 404)
@@ -2,6 +2,7 @@ from rest_framework import viewsets, permissions, filters
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from django.db.models import Q
+from api.http_cache import cache_response
 from .models import Post, Tag, Category, Comment
 from .serializers import (
 	PostListSerializer, PostDetailSerializer, PostWriteSerializer,
@@ -27,6 +28,14 @@ class IsAdminOrTeacher(permissions.BasePermission):
 		return (getattr(request.user, "role", None) == "teacher" and obj.author_id == request.user.id) or request.user.is_staff or request.user.is_superuser
 
 
+def published_only_variant(request):
+	# Teachers and staff may also see drafts; everyone else sees the same published posts
+	u = request.user
+	if u.is_authenticated and (getattr(u, "role", None) == "teacher" or u.is_staff or u.is_superuser):
+		return None
+	return ""
+
+
 class PostViewSet(viewsets.ModelViewSet):
 	queryset = Post.objects.select_related("author").prefetch_related("tags", "categories")
 	permission_classes = [IsAdminOrTeacher]
@@ -56,6 +65,14 @@ class PostViewSet(viewsets.ModelViewSet):
 			return qs.filter(status=Post.Status.PUBLISHED)
 		return qs
 
+	@cache_response("blog-posts", tags=("blog-taxonomy",), variant=published_only_variant)
+	def list(self, request, *args, **kwargs):
+		return super().list(request, *args, **kwargs)
+
+	@cache_response("blog-post", tags=("blog-post:{slug}", "blog-taxonomy"), variant=published_only_variant)
+	def retrieve(self, request, *args, **kwargs):
+		return super().retrieve(request, *args, **kwargs)
+
 	@action(detail=True, methods=["post"], permission_classes=[permissions.IsAuthenticated])
 	def publish(self, request, slug=None):
 		post = self.get_object()
@@ -1,17 +1,54 @@
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import ChatMessage
+from .history import get_recent_messages, visible_to
+from .writer import chat_rate_limiter, chat_writer
 from courses.models import Course
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+
+def course_group_name(course_id):
+    """Everyone connected to the course chat."""
+    return f'chat_{course_id}'
+
+
+def teacher_group_name(course_id):
+    """The course teacher's connections; receives every message in private mode."""
+    return f'chat_{course_id}_teacher'
+
+
+def user_group_name(course_id, user_id):
+    """One user's connections (all tabs); receives their own private-mode messages."""
+    return f'chat_{course_id}_user_{user_id}'
+
+
 class ChatConsumer(AsyncWebsocketConsumer):
+    """
+    Course chat.
+
+    The course's teacher and chat mode are loaded once at connect and kept up
+    to date by `course_updated` group events, and messages are written in
+    batches by `chat.writer`, so sending and fanning out a message never waits
+    on the database. Private mode is
+    enforced by routing rather than per-recipient filtering: teacher messages
+    go to the whole course group, student messages only to the teacher group
+    and the sender's own user group.
+    """
+
     async def connect(self):
         self.course_id = self.scope['url_route']['kwargs']['course_id']
-        self.course_group_name = f'chat_{self.course_id}'
+        self.course_group_name = course_group_name(self.course_id)
         self.user = self.scope['user']
+        self.groups_joined = []
+
+        course = await self.get_course_state()
+        if course is None:
+            await self.close()
+            return
+        self.teacher_id = course['teacher_id']
+        self.chat_mode = course['chat_mode']
 
         # Allow anonymous users for chat
         # if not self.user.is_authenticated:
@@ -23,11 +60,12 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
-        # Join room group
-        await self.channel_layer.group_add(
-            self.course_group_name,
-            self.channel_name
-        )
+        # Join room group, plus the teacher / per-user groups used in private mode
+        await self.join_group(self.course_group_name)
+        if self.user.is_authenticated:
+            await self.join_group(user_group_name(self.course_id, self.user.id))
+            if self.is_teacher:
+                await self.join_group(teacher_group_name(self.course_id))
 
         await self.accept()
 
@@ -38,13 +76,32 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'messages': messages
         }))
 
-
     async def disconnect(self, close_code):
-        # Leave room group
-        await self.channel_layer.group_discard(
-            self.course_group_name,
-            self.channel_name
-        )
+        # Leave room groups
+        for group in getattr(self, 'groups_joined', []):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def join_group(self, group):
+        await self.channel_layer.group_add(group, self.channel_name)
+        self.groups_joined.append(group)
+
+    async def leave_group(self, group):
+        await self.channel_layer.group_discard(group, self.channel_name)
+        if group in self.groups_joined:
+            self.groups_joined.remove(group)
+
+    @property
+    def is_teacher(self):
+        return self.user.is_authenticated and self.teacher_id is not None and self.user.id == self.teacher_id
+
+    def target_groups(self):
+        """Groups a message sent by this connection's user is delivered to."""
+        if self.chat_mode != 'private' or self.is_teacher:
+            return [self.course_group_name]
+        groups = [teacher_group_name(self.course_id)]
+        if self.user.is_authenticated:
+            groups.append(user_group_name(self.course_id, self.user.id))
+        return groups
 
     # Receive message from WebSocket
     async def receive(self, text_data):
@@ -54,110 +111,58 @@ class ChatConsumer(AsyncWebsocketConsumer):
         if not message:
             return
 
-        # Save message to database
-        new_message = await self.save_message(message)
-
-        # Send message to room group
-        await self.channel_layer.group_send(
-            self.course_group_name,
-            {
-                'type': 'chat_message',
-                'message': {
-                    'id': new_message.id,
-                    'user': self.user.username if self.user.is_authenticated else 'Anonymous',
-                    'user_id': self.user.id if self.user.is_authenticated else None,
-                    'first_name': self.user.first_name if self.user.is_authenticated else '',
-                    'last_name': self.user.last_name if self.user.is_authenticated else '',
-                    'message': new_message.message,
-                    'timestamp': new_message.timestamp.isoformat()
-                }
-            }
+        retry_after = chat_rate_limiter.allow(self.user.id if self.user.is_authenticated else self.channel_name)
+        if retry_after:
+            await self.send(text_data=json.dumps({
+                'type': 'rate_limited',
+                'retry_after': round(retry_after, 1)
+            }))
+            return
+
+        # Queue for a batched write and broadcast right away with a provisional id
+        new_message = await chat_writer.submit(
+            self.course_id,
+            self.user if self.user.is_authenticated else None,
+            message
         )
 
+        event = {
+            'type': 'chat_message',
+            'message': new_message,
+        }
+        for group in self.target_groups():
+            await self.channel_layer.group_send(group, event)
+
     # Receive message from room group
     async def chat_message(self, event):
-        message = event['message']
-        
-        # Check if user should see this message based on chat mode
-        should_show_message = await self.should_show_message(message)
-        
-        if should_show_message:
-            # Send message to WebSocket
-            await self.send(text_data=json.dumps({
-                'type': 'chat_message',
-                'message': message
-            }))
+        # Visibility was decided when the message was routed
+        await self.send(text_data=json.dumps({
+            'type': 'chat_message',
+            'message': event['message']
+        }))
+
+    async def course_updated(self, event):
+        """Refresh the cached course state after the course was saved."""
+        was_teacher = self.is_teacher
+        self.teacher_id = event['teacher_id']
+        self.chat_mode = event['chat_mode']
+
+        if self.is_teacher and not was_teacher:
+            await self.join_group(teacher_group_name(self.course_id))
+        elif was_teacher and not self.is_teacher:
+            await self.leave_group(teacher_group_name(self.course_id))
 
     @database_sync_to_async
-    def should_show_message(self, message):
-        try:
-            course = Course.objects.get(id=self.course_id)
-            
-            # اگر کاربر معلم است، همیشه همه پیام‌ها را می‌بیند
-            if self.user.is_authenticated and self.user == course.teacher:
-                return True
-            
-            # اگر mode public است، همه می‌توانند همه پیام‌ها را ببینند
-            if course.chat_mode == 'public':
-                return True
-            
-            # اگر mode private است، دانش‌آموزان فقط پیام‌های خودشان و معلم را می‌بینند
-            if course.chat_mode == 'private':
-                # اگر پیام از معلم است یا از خود کاربر است (برای authenticated)
-                if message['user_id'] == course.teacher.id or (self.user.is_authenticated and message['user_id'] == self.user.id):
-                    return True
-                return False
-            
-            return True  # default: نمایش پیام
-        except Course.DoesNotExist:
-            return False
+    def get_course_state(self):
+        return Course.objects.filter(id=self.course_id).values('teacher_id', 'chat_mode').first()
 
     @database_sync_to_async
     def is_user_in_course(self):
-        try:
-            course = Course.objects.get(id=self.course_id)
-            if self.user == course.teacher or self.user in course.students.all():
-                return True
-        except Course.DoesNotExist:
-            return False
-        return False
+        if self.is_teacher:
+            return True
+        return Course.students.through.objects.filter(course_id=self.course_id, user_id=self.user.id).exists()
 
     @database_sync_to_async
     def get_last_50_messages(self):
-        try:
-            course = Course.objects.get(id=self.course_id)
-            messages = ChatMessage.objects.filter(course_id=self.course_id).order_by('-timestamp')[:50]
-            
-            filtered_messages = []
-            for msg in reversed(messages):
-                message_data = {
-                    'id': msg.id,
-                    'user': msg.user.username,
-                    'user_id': msg.user.id,
-                    'first_name': msg.user.first_name,
-                    'last_name': msg.user.last_name,
-                    'message': msg.message,
-                    'timestamp': msg.timestamp.isoformat()
-                }
-                
-                # بررسی اینکه آیا کاربر باید این پیام را ببیند یا نه
-                should_show = True
-                if course.chat_mode == 'private' and self.user.is_authenticated and self.user != course.teacher:
-                    # در حالت private، دانش‌آموزان فقط پیام‌های خودشان و معلم را می‌بینند
-                    if msg.user and msg.user.id != course.teacher.id and msg.user.id != self.user.id:
-                        should_show = False
-                
-                if should_show:
-                    filtered_messages.append(message_data)
-                    
-            return filtered_messages
-        except Course.DoesNotExist:
-            return []
-
-    @database_sync_to_async
-    def save_message(self, message):
-        return ChatMessage.objects.create(
-            course_id=self.course_id,
-            user=self.user if self.user.is_authenticated else None,
-            message=message
-        )
+        user_id = self.user.id if self.user.is_authenticated else None
+        return visible_to(get_recent_messages(self.course_id), user_id, self.teacher_id, self.chat_mode)
@@ -0,0 +1,82 @@
+"""
+Recent chat history.
+
+The last HISTORY_SIZE serialized messages of each course are kept in the
+cache as a ring buffer: appended when a message is saved and served to every
+connecting client, so a burst of joins at the start of a live class does not
+hit the database. On a cold buffer the messages are loaded once with their
+users in a single query. Use a shared cache backend when several Daphne
+processes serve the chat; appends are serialized with a cache.add lock so
+processes do not overwrite each other's messages.
+"""
+import time
+
+from django.core.cache import cache
+
+from .models import ChatMessage
+
+HISTORY_SIZE = 50
+HISTORY_TIMEOUT = 60 * 60
+# How long an append waits for another process's append before giving up
+APPEND_LOCK_WAIT = 0.5
+
+
+def history_cache_key(course_id):
+    return f'chat:history:{course_id}'
+
+
+def serialize_message(message):
+    user = message.user
+    return {
+        'id': message.id,
+        'user': user.username if user else 'Anonymous',
+        'user_id': user.id if user else None,
+        'first_name': user.first_name if user else '',
+        'last_name': user.last_name if user else '',
+        'message': message.message,
+        'timestamp': message.timestamp.isoformat(),
+    }
+
+
+def get_recent_messages(course_id):
+    """Return up to HISTORY_SIZE recent messages of the course, oldest first."""
+    messages = cache.get(history_cache_key(course_id))
+    if messages is None:
+        rows = (
+            ChatMessage.objects.filter(course_id=course_id)
+            .select_related('user')
+            .order_by('-timestamp', '-id')[:HISTORY_SIZE]
+        )
+        messages = [serialize_message(message) for message in reversed(rows)]
+        cache.set(history_cache_key(course_id), messages, HISTORY_TIMEOUT)
+    return messages
+
+
+def append_messages(course_id, new_messages):
+    """Push serialized messages onto the course's buffer, dropping the oldest."""
+    key = history_cache_key(course_id)
+    lock_key = f'lock:{key}'
+    deadline = time.monotonic() + APPEND_LOCK_WAIT
+    while not cache.add(lock_key, 1, 5):
+        if time.monotonic() >= deadline:
+            # Rather than risk losing a message, let the next reader rebuild from the database
+            cache.delete(key)
+            return
+        time.sleep(0.01)
+
+    try:
+        messages = cache.get(key)
+        if messages is None:
+            # Cold buffer: the next reader loads it from the database, new rows included
+            return
+        messages.extend(new_messages)
+        cache.set(key, messages[-HISTORY_SIZE:], HISTORY_TIMEOUT)
+    finally:
+        cache.delete(lock_key)
+
+
+def visible_to(messages, user_id, teacher_id, chat_mode):
+    """Apply private-mode visibility: students see only the teacher's messages and their own."""
+    if chat_mode != 'private' or user_id is None or user_id == teacher_id:
+        return messages
+    return [m for m in messages if m['user_id'] in (teacher_id, user_id)]
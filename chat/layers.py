@@ -0,0 +1,310 @@
+"""
+SQLite channel layer.
+
+A channel layer that spans every Daphne process on one host without running
+Redis: messages and group memberships live in a small SQLite database in WAL
+mode, separate from the application database.
+
+Each process polls only for messages addressed to its own channels (one
+`DELETE ... RETURNING` per poll, so a message is delivered exactly once) and
+dispatches them to in-process queues. A channel's queue lives while something
+receives on it: it is dropped when `receive()` is cancelled (the consumer
+disconnected), and messages for channels without one are discarded. Polling
+backs off while idle and tightens again as soon as traffic arrives.
+
+Backpressure follows the channels spec: `send` raises ChannelFull once a
+channel has `capacity` undelivered messages and `group_send` skips full
+channels. Undelivered messages expire after `expiry` seconds, and a channel
+with an expired message is dropped from its groups, which is how connections of
+a dead process are evicted. Group memberships expire after `group_expiry`.
+
+Requires SQLite 3.35+ (RETURNING). Messages must be JSON-serializable.
+"""
+import asyncio
+import json
+import logging
+import random
+import sqlite3
+import string
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from channels.exceptions import ChannelFull
+from channels.layers import BaseChannelLayer
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS channel_messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    prefix TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    body TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS channel_messages_prefix ON channel_messages (prefix, id);
+CREATE INDEX IF NOT EXISTS channel_messages_channel ON channel_messages (channel);
+CREATE INDEX IF NOT EXISTS channel_messages_expires ON channel_messages (expires);
+CREATE TABLE IF NOT EXISTS channel_groups (
+    group_name TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (group_name, channel)
+) WITHOUT ROWID;
+"""
+
+
+class SQLiteChannelLayer(BaseChannelLayer):
+    extensions = ["groups", "flush"]
+
+    def __init__(
+        self,
+        path=None,
+        expiry=60,
+        group_expiry=86400,
+        capacity=100,
+        channel_capacity=None,
+        poll_interval=0.005,
+        max_poll_interval=0.1,
+        batch_size=500,
+        cleanup_interval=10,
+        **kwargs,
+    ):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity, **kwargs)
+        if path is None:
+            from django.conf import settings
+            path = settings.BASE_DIR / 'channels.sqlite3'
+        self.path = str(path)
+        self.group_expiry = group_expiry
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.batch_size = batch_size
+        self.cleanup_interval = cleanup_interval
+        self.client_prefix = "".join(random.choice(string.ascii_letters) for _ in range(12))
+
+        # All SQLite work for this process goes through one thread and one connection
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='sqlite-channel-layer')
+        self._db = None
+        self._last_cleanup = 0.0
+        self._loop = None
+        self._queues = {}
+        self._pollers = {}
+
+    # Database access (runs on the executor thread)
+
+    def _connection(self):
+        if self._db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(SCHEMA)
+            self._db = db
+        return self._db
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _cleanup(self, db, now):
+        if now - self._last_cleanup < self.cleanup_interval:
+            return
+        self._last_cleanup = now
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute(
+                'DELETE FROM channel_groups WHERE expires < ? OR channel IN '
+                '(SELECT DISTINCT channel FROM channel_messages WHERE expires < ?)',
+                (now, now),
+            )
+            db.execute('DELETE FROM channel_messages WHERE expires < ?', (now,))
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+
+    def _send(self, channel, body):
+        db = self._connection()
+        now = time.time()
+        self._cleanup(db, now)
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            (queued,) = db.execute('SELECT COUNT(*) FROM channel_messages WHERE channel = ?', (channel,)).fetchone()
+            if queued >= self.get_capacity(channel):
+                raise ChannelFull(channel)
+            db.execute(
+                'INSERT INTO channel_messages (prefix, channel, body, expires) VALUES (?, ?, ?, ?)',
+                (self.non_local_name(channel), channel, body, now + self.expiry),
+            )
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+
+    def _group_send(self, group, body):
+        db = self._connection()
+        now = time.time()
+        self._cleanup(db, now)
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            channels = [
+                row[0] for row in db.execute(
+                    'SELECT channel FROM channel_groups WHERE group_name = ? AND expires >= ?', (group, now)
+                )
+            ]
+            queued = dict(db.execute(
+                'SELECT channel, COUNT(*) FROM channel_messages WHERE channel IN '
+                '(SELECT channel FROM channel_groups WHERE group_name = ?) GROUP BY channel',
+                (group,),
+            ).fetchall())
+            rows = [
+                (self.non_local_name(channel), channel, body, now + self.expiry)
+                for channel in channels
+                if queued.get(channel, 0) < self.get_capacity(channel)
+            ]
+            db.executemany(
+                'INSERT INTO channel_messages (prefix, channel, body, expires) VALUES (?, ?, ?, ?)', rows
+            )
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        if len(rows) < len(channels):
+            logger.warning("Group %s: skipped %s full channel(s)", group, len(channels) - len(rows))
+        return len(rows)
+
+    def _claim(self, prefix):
+        rows = self._connection().execute(
+            'DELETE FROM channel_messages WHERE id IN '
+            '(SELECT id FROM channel_messages WHERE prefix = ? ORDER BY id LIMIT ?) '
+            'RETURNING id, channel, body, expires',
+            (prefix, self.batch_size),
+        ).fetchall()
+        rows.sort()
+        return rows
+
+    def _group_add(self, group, channel):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO channel_groups (group_name, channel, expires) VALUES (?, ?, ?)',
+            (group, channel, time.time() + self.group_expiry),
+        )
+
+    def _group_discard(self, group, channel):
+        self._connection().execute(
+            'DELETE FROM channel_groups WHERE group_name = ? AND channel = ?', (group, channel)
+        )
+
+    def _flush(self):
+        db = self._connection()
+        db.execute('DELETE FROM channel_messages')
+        db.execute('DELETE FROM channel_groups')
+
+    def _close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    # Channel layer API
+
+    async def send(self, channel, message):
+        assert isinstance(message, dict), "message is not a dict"
+        self.require_valid_channel_name(channel)
+        assert "__asgi_channel__" not in message
+        await self._run(self._send, channel, json.dumps(message))
+
+    async def receive(self, channel):
+        self.require_valid_channel_name(channel)
+        self._bind_loop()
+        queue = self._queue(channel)
+        self._ensure_poller(self.non_local_name(channel))
+        try:
+            while True:
+                expires, message = await queue.get()
+                if expires >= time.time():
+                    return message
+        except asyncio.CancelledError:
+            # Channels cancels receive() when the consumer exits; drop its
+            # queue like channels_redis drops its receive buffer
+            if self._queues.get(channel) is queue:
+                del self._queues[channel]
+            raise
+
+    async def new_channel(self, prefix="specific."):
+        return "%s.%s!%s" % (
+            prefix,
+            self.client_prefix,
+            "".join(random.choice(string.ascii_letters) for _ in range(12)),
+        )
+
+    async def group_add(self, group, channel):
+        self.require_valid_group_name(group)
+        self.require_valid_channel_name(channel)
+        await self._run(self._group_add, group, channel)
+
+    async def group_discard(self, group, channel):
+        self.require_valid_channel_name(channel)
+        self.require_valid_group_name(group)
+        await self._run(self._group_discard, group, channel)
+
+    async def group_send(self, group, message):
+        assert isinstance(message, dict), "Message is not a dict"
+        self.require_valid_group_name(group)
+        await self._run(self._group_send, group, json.dumps(message))
+
+    async def flush(self):
+        self._stop_pollers()
+        self._queues = {}
+        await self._run(self._flush)
+
+    async def close(self):
+        self._stop_pollers()
+        await self._run(self._close)
+
+    # Local delivery
+
+    def _bind_loop(self):
+        # Queues and pollers belong to one event loop (async_to_sync in tests
+        # spins up fresh loops); start over when the loop changes.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._stop_pollers()
+            self._queues = {}
+            self._loop = loop
+
+    def _queue(self, channel):
+        if channel not in self._queues:
+            self._queues[channel] = asyncio.Queue(maxsize=self.get_capacity(channel))
+        return self._queues[channel]
+
+    def _ensure_poller(self, prefix):
+        poller = self._pollers.get(prefix)
+        if poller is None or poller.done():
+            self._pollers[prefix] = asyncio.ensure_future(self._poll(prefix))
+
+    def _stop_pollers(self):
+        for poller in self._pollers.values():
+            poller.cancel()
+        self._pollers = {}
+
+    async def _poll(self, prefix):
+        interval = self.poll_interval
+        while True:
+            try:
+                rows = await self._run(self._claim, prefix)
+            except sqlite3.OperationalError:
+                logger.exception("Channel layer poll failed for %s", prefix)
+                rows = []
+
+            for _id, channel, body, expires in rows:
+                queue = self._queues.get(channel)
+                if queue is None:
+                    # Its consumer is gone
+                    continue
+                try:
+                    queue.put_nowait((expires, json.loads(body)))
+                except asyncio.QueueFull:
+                    logger.warning("Channel %s is full; dropping message", channel)
+
+            if rows:
+                interval = self.poll_interval
+            else:
+                interval = min(interval * 2, self.max_poll_interval)
+                await asyncio.sleep(interval)
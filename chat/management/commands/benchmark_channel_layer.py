@@ -0,0 +1,90 @@
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from chat.layers import SQLiteChannelLayer
+
+
+class Command(BaseCommand):
+    help = "Compare the in-memory and SQLite channel layers: messages per second and group fan-out latency."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--messages',
+            type=int,
+            default=2000,
+            help='Messages sent point-to-point for the throughput run (default: 2000)',
+        )
+        parser.add_argument(
+            '--group-size',
+            type=int,
+            default=200,
+            help='Channels in the group for the fan-out run (default: 200)',
+        )
+        parser.add_argument(
+            '--rounds',
+            type=int,
+            default=20,
+            help='group_send rounds for the fan-out run (default: 20)',
+        )
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            layers = {
+                'memory': lambda: InMemoryChannelLayer(capacity=options['messages']),
+                'sqlite': lambda: SQLiteChannelLayer(
+                    path=os.path.join(tmp, 'channels.sqlite3'), capacity=options['messages']
+                ),
+            }
+            for name, make_layer in layers.items():
+                throughput = asyncio.run(self._throughput(make_layer(), options['messages']))
+                latencies = asyncio.run(self._fan_out(make_layer(), options['group_size'], options['rounds']))
+                self.stdout.write(
+                    f"{name:<8} {throughput:>10.0f} msg/s   "
+                    f"fan-out to {options['group_size']}: "
+                    f"mean {statistics.mean(latencies) * 1000:.1f} ms, "
+                    f"p95 {self._p95(latencies) * 1000:.1f} ms"
+                )
+
+    @staticmethod
+    def _p95(values):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * 0.95))]
+
+    async def _throughput(self, layer, count):
+        channel = await layer.new_channel()
+        started = time.perf_counter()
+
+        async def consume():
+            for _ in range(count):
+                await layer.receive(channel)
+
+        consumer = asyncio.ensure_future(consume())
+        for i in range(count):
+            await layer.send(channel, {'type': 'bench', 'i': i})
+        await consumer
+        elapsed = time.perf_counter() - started
+        await layer.flush()
+        await layer.close()
+        return count / elapsed
+
+    async def _fan_out(self, layer, group_size, rounds):
+        channels = [await layer.new_channel() for _ in range(group_size)]
+        for channel in channels:
+            await layer.group_add('bench', channel)
+
+        latencies = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            await layer.group_send('bench', {'type': 'bench'})
+            await asyncio.gather(*(layer.receive(channel) for channel in channels))
+            latencies.append(time.perf_counter() - started)
+
+        await layer.flush()
+        await layer.close()
+        return latencies
@@ -1,7 +1,8 @@
-import jwt
-from django.conf import settings
 from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, TokenError
+from accounts.auth_cache import get_cached_user
 from channels.db import database_sync_to_async
 from channels.middleware import BaseMiddleware
 from urllib.parse import parse_qs
@@ -11,13 +12,13 @@ User = get_user_model()
 @database_sync_to_async
 def get_user_from_token(token):
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=['HS256'])
-        user_id = payload.get('user_id')
-        if user_id:
-            user = User.objects.get(id=user_id)
+        user_id = AccessToken(token).get(api_settings.USER_ID_CLAIM)
+    except TokenError:
+        return AnonymousUser()
+    if user_id:
+        user = get_cached_user(user_id)
+        if user is not None and user.is_active:
             return user
-    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError, User.DoesNotExist):
-        pass
     return AnonymousUser()
 
 class JWTAuthMiddleware(BaseMiddleware):
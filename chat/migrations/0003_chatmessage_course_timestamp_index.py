@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-19 10:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_alter_chatmessage_user'),
+        ('courses', '0013_course_spotplayer_course_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['course', 'timestamp', 'id'], name='chat_msg_course_ts_idx'),
+        ),
+    ]
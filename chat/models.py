@@ -1,16 +1,54 @@
-from django.db import models
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import models, transaction
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
 from courses.models import Course
 
 class ChatMessage(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='chat_messages')
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
     message = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the message is sent, not when its batch is written (see chat/writer.py)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
 
     def __str__(self):
         return f'Message from {self.user.username} in {self.course.title} at {self.timestamp}'
 
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            # Keyset pagination of a course's history on (timestamp, id)
+            models.Index(fields=['course', 'timestamp', 'id'], name='chat_msg_course_ts_idx'),
+        ]
 
+
+
+@receiver(post_save, sender=Course)
+def broadcast_course_update(sender, instance, created, **kwargs):
+    """
+    Push the course's teacher and chat mode to connected chat consumers, which
+    cache them at connect instead of reading the course for every message.
+    """
+    if created:
+        return
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    event = {
+        'type': 'course_updated',
+        'teacher_id': instance.teacher_id,
+        'chat_mode': instance.chat_mode,
+    }
+    group = f'chat_{instance.id}'
+    transaction.on_commit(lambda: async_to_sync(channel_layer.group_send)(group, event), robust=True)
+
+
+@receiver(post_delete, sender=ChatMessage)
+def drop_cached_history(sender, instance, **kwargs):
+    """Moderated (deleted) messages must not linger in the recent-history buffer."""
+    from .history import history_cache_key
+    cache.delete(history_cache_key(instance.course_id))
@@ -1,3 +1,325 @@
-from django.test import TestCase
+import asyncio
+import os
+import tempfile
+from datetime import datetime
+from unittest import mock
 
-# Create your tests here.
+from channels.db import database_sync_to_async
+from channels.exceptions import ChannelFull
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import OperationalError
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+
+from courses.models import Course
+
+from .history import HISTORY_SIZE, append_messages, get_recent_messages, history_cache_key
+from .layers import SQLiteChannelLayer
+from .models import ChatMessage
+from .writer import ChatMessageWriter, RateLimiter, chat_writer
+from .routing import websocket_urlpatterns
+
+User = get_user_model()
+
+
+class ChatConsumerTestCase(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user(username='teacher', password='x', role='teacher')
+        self.alice = User.objects.create_user(username='alice', password='x', role='student')
+        self.bob = User.objects.create_user(username='bob', password='x', role='student')
+        self.outsider = User.objects.create_user(username='outsider', password='x', role='student')
+        self.course = Course.objects.create(title='Course', teacher=self.teacher, chat_mode='private')
+        self.course.students.add(self.alice, self.bob)
+
+    def tearDown(self):
+        chat_writer.flush_sync()
+
+    async def _connect(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{self.course.id}/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        if connected:
+            history = await communicator.receive_json_from()
+            self.assertEqual(history['type'], 'last_50_messages')
+        return communicator, connected
+
+    async def _texts(self, communicator):
+        texts = []
+        while not await communicator.receive_nothing(timeout=0.1):
+            texts.append((await communicator.receive_json_from())['message']['message'])
+        return sorted(texts)
+
+    async def test_private_mode_routes_student_messages_to_teacher_only(self):
+        teacher, _ = await self._connect(self.teacher)
+        alice, _ = await self._connect(self.alice)
+        bob, _ = await self._connect(self.bob)
+
+        await alice.send_json_to({'message': 'from alice'})
+        await teacher.send_json_to({'message': 'from teacher'})
+
+        self.assertEqual(await self._texts(teacher), ['from alice', 'from teacher'])
+        self.assertEqual(await self._texts(alice), ['from alice', 'from teacher'])
+        self.assertEqual(await self._texts(bob), ['from teacher'])
+
+        for communicator in (teacher, alice, bob):
+            await communicator.disconnect()
+
+    async def test_course_update_switches_routing(self):
+        alice, _ = await self._connect(self.alice)
+        bob, _ = await self._connect(self.bob)
+
+        self.course.chat_mode = 'public'
+        await database_sync_to_async(self.course.save)()
+        await alice.send_json_to({'message': 'hello'})
+
+        self.assertEqual(await self._texts(bob), ['hello'])
+
+        for communicator in (alice, bob):
+            await communicator.disconnect()
+
+    async def test_history_is_served_from_buffer(self):
+        await database_sync_to_async(ChatMessage.objects.create)(course=self.course, user=self.bob, message='old')
+        alice, _ = await self._connect(self.alice)
+        await alice.send_json_to({'message': 'new'})
+        await self._texts(alice)
+        await chat_writer.flush()
+
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{self.course.id}/')
+        communicator.scope['user'] = self.teacher
+        await communicator.connect()
+        history = await communicator.receive_json_from()
+        self.assertEqual([m['message'] for m in history['messages']], ['old', 'new'])
+
+        for c in (alice, communicator):
+            await c.disconnect()
+
+    async def test_non_member_is_rejected(self):
+        _, connected = await self._connect(self.outsider)
+        self.assertFalse(connected)
+
+        anonymous, connected = await self._connect(AnonymousUser())
+        self.assertTrue(connected)
+        await anonymous.disconnect()
+
+
+class ChatMessageWriterTestCase(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user(username='teacher', password='x', role='teacher')
+        self.course = Course.objects.create(title='Course', teacher=self.teacher)
+
+    async def test_messages_are_written_in_batches(self):
+        writer = ChatMessageWriter(batch_size=3, flush_interval=50)
+        sent = [await writer.submit(self.course.id, self.teacher, f'm{i}') for i in range(3)]
+
+        self.assertTrue(all(m['id'].startswith('p-') for m in sent))
+        await writer._flushing
+        count = database_sync_to_async(ChatMessage.objects.count)
+        self.assertEqual(await count(), 3)
+
+        # A partial batch is written once the flush interval passes
+        sent.append(await writer.submit(self.course.id, self.teacher, 'm3'))
+        self.assertEqual(await count(), 3)
+        await writer._timer
+        self.assertEqual(await count(), 4)
+        stored = await database_sync_to_async(lambda: list(ChatMessage.objects.values_list('message', 'timestamp')))()
+        self.assertEqual(
+            sorted(stored),
+            sorted((m['message'], datetime.fromisoformat(m['timestamp'])) for m in sent),
+        )
+
+    async def test_failed_batch_is_retried_without_new_messages(self):
+        writer = ChatMessageWriter(batch_size=10, flush_interval=20)
+        bulk_create = ChatMessage.objects.bulk_create
+        calls = []
+
+        def locked_once(objs, *args, **kwargs):
+            calls.append(len(objs))
+            if len(calls) == 1:
+                raise OperationalError('database is locked')
+            return bulk_create(objs, *args, **kwargs)
+
+        with mock.patch.object(ChatMessage.objects, 'bulk_create', side_effect=locked_once):
+            for i in range(3):
+                await writer.submit(self.course.id, self.teacher, f'm{i}')
+            writer.max_pending = 2
+            with self.assertLogs('chat.writer', 'ERROR') as logs:
+                await writer.flush()
+            self.assertIn('Dropping the 1 oldest', logs.output[-1])
+            await writer._timer
+
+        self.assertEqual(calls, [3, 2])
+        stored = await database_sync_to_async(lambda: sorted(ChatMessage.objects.values_list('message', flat=True)))()
+        self.assertEqual(stored, ['m1', 'm2'])
+
+    async def test_rate_limited_sender_is_told_to_wait(self):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{self.course.id}/')
+        communicator.scope['user'] = self.teacher
+        await communicator.connect()
+        await communicator.receive_json_from()
+
+        for i in range(RateLimiter().limit + 1):
+            await communicator.send_json_to({'message': f'm{i}'})
+        replies = []
+        while not await communicator.receive_nothing(timeout=0.1):
+            replies.append((await communicator.receive_json_from())['type'])
+
+        self.assertEqual(replies.count('chat_message'), RateLimiter().limit)
+        self.assertEqual(replies.count('rate_limited'), 1)
+        await communicator.disconnect()
+
+    def tearDown(self):
+        chat_writer.flush_sync()
+
+
+class SQLiteChannelLayerTestCase(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = os.path.join(tmp.name, 'channels.sqlite3')
+
+    def _layer(self, **kwargs):
+        return SQLiteChannelLayer(path=self.path, **kwargs)
+
+    async def test_group_send_reaches_other_process(self):
+        # Two layer instances on one file behave like two Daphne processes
+        first, second = self._layer(), self._layer()
+        local, remote = await first.new_channel(), await second.new_channel()
+        await first.group_add('chat_1', local)
+        await second.group_add('chat_1', remote)
+
+        await first.group_send('chat_1', {'type': 'chat.message', 'text': 'hi'})
+
+        self.assertEqual((await second.receive(remote))['text'], 'hi')
+        self.assertEqual((await first.receive(local))['text'], 'hi')
+
+        await second.group_discard('chat_1', remote)
+        await first.group_send('chat_1', {'type': 'chat.message', 'text': 'again'})
+        self.assertEqual((await first.receive(local))['text'], 'again')
+        self.assertEqual(await second._run(second._claim, second.non_local_name(remote)), [])
+
+        await first.close()
+        await second.close()
+
+    async def test_full_channel_applies_backpressure(self):
+        layer = self._layer(capacity=2)
+        channel = await layer.new_channel()
+        await layer.group_add('chat_1', channel)
+        await layer.send(channel, {'type': 'a'})
+        await layer.send(channel, {'type': 'b'})
+
+        with self.assertRaises(ChannelFull):
+            await layer.send(channel, {'type': 'c'})
+        # group_send skips full channels instead of failing
+        await layer.group_send('chat_1', {'type': 'd'})
+
+        self.assertEqual([(await layer.receive(channel))['type'] for _ in range(2)], ['a', 'b'])
+        await layer.close()
+
+    async def test_cancelled_receive_drops_the_channel_queue(self):
+        layer = self._layer()
+        channel = await layer.new_channel()
+        receiver = asyncio.ensure_future(layer.receive(channel))
+        await asyncio.sleep(0)
+        self.assertIn(channel, layer._queues)
+
+        receiver.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await receiver
+        self.assertNotIn(channel, layer._queues)
+
+        # A late message for the closed channel is claimed and discarded, not queued
+        other = await layer.new_channel()
+        await layer.send(channel, {'type': 'late'})
+        await layer.send(other, {'type': 'live'})
+        self.assertEqual((await layer.receive(other))['type'], 'live')
+        self.assertEqual(list(layer._queues), [other])
+        await layer.close()
+
+    async def test_expired_group_membership_is_ignored(self):
+        layer = self._layer(group_expiry=-1)
+        channel = await layer.new_channel()
+        await layer.group_add('chat_1', channel)
+
+        await layer.group_send('chat_1', {'type': 'chat.message'})
+
+        self.assertEqual(await layer._run(layer._claim, layer.non_local_name(channel)), [])
+        await layer.close()
+
+
+class ChatHistoryTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.teacher = User.objects.create_user(username='teacher', password='x', role='teacher')
+        self.alice = User.objects.create_user(username='alice', password='x', role='student')
+        self.bob = User.objects.create_user(username='bob', password='x', role='student')
+        self.course = Course.objects.create(title='Course', teacher=self.teacher, chat_mode='public')
+        self.course.students.add(self.alice, self.bob)
+        self.client = APIClient()
+
+    def _post(self, user, count):
+        for i in range(count):
+            ChatMessage.objects.create(course=self.course, user=user, message=f'{user.username} {i}')
+
+    def test_ring_buffer_keeps_latest_messages(self):
+        self._post(self.alice, HISTORY_SIZE + 5)
+        with self.assertNumQueries(1):
+            messages = get_recent_messages(self.course.id)
+        with self.assertNumQueries(0):
+            get_recent_messages(self.course.id)
+        self.assertEqual(len(messages), HISTORY_SIZE)
+        self.assertEqual(messages[-1]['message'], f'alice {HISTORY_SIZE + 4}')
+
+    def test_append_waiting_on_another_process_drops_the_buffer(self):
+        self._post(self.alice, 1)
+        get_recent_messages(self.course.id)
+        append_messages(self.course.id, [{'id': 0, 'user_id': self.bob.id, 'message': 'appended'}])
+        self.assertEqual(get_recent_messages(self.course.id)[-1]['message'], 'appended')
+
+        # Another process holds the append lock past the wait: the buffer is rebuilt from the database
+        cache.add(f'lock:{history_cache_key(self.course.id)}', 1, 5)
+        with mock.patch('chat.history.APPEND_LOCK_WAIT', 0):
+            append_messages(self.course.id, [{'id': 0, 'user_id': self.bob.id, 'message': 'lost'}])
+        self.assertIsNone(cache.get(history_cache_key(self.course.id)))
+        self.assertEqual([m['message'] for m in get_recent_messages(self.course.id)], ['alice 0'])
+
+    def test_keyset_pagination_walks_all_messages(self):
+        self._post(self.alice, 7)
+        self.client.force_authenticate(user=self.bob)
+        url = f'/api/chat/courses/{self.course.id}/messages/'
+
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 3}
+            if cursor:
+                params['before'] = cursor
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            seen = [m['message'] for m in response.data['messages']] + seen
+            cursor = response.data['next_cursor']
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, [f'alice {i}' for i in range(7)])
+
+    def test_private_mode_hides_other_students(self):
+        self.course.chat_mode = 'private'
+        self.course.save()
+        self._post(self.alice, 2)
+        self._post(self.teacher, 1)
+        self.client.force_authenticate(user=self.bob)
+
+        response = self.client.get(f'/api/chat/courses/{self.course.id}/messages/')
+
+        self.assertEqual([m['message'] for m in response.data['messages']], ['teacher 0'])
+
+    def test_non_member_is_forbidden(self):
+        outsider = User.objects.create_user(username='outsider', password='x', role='student')
+        self.client.force_authenticate(user=outsider)
+        response = self.client.get(f'/api/chat/courses/{self.course.id}/messages/')
+        self.assertEqual(response.status_code, 403)
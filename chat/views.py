@@ -1,3 +1,81 @@
-from django.shortcuts import render
+import base64
+from datetime import datetime
 
-# Create your views here.
+from django.db.models import Q
+from rest_framework import permissions, status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from courses.models import Course
+from .history import serialize_message
+from .models import ChatMessage
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(message):
+    raw = f"{message.timestamp.isoformat()}|{message.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Return (timestamp, id) for a cursor, or None if it is malformed."""
+    try:
+        timestamp, message_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(timestamp), int(message_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class ChatHistoryView(APIView):
+    """
+    GET /api/chat/courses/<course_id>/messages/?before=<cursor>&limit=<n>
+
+    Older chat history of a course, newest page first, using keyset pagination
+    on (timestamp, id). Messages within a page are oldest first, like the
+    websocket history. Pass `next_cursor` from the response as `before` to get
+    the previous page; it is null when there are no older messages.
+    """
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, course_id):
+        course = Course.objects.filter(pk=course_id).values('teacher_id', 'chat_mode').first()
+        if course is None:
+            return Response({"detail": "Course not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        user = request.user
+        is_teacher = user.id == course['teacher_id']
+        is_admin = getattr(user, 'role', None) == 'admin' or user.is_staff
+        if not (is_teacher or is_admin or Course.students.through.objects.filter(course_id=course_id, user_id=user.id).exists()):
+            return Response(
+                {"detail": "You must be enrolled in this course to read its chat."},
+                status=status.HTTP_403_FORBIDDEN,
+            )
+
+        try:
+            limit = min(max(int(request.query_params.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        except ValueError:
+            return Response({"detail": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        messages = ChatMessage.objects.filter(course_id=course_id)
+        if course['chat_mode'] == 'private' and not (is_teacher or is_admin):
+            messages = messages.filter(user_id__in=[course['teacher_id'], user.id])
+
+        before = request.query_params.get('before')
+        if before:
+            position = decode_cursor(before)
+            if position is None:
+                return Response({"detail": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+            timestamp, message_id = position
+            messages = messages.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=message_id))
+
+        page = list(messages.select_related('user').order_by('-timestamp', '-id')[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+
+        return Response({
+            'messages': [serialize_message(message) for message in reversed(page)],
+            'next_cursor': encode_cursor(page[-1]) if has_more else None,
+        })
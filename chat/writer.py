@@ -0,0 +1,154 @@
+"""
+Batched chat persistence.
+
+`ChatConsumer.receive` hands messages to the process-wide `chat_writer`, which
+returns the serialized message with a provisional id right away so it can be
+broadcast without waiting for the database. Pending messages are written with
+one `bulk_create` every CHAT_FLUSH_BATCH_SIZE messages or CHAT_FLUSH_INTERVAL_MS
+milliseconds, whichever comes first, on a worker thread; the history buffer
+then receives them with their real ids.
+
+When CHAT_MAX_PENDING messages are waiting, new submissions wait for the
+running flush instead of growing the queue. A batch that fails with an
+OperationalError (e.g. a locked database) is put back and retried after
+another flush interval; past CHAT_MAX_PENDING the oldest messages are dropped
+and logged. `RateLimiter` caps how fast one
+user can send.
+"""
+import asyncio
+import atexit
+import itertools
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db import OperationalError
+from django.utils import timezone
+
+from .history import append_messages, serialize_message
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+
+class ChatMessageWriter:
+    def __init__(self, batch_size=None, flush_interval=None, max_pending=None):
+        self.batch_size = batch_size or getattr(settings, 'CHAT_FLUSH_BATCH_SIZE', 100)
+        self.flush_interval = (flush_interval or getattr(settings, 'CHAT_FLUSH_INTERVAL_MS', 200)) / 1000
+        self.max_pending = max_pending or getattr(settings, 'CHAT_MAX_PENDING', 5000)
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flushing = None
+        self._timer = None
+        self._ids = itertools.count(1)
+        self._prefix = uuid.uuid4().hex[:8]
+
+    def _provisional_id(self):
+        return f'p-{self._prefix}-{next(self._ids)}'
+
+    async def submit(self, course_id, user, text):
+        """Queue a message for writing and return its serialized form with a provisional id."""
+        if len(self._pending) >= self.max_pending:
+            await self.flush()
+
+        message = ChatMessage(course_id=course_id, user=user, message=text, timestamp=timezone.now())
+        data = serialize_message(message)
+        data['id'] = self._provisional_id()
+        with self._lock:
+            self._pending.append((message, data))
+            pending = len(self._pending)
+
+        if pending >= self.batch_size:
+            self._start_flush()
+        elif self._timer is None or self._timer.done():
+            self._timer = asyncio.ensure_future(self._flush_later())
+        return data
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    def _start_flush(self):
+        if self._flushing is None or self._flushing.done():
+            self._flushing = asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """Write every pending message. Returns the number of rows written."""
+        # One flush at a time; a caller arriving mid-flush waits for it and
+        # then writes whatever queued up meanwhile.
+        running = self._flushing
+        if running is not None and not running.done() and running is not asyncio.current_task():
+            await asyncio.shield(running)
+        written = await database_sync_to_async(self.flush_sync)()
+
+        # Retry what a failed write put back even if no new message arrives
+        timer = self._timer
+        if self._pending and (timer is None or timer.done() or timer is asyncio.current_task()):
+            self._timer = asyncio.ensure_future(self._flush_later())
+        return written
+
+    def flush_sync(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+
+        try:
+            created = ChatMessage.objects.bulk_create([message for message, _ in batch])
+        except OperationalError:
+            # e.g. "database is locked": keep the batch for the next flush
+            logger.exception("Failed to write %s chat message(s); retrying with the next flush", len(batch))
+            with self._lock:
+                pending = batch + self._pending
+                self._pending = pending[-self.max_pending:]
+            dropped = len(pending) - self.max_pending
+            if dropped > 0:
+                logger.error("Dropping the %s oldest unwritten chat message(s): over CHAT_MAX_PENDING", dropped)
+            return 0
+        except Exception:
+            logger.exception("Dropping %s chat message(s) that could not be written", len(batch))
+            return 0
+
+        by_course = defaultdict(list)
+        for message, data in zip(created, (data for _, data in batch)):
+            by_course[message.course_id].append(dict(data, id=message.id))
+        for course_id, messages in by_course.items():
+            append_messages(course_id, messages)
+        return len(created)
+
+
+class RateLimiter:
+    """Sliding-window limit of `limit` messages per `window` seconds per key."""
+
+    def __init__(self, limit=None, window=None):
+        self.limit = limit or getattr(settings, 'CHAT_RATE_LIMIT', 5)
+        self.window = window or getattr(settings, 'CHAT_RATE_WINDOW', 3)
+        self._hits = defaultdict(deque)
+
+    def allow(self, key):
+        """Record a send for `key`. Returns 0 when allowed, else seconds until the next slot."""
+        now = time.monotonic()
+        if len(self._hits) > 10000:
+            self._forget_idle(now)
+        hits = self._hits[key]
+        while hits and hits[0] <= now - self.window:
+            hits.popleft()
+        if len(hits) >= self.limit:
+            return hits[0] + self.window - now
+        hits.append(now)
+        return 0
+
+    def _forget_idle(self, now):
+        for key in [key for key, hits in self._hits.items() if not hits or hits[-1] <= now - self.window]:
+            del self._hits[key]
+
+
+chat_writer = ChatMessageWriter()
+chat_rate_limiter = RateLimiter()
+
+# Write whatever is still queued when the process exits
+atexit.register(chat_writer.flush_sync)
@@ -5,7 +5,7 @@ from django.utils.translation import gettext_lazy as _
 from courses.models import Course, CourseSession
 from PIL import Image
 from api.storage import PublicMediaStorage
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 
@@ -257,3 +257,17 @@ class OfficialBook(models.Model):
         ordering = ['-publication_year', 'title']
         verbose_name = _("Official Book")
         verbose_name_plural = _("Official Books")
+
+
+@receiver(post_save, sender=GalleryImage)
+@receiver(post_delete, sender=GalleryImage)
+def invalidate_public_gallery(sender, instance, **kwargs):
+    from api.cache import invalidate_on_commit
+    invalidate_on_commit('gallery-public')
+
+
+@receiver(post_save, sender=OfficialBook)
+@receiver(post_delete, sender=OfficialBook)
+def invalidate_official_books(sender, instance, **kwargs):
+    from api.cache import invalidate_on_commit
+    invalidate_on_commit('official-books')
@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser
+from api.http_cache import cache_response
 from .models import File, GalleryImage, OfficialBook
 from .serializers import (
     FileSerializer, FileUploadSerializer, VideoInitUploadSerializer, 
@@ -215,6 +216,10 @@ class PublicGalleryImageListView(generics.ListAPIView):
         context['request'] = self.request
         return context
 
+    @cache_response('gallery-public')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
 
 class PublicGalleryImageDetailView(generics.RetrieveAPIView):
     """
@@ -246,3 +251,12 @@ class OfficialBookViewSet(viewsets.ModelViewSet):
         if subject:
             queryset = queryset.filter(subject=subject)
         return queryset
+
+    # Same content for every signed-in user, but not for shared proxies
+    @cache_response('official-books', private=True)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response('official-books', private=True)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
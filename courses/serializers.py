@@ -98,10 +98,13 @@ class StudentCourseSerializer(serializers.ModelSerializer):
         ]
 
     def get_sessions_count(self, obj):
-        print(obj)
+        if hasattr(obj, 'published_sessions_count'):
+            return obj.published_sessions_count
         return obj.sessions.filter(is_published=True).count()
 
     def get_tests_count(self, obj):
+        if hasattr(obj, 'collection_tests_count'):
+            return obj.collection_tests_count
         # شمارش تست‌ها از طریق test_collections
         total_tests = 0
         for test_collection in obj.test_collections.all():
@@ -0,0 +1,40 @@
+"""Background jobs for course provisioning."""
+
+import logging
+
+from jobs.queue import task
+from utils.vod import create_stream
+from .models import Course
+
+logger = logging.getLogger(__name__)
+
+
+# 5 attempts with increasing delay between them: 30s, 60s, 120s, 240s
+@task(max_attempts=5, backoff=30)
+def create_course_stream(course_id, course_title):
+    """Create the ArvanCloud live stream of a course and store its details."""
+    logger.info(f"Creating live stream for course '{course_title}'")
+
+    stream_response = create_stream(course_title, course_id)
+    stream_data = stream_response.get('data', {})
+    stream_id = stream_data.get('id')
+    input_url = stream_data.get('input_url', '')
+    if input_url:
+        parts = input_url.rsplit('/', 1)
+        rtmp_url = parts[0]
+        rtmp_key = parts[1] if len(parts) > 1 else ''
+    else:
+        rtmp_url = ''
+        rtmp_key = ''
+
+    player_url = stream_data.get('player_url', '')
+    live_iframe = f'<iframe src="{player_url}" allowfullscreen="true" webkitallowfullscreen="true" mozallowfullscreen="true" width="100%" height="100%" style="border: none;"></iframe>' if player_url else ''
+
+    course = Course.objects.get(id=course_id)
+    course.stream_id = stream_id
+    course.rtmp_url = rtmp_url
+    course.rtmp_key = rtmp_key
+    course.live_iframe = live_iframe
+    course.save(update_fields=['stream_id', 'rtmp_url', 'rtmp_key', 'live_iframe'])
+
+    logger.info(f"Successfully created live stream {stream_id} for course '{course_title}'")
@@ -1,3 +1,53 @@
 from django.test import TestCase
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from accounts.models import User
+from tests.testing import create_exam
+from .models import Course, CourseSession
+
+
+class QueryBudgetTestCase(TestCase):
+    """Query counts of the dashboard endpoints must not grow with the number of courses."""
+
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teacher', password='x', role='teacher')
+        self.student = User.objects.create_user(username='student', password='x', role='student')
+        self.client = APIClient()
+
+    def add_course(self, title):
+        course = Course.objects.create(title=title, teacher=self.teacher)
+        course.students.add(self.student, User.objects.create_user(username=f'{title} classmate', password='x'))
+        for number in (1, 2):
+            CourseSession.objects.create(course=course, title=f'{title} {number}', session_number=number, is_published=True)
+        CourseSession.objects.create(course=course, title=f'{title} draft', session_number=3)
+        test = create_exam(self.teacher)
+        test.test_collection.courses.add(course)
+        return course
+
+    def assertConstantQueries(self, count, url, user):
+        self.client.force_authenticate(user)
+        self.add_course('Algebra')
+        with self.assertNumQueries(count):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.add_course('Geometry')
+        with self.assertNumQueries(count):
+            response = self.client.get(url)
+        return response.json()
+
+    def test_student_active_courses(self):
+        courses = self.assertConstantQueries(1, '/api/courses/student/active-courses/', self.student)
+        self.assertEqual(
+            [(course['students_count'], course['sessions_count'], course['tests_count']) for course in courses],
+            [(2, 2, 1), (2, 2, 1)],
+        )
+
+    def test_student_purchased_courses(self):
+        self.assertConstantQueries(1, '/api/courses/student/purchased-courses/', self.student)
+
+    def test_student_dashboard_stats(self):
+        stats = self.assertConstantQueries(5, '/api/courses/student/dashboard-stats/', self.student)
+        self.assertEqual(stats['total_sessions'], 4)
+
+    def test_teacher_analytics(self):
+        analytics = self.assertConstantQueries(5, '/api/courses/teacher/analytics/', self.teacher)
+        self.assertEqual(analytics['total_students'], 3)
@@ -3,12 +3,10 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
-from django.db.models import Count, Q, Prefetch, Avg
+from django.db.models import Count, OuterRef, Q, Prefetch, Avg, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 import logging
-import logging
-import threading
-import time
 from .models import Course, CourseSession, CourseSchedule, ClassCategory
 from .serializers import (
     CourseSerializer, CourseSessionSerializer, CourseScheduleSerializer,
@@ -18,7 +16,10 @@ from .serializers import (
 from accounts.models import User
 from tests.models import Test
 from tests.serializers import TestCreateSerializer
-from utils.vod import create_channel, delete_channel, create_stream, delete_stream
+from utils.vod import create_channel, delete_channel, delete_stream
+from api.db_routers import use_replica
+from jobs.queue import enqueue
+from .tasks import create_course_stream
 from contents.models import File
 from shop.models import Product
 from finance.models import Order, OrderItem
@@ -27,56 +28,11 @@ from finance.models import Transaction
 logger = logging.getLogger(__name__)
 
 
-def create_stream_async(course_title, course_id, max_attempts=5):
+def create_stream_async(course_title, course_id):
     """
-    Create live stream asynchronously with multiple attempts and delays.
+    Enqueue live stream creation; the job worker retries with increasing delays.
     """
-    def _create_stream_task():
-        for attempt in range(max_attempts):
-            try:
-                logger.info(f"Attempting to create stream for course '{course_title}' (attempt {attempt + 1}/{max_attempts})")
-                
-                stream_response = create_stream(course_title, course_id)
-                stream_data = stream_response.get('data', {})
-                stream_id = stream_data.get('id')
-                input_url = stream_data.get('input_url', '')
-                if input_url:
-                    parts = input_url.rsplit('/', 1)
-                    rtmp_url = parts[0]
-                    rtmp_key = parts[1] if len(parts) > 1 else ''
-                else:
-                    rtmp_url = ''
-                    rtmp_key = ''
-                    
-                player_url = stream_data.get('player_url', '')
-                live_iframe = f'<iframe src="{player_url}" allowfullscreen="true" webkitallowfullscreen="true" mozallowfullscreen="true" width="100%" height="100%" style="border: none;"></iframe>' if player_url else ''
-                
-                # Update course with stream details
-                from .models import Course
-                course = Course.objects.get(id=course_id)
-                course.stream_id = stream_id
-                course.rtmp_url = rtmp_url
-                course.rtmp_key = rtmp_key
-                course.live_iframe = live_iframe
-                course.save(update_fields=['stream_id', 'rtmp_url', 'rtmp_key', 'live_iframe'])
-                
-                logger.info(f"Successfully created live stream {stream_id} for course '{course_title}'")
-                return
-                
-            except Exception as e:
-                logger.warning(f"Failed to create live stream for course '{course_title}' (attempt {attempt + 1}): {str(e)}")
-                
-                if attempt < max_attempts - 1:
-                    # Wait before next attempt (increasing delay: 30s, 60s, 120s, 240s)
-                    delay = 30 * (2 ** attempt)
-                    logger.info(f"Waiting {delay} seconds before next attempt...")
-                    time.sleep(delay)
-                else:
-                    logger.error(f"Failed to create live stream for course '{course_title}' after {max_attempts} attempts")
-    
-    # Start the background task
-    thread = threading.Thread(target=_create_stream_task, daemon=True)
-    thread.start()
+    enqueue(create_course_stream, idempotency_key=f"course:{course_id}:stream", course_id=course_id, course_title=course_title)
 
 
 class CourseViewSet(viewsets.ModelViewSet):
@@ -146,7 +102,7 @@ class CourseViewSet(viewsets.ModelViewSet):
             # Start background task to create live stream
             # This will retry multiple times with delays if ArvanCloud is temporarily unavailable
             create_stream_async(course.title, course.id)
-            logger.info(f"Started background task to create live stream for course '{course.title}' (ID: {course.id})")
+            logger.info(f"Enqueued live stream creation for course '{course.title}' (ID: {course.id})")
         
         # Temporarily replace perform_create
         self.perform_create = patched_perform_create
@@ -460,6 +416,27 @@ class CourseDetailView(viewsets.ReadOnlyModelViewSet):
 
 
 # Student Dashboard API Endpoints
+def _count_per_course(queryset, course_field):
+    """Correlated COUNT(*) of `queryset` rows whose `course_field` is the outer course."""
+    counts = queryset.filter(**{course_field: OuterRef('pk')}).order_by().values(course_field).annotate(
+        total=Count('pk', distinct=True)
+    ).values('total')
+    return Coalesce(Subquery(counts), 0)
+
+
+def with_student_course_counts(courses):
+    """
+    Annotate the counts StudentCourseSerializer shows, so a list of courses is
+    serialized without per-course queries. Subqueries keep the counts
+    independent of the student filter and of each other.
+    """
+    return courses.select_related('teacher').annotate(
+        students_count=_count_per_course(Course.students.through.objects.all(), 'course'),
+        published_sessions_count=_count_per_course(CourseSession.objects.filter(is_published=True), 'course'),
+        collection_tests_count=_count_per_course(Test.objects.all(), 'test_collection__courses'),
+    )
+
+
 class StudentActiveCoursesView(APIView):
     """Get student's active courses for dashboard"""
     permission_classes = [permissions.IsAuthenticated]
@@ -472,14 +449,10 @@ class StudentActiveCoursesView(APIView):
             )
         
         # Get courses where student is enrolled and course is active
-        courses = Course.objects.filter(
+        courses = with_student_course_counts(Course.objects.filter(
             students=request.user,
             is_active=True
-        ).annotate(
-            students_count=Count('students'),
-            sessions_count=Count('sessions'),
-            tests_count=Count('test_collections__tests')
-        ).order_by('-created_at')[:6]  # Limit to 6 most recent
+        )).order_by('-created_at')[:6]  # Limit to 6 most recent
         
         serializer = StudentCourseSerializer(courses, many=True, context={'request': request})
         return Response(serializer.data)
@@ -497,13 +470,9 @@ class StudentPurchasedCoursesView(APIView):
             )
         
         # Get courses where student has purchased access
-        courses = Course.objects.filter(
+        courses = with_student_course_counts(Course.objects.filter(
             students=request.user
-        ).annotate(
-            students_count=Count('students'),
-            sessions_count=Count('sessions'),
-            tests_count=Count('test_collections__tests')
-        ).order_by('-created_at')[:6]  # Limit to 6 most recent
+        )).order_by('-created_at')[:6]  # Limit to 6 most recent
         
         serializer = StudentCourseSerializer(courses, many=True, context={'request': request})
         return Response(serializer.data)
@@ -603,6 +572,7 @@ class TeacherAnalyticsView(APIView):
     """Get teacher analytics and statistics"""
     permission_classes = [permissions.IsAuthenticated]
     
+    @use_replica
     def get(self, request):
         if request.user.role == 'student':
             return Response(
@@ -667,6 +637,7 @@ class TeacherDueActivitiesView(APIView):
     """Get teacher's due activities"""
     permission_classes = [permissions.IsAuthenticated]
     
+    @use_replica
     def get(self, request):
         if request.user.role == 'student':
             return Response(
@@ -739,6 +710,7 @@ class TeacherScheduleView(APIView):
     """Get teacher's schedule overview"""
     permission_classes = [permissions.IsAuthenticated]
     
+    @use_replica
     def get(self, request):
         if request.user.role == 'student':
             return Response(
@@ -809,6 +781,7 @@ class TeacherQuickStatsView(APIView):
     """Get teacher's quick statistics"""
     permission_classes = [permissions.IsAuthenticated]
     
+    @use_replica
     def get(self, request):
         if request.user.role == 'student':
             return Response(
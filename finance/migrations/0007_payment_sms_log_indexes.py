@@ -0,0 +1,31 @@
+# Generated by Django 5.2.4 on 2026-10-19 11:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0006_alter_order_options_alter_payment_options_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['order', '-created_at'], name='payment_order_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['user', '-created_at'], name='payment_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['ref_number'], name='payment_ref_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='smsnotificationlog',
+            index=models.Index(fields=['order', '-created_at'], name='sms_log_order_created_idx'),
+        ),
+    ]
@@ -175,6 +175,12 @@ class Payment(models.Model):
 
     class Meta:
         ordering = ['-created_at', '-id']
+        indexes = [
+            # Latest payment of an order / a user (payment callback and result lookups)
+            models.Index(fields=['order', '-created_at'], name='payment_order_created_idx'),
+            models.Index(fields=['user', '-created_at'], name='payment_user_created_idx'),
+            models.Index(fields=['ref_number'], name='payment_ref_number_idx'),
+        ]
 
     def __str__(self):
         return f"Payment #{self.id} - {self.user.username} - {self.amount} Rials - Track: {self.track_id} - Status: {self.status}"
@@ -383,7 +389,10 @@ class SMSNotificationLog(models.Model):
 
     class Meta:
         ordering = ['-created_at', '-id']
-        indexes = [models.Index(fields=['status', '-created_at'])]
+        indexes = [
+            models.Index(fields=['status', '-created_at']),
+            models.Index(fields=['order', '-created_at'], name='sms_log_order_created_idx'),
+        ]
 
     def __str__(self):
         return f'{self.phone_number} - {self.status} - {self.created_at:%Y-%m-%d %H:%M}'
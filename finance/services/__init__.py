@@ -1,4 +1,8 @@
 # finance services package
-from .sms import send_custom_sms, send_sms_notifications_for_order
+from .access import grant_order_access, order_access_granted
+from .sms import send_bulk_sms, send_custom_sms, send_sms_notifications_for_order
 
-__all__ = ['send_custom_sms', 'send_sms_notifications_for_order']
+__all__ = [
+    'grant_order_access', 'order_access_granted',
+    'send_bulk_sms', 'send_custom_sms', 'send_sms_notifications_for_order',
+]
@@ -0,0 +1,81 @@
+"""Granting product access for paid orders."""
+
+import logging
+
+from django.db import transaction
+from django.dispatch import Signal
+
+logger = logging.getLogger(__name__)
+
+# Sent once per order after the access rows are committed, so state derived
+# from a user's products, courses or test collections can be refreshed in one
+# go (tests/models.py fills in the buyer's StudentProgress rows).
+# kwargs: order, user_id, product_ids, course_ids, collection_ids
+order_access_granted = Signal()
+
+
+def grant_order_access(order):
+    """
+    Grant the order's user access to every purchased product.
+
+    Products with their courses, test collections and files are resolved in
+    one query; UserAccess rows and course / collection enrollments are
+    inserted in bulk, and existing access rows are re-pointed at this order
+    and re-activated. Returns the list of granted product ids.
+    """
+    from courses.models import Course
+    from tests.models import TestCollection
+    from finance.models import UserAccess
+
+    items = order.items.select_related('product__course', 'product__test', 'product__file')
+    products = {item.product_id: item.product for item in items}
+    if not products:
+        return []
+
+    user_id = order.user_id
+    course_ids = {product.course_id for product in products.values() if product.course_id}
+    collection_ids = {product.test_id for product in products.values() if product.test_id}
+
+    with transaction.atomic():
+        UserAccess.objects.bulk_create(
+            [UserAccess(user_id=user_id, product_id=product_id, order=order, is_active=True) for product_id in products],
+            ignore_conflicts=True,
+        )
+        # Rows that already existed (e.g. a repurchase) point at the latest order
+        UserAccess.objects.filter(user_id=user_id, product_id__in=products).exclude(
+            order=order, is_active=True
+        ).update(order=order, is_active=True)
+
+        if course_ids:
+            CourseStudent = Course.students.through
+            CourseStudent.objects.bulk_create(
+                [CourseStudent(course_id=course_id, user_id=user_id) for course_id in course_ids],
+                ignore_conflicts=True,
+            )
+            # Collections linked to a purchased course list its students too
+            # (students only, like TestCollection.sync_students_from_courses)
+            if order.user.role == 'student':
+                collection_ids.update(
+                    TestCollection.courses.through.objects.filter(course_id__in=course_ids)
+                    .values_list('testcollection_id', flat=True)
+                )
+
+        if collection_ids:
+            CollectionStudent = TestCollection.students.through
+            CollectionStudent.objects.bulk_create(
+                [CollectionStudent(testcollection_id=collection_id, user_id=user_id) for collection_id in collection_ids],
+                ignore_conflicts=True,
+            )
+
+        product_ids = list(products)
+        transaction.on_commit(lambda: order_access_granted.send(
+            sender=order.__class__,
+            order=order,
+            user_id=user_id,
+            product_ids=product_ids,
+            course_ids=sorted(course_ids),
+            collection_ids=sorted(collection_ids),
+        ))
+
+    logger.info("Granted %s product(s) to user %s for order %s", len(product_ids), user_id, order.id)
+    return product_ids
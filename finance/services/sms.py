@@ -2,22 +2,50 @@
 
 import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 from django.conf import settings
-from django.db import transaction
+from requests.adapters import HTTPAdapter
 
 logger = logging.getLogger(__name__)
 
+_session = None
+_session_lock = threading.Lock()
+
+
+def _max_workers():
+    return getattr(settings, 'SMS_MAX_WORKERS', 8)
+
+
+def _get_session():
+    """Shared keep-alive session so repeated sends reuse pooled TLS connections."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_max_workers())
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def _is_valid_phone(phone_number):
+    return bool(phone_number) and phone_number.startswith('09') and len(phone_number) == 11
+
 
 def _request_sms(endpoint, payload):
     if not settings.SMS_IR_API_KEY:
         logger.warning("SMS_IR_API_KEY not configured")
         return False, None, "SMS_IR_API_KEY is not configured"
 
+    base_url = getattr(settings, 'SMS_IR_BASE_URL', 'https://api.sms.ir/v1/send').rstrip('/')
     try:
-        response = requests.post(
-            f"https://api.sms.ir/v1/send/{endpoint}",
+        response = _get_session().post(
+            f"{base_url}/{endpoint}",
             headers={
                 'Content-Type': 'application/json',
                 'Accept': 'application/json',
@@ -39,27 +67,36 @@ def _request_sms(endpoint, payload):
         return False, None, str(exc)
 
 
-def send_custom_sms(phone_number, message_text, sender_number=None):
-    """Send one custom SMS using sms.ir's bulk endpoint."""
-    if not phone_number or not phone_number.startswith('09') or len(phone_number) != 11:
-        logger.warning("Invalid phone number format: %s", phone_number)
+def send_bulk_sms(phone_numbers, message_text, sender_number=None):
+    """Send the same text to several recipients with a single sms.ir bulk request."""
+    invalid = [phone for phone in phone_numbers if not _is_valid_phone(phone)]
+    if invalid or not phone_numbers:
+        logger.warning("Invalid phone number format: %s", invalid)
         return False, None, 'Invalid phone number format'
     sender_number = sender_number or getattr(settings, 'SMS_IR_LINE_NUMBER', '')
     payload = {
         'messageText': message_text,
-        'mobiles': [phone_number],
+        'mobiles': list(phone_numbers),
     }
     if sender_number:
         payload['lineNumber'] = sender_number
     success, result, error = _request_sms('bulk', payload)
     if not success:
-        logger.warning("SMS sending failed for %s: %s", phone_number, error)
+        logger.warning("SMS sending failed for %s: %s", ', '.join(phone_numbers), error)
     return success, result, error
 
 
+def send_custom_sms(phone_number, message_text, sender_number=None):
+    """Send one custom SMS using sms.ir's bulk endpoint."""
+    if not _is_valid_phone(phone_number):
+        logger.warning("Invalid phone number format: %s", phone_number)
+        return False, None, 'Invalid phone number format'
+    return send_bulk_sms([phone_number], message_text, sender_number)
+
+
 def send_pattern_sms(phone_number, template_id, parameters):
     """Send a sms.ir verify/pattern message."""
-    if not phone_number or not phone_number.startswith('09') or len(phone_number) != 11:
+    if not _is_valid_phone(phone_number):
         return False, None, 'Invalid phone number format'
     return _request_sms('verify', {
         'mobile': phone_number,
@@ -68,56 +105,96 @@ def send_pattern_sms(phone_number, template_id, parameters):
     })
 
 
+def _safe_send(func, *args):
+    try:
+        return func(*args)
+    except Exception as exc:
+        logger.exception("SMS error calling %s", func.__name__)
+        return False, None, str(exc)
+
+
+def send_pattern_sms_many(phone_numbers, template_id, parameters):
+    """
+    Send a pattern message to each recipient (the verify endpoint takes one
+    mobile per call) over a bounded worker pool. Returns {phone: (success, result, error)}.
+    """
+    if not phone_numbers:
+        return {}
+    workers = min(_max_workers(), len(phone_numbers))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            phone: executor.submit(_safe_send, send_pattern_sms, phone, template_id, parameters)
+            for phone in phone_numbers
+        }
+    return {phone: future.result() for phone, future in futures.items()}
+
+
 def send_sms_notifications_for_order(order):
-    """Send configured notifications for a paid order and persist delivery logs."""
+    """
+    Send configured notifications for a paid order and persist delivery logs.
+
+    Bulk configs go out as one request for all valid recipients; pattern
+    configs are sent concurrently. Logs are written with a single bulk_create,
+    in a `finally` so the messages already sent stay logged if a later config
+    fails (the job is not retried).
+    """
     from finance.models import SMSNotificationConfig, SMSNotificationLog
 
-    configs = SMSNotificationConfig.objects.filter(is_active=True).prefetch_related('admin_users')
-    for config in configs:
-        if not config.matches_order(order):
-            continue
-        phones = config.get_recipient_phones()
-        if not phones:
-            logger.warning("No recipients for SMS config: %s", config.name)
-            continue
-
-        context = config.get_template_context(order)
-        message = config.render_template(order)
-        for phone in phones:
-            success = False
-            result = None
-            error = ''
-            try:
-                if config.message_type == config.MessageType.VERIFY:
+    logs = []
+    configs = SMSNotificationConfig.objects.filter(is_active=True).prefetch_related(
+        'admin_users__profile', 'admin_users__address'
+    )
+    try:
+        for config in configs:
+            if not config.matches_order(order):
+                continue
+            phones = config.get_recipient_phones()
+            if not phones:
+                logger.warning("No recipients for SMS config: %s", config.name)
+                continue
+
+            context = config.get_template_context(order)
+            message = config.render_template(order)
+            valid_phones = [phone for phone in phones if _is_valid_phone(phone)]
+            results = {
+                phone: (False, None, 'Invalid phone number format')
+                for phone in phones if phone not in valid_phones
+            }
+
+            if config.message_type == config.MessageType.VERIFY:
+                try:
                     parameters = [
                         {'name': name, 'value': str(value).format(**context)}
                         for name, value in (config.template_parameters or {}).items()
                     ]
-                    success, result, error = send_pattern_sms(phone, config.template_id, parameters)
-                else:
-                    success, result, error = send_custom_sms(phone, message)
-            except Exception as exc:
-                error = str(exc)
-                logger.exception("SMS error for config %s and phone %s", config.name, phone)
-
-            SMSNotificationLog.objects.create(
-                config=config,
-                order=order,
-                phone_number=phone,
-                message=message,
-                status=SMSNotificationLog.Status.SUCCESS if success else SMSNotificationLog.Status.FAILED,
-                error_message=error,
-                provider_response=result,
-            )
+                    results.update(send_pattern_sms_many(valid_phones, config.template_id, parameters))
+                except Exception as exc:
+                    logger.exception("SMS error for config %s", config.name)
+                    results.update({phone: (False, None, str(exc)) for phone in valid_phones})
+            elif valid_phones:
+                outcome = _safe_send(send_bulk_sms, valid_phones, message)
+                results.update({phone: outcome for phone in valid_phones})
+
+            for phone in phones:
+                success, result, error = results[phone]
+                logs.append(SMSNotificationLog(
+                    config=config,
+                    order=order,
+                    phone_number=phone,
+                    message=message,
+                    status=SMSNotificationLog.Status.SUCCESS if success else SMSNotificationLog.Status.FAILED,
+                    error_message=error,
+                    provider_response=result,
+                ))
+    finally:
+        if logs:
+            SMSNotificationLog.objects.bulk_create(logs)
 
 
 def schedule_sms_notifications_for_order(order):
-    """Run notification delivery only after the surrounding DB transaction commits."""
-    transaction.on_commit(
-        lambda order_id=order.pk: send_sms_notifications_for_order(
-            order.__class__.objects.get(pk=order_id)
-        ), robust=True
-    )
+    """Enqueue notification delivery as a background job; it is committed with the surrounding transaction."""
+    from finance.tasks import enqueue_order_sms_notifications
+    return enqueue_order_sms_notifications(order)
 
 
 def send_test_sms_notification(config=None, phone_numbers=None, test_context=None, config_data=None):
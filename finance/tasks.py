@@ -0,0 +1,64 @@
+"""Background jobs for order fulfillment side effects."""
+
+import logging
+
+from jobs.queue import enqueue, task
+from spotplayer.services import provision_licenses_for_order
+from .models import Order
+from .notifications import (
+    send_purchase_notification_email, send_payment_confirmation_email,
+    send_product_access_granted_email,
+)
+from .services.sms import send_sms_notifications_for_order
+
+logger = logging.getLogger(__name__)
+
+ORDER_EMAILS = {
+    'purchase_notification': send_purchase_notification_email,
+    'payment_confirmation': send_payment_confirmation_email,
+    'product_access_granted': send_product_access_granted_email,
+}
+
+
+@task(max_attempts=5, backoff=60)
+def send_order_email(order_id, kind):
+    order = Order.objects.select_related('user').get(id=order_id)
+    if not ORDER_EMAILS[kind](order):
+        raise RuntimeError(f"Sending '{kind}' email failed for order {order_id}")
+
+
+@task(max_attempts=6, backoff=60)
+def provision_order_licenses(order_id):
+    """Provisioning is idempotent per (user, course), so failed courses are simply retried."""
+    order = Order.objects.select_related('user').get(id=order_id)
+    errors = provision_licenses_for_order(order)
+    if errors:
+        raise RuntimeError("; ".join(f"course {course.id}: {error}" for course, error in errors))
+
+
+@task(max_attempts=1)
+def send_order_sms_notifications(order_id):
+    # Not retried: a partial failure would re-send to recipients that already got it.
+    # Per-recipient failures are recorded in SMSNotificationLog instead.
+    send_sms_notifications_for_order(Order.objects.select_related('user').get(id=order_id))
+
+
+def enqueue_order_email(order, kind):
+    return enqueue(send_order_email, idempotency_key=f"order:{order.id}:email:{kind}", order_id=order.id, kind=kind)
+
+
+def enqueue_order_sms_notifications(order):
+    return enqueue(send_order_sms_notifications, idempotency_key=f"order:{order.id}:sms", order_id=order.id)
+
+
+def enqueue_order_fulfillment(order, emails=('product_access_granted', 'payment_confirmation')):
+    """
+    Enqueue every side effect of a paid order: DRM licenses, the given
+    customer emails and the configured SMS notifications. Each effect has
+    its own idempotency key, so callback, inquiry and manual status changes
+    for the same order never duplicate them.
+    """
+    enqueue(provision_order_licenses, idempotency_key=f"order:{order.id}:licenses", order_id=order.id)
+    for kind in emails:
+        enqueue_order_email(order, kind)
+    enqueue_order_sms_notifications(order)
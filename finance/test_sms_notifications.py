@@ -1,7 +1,10 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from unittest.mock import patch
 
 from django.core.exceptions import ValidationError
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 
 from accounts.models import UserProfile
@@ -32,28 +35,43 @@ class SMSNotificationTestCase(TestCase):
         )
         self.config.admin_users.add(self.owner)
 
-    @patch('finance.services.sms.send_custom_sms', return_value=(True, {'status': 1}, ''))
+    @patch('finance.services.sms.send_bulk_sms', return_value=(True, {'status': 1}, ''))
     def test_sends_to_unique_user_and_custom_phones_and_logs(self, send_sms):
         send_sms_notifications_for_order(self.order)
 
-        self.assertEqual(send_sms.call_count, 2)
+        # Identical text goes out as one bulk request
+        send_sms.assert_called_once()
+        self.assertEqual(send_sms.call_args[0][0], ['09120000001', '09120000002'])
         self.assertEqual(
             set(SMSNotificationLog.objects.values_list('phone_number', flat=True)),
             {'09120000001', '09120000002'},
         )
         self.assertTrue(SMSNotificationLog.objects.filter(status='success').exists())
 
-    @patch('finance.services.sms.send_custom_sms', return_value=(False, None, 'API error'))
+    @patch('finance.services.sms.send_bulk_sms', return_value=(False, None, 'API error'))
     def test_provider_failure_is_logged(self, send_sms):
         send_sms_notifications_for_order(self.order)
 
         self.assertEqual(SMSNotificationLog.objects.filter(status='failed').count(), 2)
         self.assertEqual(self.order.status, Order.OrderStatus.PAID)
 
+    @patch('finance.services.sms.send_bulk_sms', return_value=(True, {'status': 1}, ''))
+    def test_sent_messages_stay_logged_when_a_later_config_fails(self, send_sms):
+        SMSNotificationConfig.objects.create(
+            name='Broken', template_text='Order {order_code}',
+            custom_phone_numbers=['09120000001', '09120000002'],
+        )
+        render = patch.object(SMSNotificationConfig, 'render_template', side_effect=['Order 1', RuntimeError('bad template')])
+        with render, self.assertRaises(RuntimeError):
+            send_sms_notifications_for_order(self.order)
+
+        send_sms.assert_called_once()
+        self.assertEqual(SMSNotificationLog.objects.filter(status='success').count(), 2)
+
     def test_inactive_and_non_paid_orders_do_not_send(self):
         self.config.is_active = False
         self.config.save()
-        with patch('finance.services.sms.send_custom_sms') as send_sms:
+        with patch('finance.services.sms.send_bulk_sms') as send_sms:
             send_sms_notifications_for_order(self.order)
             send_sms.assert_not_called()
 
@@ -61,7 +79,7 @@ class SMSNotificationTestCase(TestCase):
         self.config.save()
         self.order.status = Order.OrderStatus.PENDING
         self.order.save()
-        with patch('finance.services.sms.send_custom_sms') as send_sms:
+        with patch('finance.services.sms.send_bulk_sms') as send_sms:
             send_sms_notifications_for_order(self.order)
             send_sms.assert_not_called()
 
@@ -90,3 +108,82 @@ class SMSNotificationTestCase(TestCase):
         self.assertIn('[تست]', test_log.message)
         self.assertIsNone(test_log.order)
         self.assertEqual(test_log.status, 'success')
+
+
+class _StubSMSHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        self.server.requests.append((self.path, self.headers.get('X-API-KEY'), body))
+        payload = json.dumps({'status': 1, 'message': 'ok', 'data': {}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class SMSStubServerTestCase(TestCase):
+    """Exercise the real HTTP path against a local stand-in for sms.ir."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), _StubSMSHandler)
+        cls.server.requests = []
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.settings_override = override_settings(
+            SMS_IR_API_KEY='stub-key',
+            SMS_IR_BASE_URL=f'http://127.0.0.1:{cls.server.server_port}/v1/send',
+        )
+        cls.settings_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings_override.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.requests.clear()
+        owner = User.objects.create_user(username='owner', password='x', role='admin')
+        customer = User.objects.create_user(username='customer', password='x', role='student')
+        product = Product.objects.create(
+            title='Test product', description='Test', price=1000,
+            product_type='course', creator=owner,
+        )
+        self.order = Order.objects.create(user=customer, total_amount=1000, status=Order.OrderStatus.PAID)
+        OrderItem.objects.create(order=self.order, product=product, price=1000)
+        self.phones = ['09120000001', '09120000002', '09120000003']
+
+    def test_bulk_config_sends_one_request_for_all_recipients(self):
+        SMSNotificationConfig.objects.create(
+            name='Bulk', template_text='Order {order_code}', custom_phone_numbers=self.phones,
+        )
+
+        send_sms_notifications_for_order(self.order)
+
+        self.assertEqual(len(self.server.requests), 1)
+        path, api_key, body = self.server.requests[0]
+        self.assertEqual(path, '/v1/send/bulk')
+        self.assertEqual(api_key, 'stub-key')
+        self.assertEqual(body['mobiles'], self.phones)
+        self.assertEqual(SMSNotificationLog.objects.filter(order=self.order, status='success').count(), 3)
+
+    def test_pattern_config_sends_each_recipient_concurrently(self):
+        SMSNotificationConfig.objects.create(
+            name='Pattern', message_type=SMSNotificationConfig.MessageType.VERIFY,
+            template_id=1234, template_parameters={'CODE': '{order_code}'},
+            custom_phone_numbers=self.phones,
+        )
+
+        send_sms_notifications_for_order(self.order)
+
+        self.assertEqual(len(self.server.requests), 3)
+        self.assertEqual({body['mobile'] for _, _, body in self.server.requests}, set(self.phones))
+        self.assertTrue(all(path == '/v1/send/verify' for path, _, _ in self.server.requests))
+        self.assertEqual(SMSNotificationLog.objects.filter(order=self.order, status='success').count(), 3)
@@ -1,10 +1,10 @@
 from unittest.mock import patch, MagicMock
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from rest_framework.test import APIClient
 from rest_framework import status
-from finance.models import Order, OrderItem, Payment, PaymentLog
+from finance.models import Order, OrderItem, Payment, PaymentLog, UserAccess
 from finance.services.zibal import (
     tomans_to_rials, request_payment_service, verify_payment_service,
     inquiry_payment_service, process_callback_service
@@ -205,3 +205,116 @@ class ZibalIntegrationTestCase(TestCase):
         self.assertIn('payment', response.data)
         self.assertEqual(response.data['payment']['track_id'], 123456789)
 
+
+
+class GrantOrderAccessTestCase(TestCase):
+    def setUp(self):
+        from courses.models import Course
+        from tests.models import TestCollection
+        self.teacher = User.objects.create_user(username="teacher", password="x", role="teacher")
+        self.student = User.objects.create_user(username="student", password="x", role="student")
+        self.course = Course.objects.create(title="Course", description="d", teacher=self.teacher)
+        self.linked_collection = TestCollection.objects.create(name="Linked", created_by=self.teacher)
+        self.linked_collection.courses.add(self.course)
+        self.collection = TestCollection.objects.create(name="Standalone", created_by=self.teacher)
+        self.course_product = Product.objects.create(
+            title="Course product", description="d", price=1000,
+            product_type="course", creator=self.teacher, course=self.course,
+        )
+        self.test_product = Product.objects.create(
+            title="Test product", description="d", price=1000,
+            product_type="test", creator=self.teacher, test=self.collection,
+        )
+        self.order = Order.objects.create(user=self.student, total_amount=2000, status=Order.OrderStatus.PAID)
+        for product in (self.course_product, self.test_product):
+            OrderItem.objects.create(order=self.order, product=product, price=1000)
+
+    def test_grants_access_and_enrollments_in_bulk(self):
+        from finance.services.access import grant_order_access, order_access_granted
+        received = []
+        handler = lambda **kwargs: received.append(kwargs)
+        order_access_granted.connect(handler)
+        self.addCleanup(order_access_granted.disconnect, handler)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            granted = grant_order_access(self.order)
+
+        self.assertEqual(sorted(granted), sorted([self.course_product.id, self.test_product.id]))
+        self.assertEqual(UserAccess.objects.filter(user=self.student, order=self.order, is_active=True).count(), 2)
+        self.assertTrue(self.course.students.filter(id=self.student.id).exists())
+        self.assertTrue(self.collection.students.filter(id=self.student.id).exists())
+        self.assertTrue(self.linked_collection.students.filter(id=self.student.id).exists())
+        self.assertEqual(len(received), 1)
+        self.assertEqual(received[0]["collection_ids"], sorted([self.collection.id, self.linked_collection.id]))
+
+    @override_settings(JOBS_RUN_EAGERLY=True)
+    def test_granted_collections_get_progress_rows(self):
+        from finance.services.access import grant_order_access
+        from tests.models import StudentProgress
+
+        with self.captureOnCommitCallbacks(execute=True):
+            grant_order_access(self.order)
+        self.assertEqual(
+            sorted(StudentProgress.objects.filter(student=self.student).values_list('test_collection_id', flat=True)),
+            sorted([self.collection.id, self.linked_collection.id]),
+        )
+
+    def test_teachers_are_not_added_to_course_collections(self):
+        from finance.services.access import grant_order_access
+        self.order.user = self.teacher
+        self.order.save()
+
+        grant_order_access(self.order)
+
+        self.assertTrue(self.course.students.filter(id=self.teacher.id).exists())
+        self.assertTrue(self.collection.students.filter(id=self.teacher.id).exists())
+        self.assertFalse(self.linked_collection.students.filter(id=self.teacher.id).exists())
+
+    def test_reactivates_existing_access_for_new_order(self):
+        from finance.services.access import grant_order_access
+        old_order = Order.objects.create(user=self.student, total_amount=1000)
+        UserAccess.objects.create(user=self.student, product=self.course_product, order=old_order, is_active=False)
+
+        grant_order_access(self.order)
+        grant_order_access(self.order)
+
+        access = UserAccess.objects.get(user=self.student, product=self.course_product)
+        self.assertEqual(access.order, self.order)
+        self.assertTrue(access.is_active)
+        self.assertEqual(self.course.students.count(), 1)
+
+
+class QueryBudgetTestCase(TestCase):
+    """Query counts of the order lists must not grow with the number of orders."""
+
+    def setUp(self):
+        self.admin = User.objects.create_user(username="admin", password="x", role="admin")
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def add_order(self, name):
+        buyer = User.objects.create_user(username=name, password="x", role="student")
+        order = Order.objects.create(user=buyer, total_amount=2000, status=Order.OrderStatus.PAID)
+        for title in ("Course", "Book"):
+            product = Product.objects.create(
+                title=f"{name} {title}", description="d", price=1000, product_type="course", creator=self.admin,
+            )
+            OrderItem.objects.create(order=order, product=product, price=1000)
+        return order
+
+    def assertConstantQueries(self, count, url):
+        self.add_order("alice")
+        with self.assertNumQueries(count):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.add_order("bob")
+        with self.assertNumQueries(count):
+            response = self.client.get(url)
+        return response.json()
+
+    def test_order_list(self):
+        data = self.assertConstantQueries(4, "/api/finance/orders/")
+        self.assertEqual(len(data["results"]), 2)
+
+    def test_admin_dashboard(self):
+        data = self.assertConstantQueries(8, "/api/finance/admin/dashboard/")
+        self.assertEqual(data["statistics"]["total_revenue"], 4000)
@@ -6,6 +6,7 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404, redirect
 from django.db import transaction, models
+from django.db.models import Prefetch, Sum
 from django.utils import timezone
 from django.conf import settings
 import requests
@@ -21,12 +22,13 @@ from .serializers import (
     PaymentInquiryRequestSerializer
     , SMSNotificationConfigSerializer, SMSNotificationLogSerializer
 )
-from shop.models import Product
+from shop.models import Product, active_discounts_prefetch
 from accounts.models import UserProfile
-from .notifications import send_purchase_notification_email, send_payment_confirmation_email, send_product_access_granted_email
-from .services.sms import schedule_sms_notifications_for_order, send_test_sms_notification
-from spotplayer.services import provision_licenses_for_order
+from .services.access import grant_order_access
+from .services.sms import send_test_sms_notification
+from .tasks import enqueue_order_email, enqueue_order_fulfillment
 from accounts.permissions import IsAdmin, IsTeacherOrAdmin, IsAdminOrFinance, IsStaffUser
+from api.db_routers import use_replica
 from tests.pagination import CustomPageNumberPagination
 from .services.zibal import (
     tomans_to_rials, request_payment_service, verify_payment_service,
@@ -51,35 +53,21 @@ def get_client_ip(request):
 
 def grant_product_access(order):
     """Grant access to products when order is paid. Does NOT send emails — callers handle that."""
-    for item in order.items.all():
-        access, created = UserAccess.objects.get_or_create(
-            user=order.user,
-            product=item.product,
-            defaults={
-                'order': order,
-                'is_active': True,
-            }
-        )
-        course = getattr(item.product, 'course', None)
-        if course:
-            course.students.add(order.user)
-            course.save()
-
-        test_collection = getattr(item.product, 'test', None)
-        if test_collection:
-            test_collection.students.add(order.user)
-            test_collection.save()
-
-        if not created:
-            access.order = order
-            access.is_active = True
-            access.save()
+    return grant_order_access(order)
 
 
 # ---------------------------------------------------------------------------
 # ViewSets
 # ---------------------------------------------------------------------------
 
+def with_order_details(orders):
+    """Load everything OrderSerializer shows (buyer, items, products, discounts) up front."""
+    return orders.select_related('user__profile').prefetch_related(
+        Prefetch('items', queryset=OrderItem.objects.select_related('product__creator__profile')),
+        active_discounts_prefetch('items__product__'),
+    )
+
+
 class OrderViewSet(viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     pagination_class = CustomPageNumberPagination
@@ -88,8 +76,8 @@ class OrderViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         user = self.request.user
         if user.role in ('admin', 'finance') or user.is_staff or user.is_superuser:
-            return Order.objects.all().select_related('user').prefetch_related('items__product').order_by('-created_at', '-id')
-        return Order.objects.filter(user=user).select_related('user').prefetch_related('items__product').order_by('-created_at', '-id')
+            return with_order_details(Order.objects.all()).order_by('-created_at', '-id')
+        return with_order_details(Order.objects.filter(user=user)).order_by('-created_at', '-id')
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -102,11 +90,8 @@ class OrderViewSet(viewsets.ModelViewSet):
         input_serializer.is_valid(raise_exception=True)
         order = input_serializer.save()
 
-        # Send admin notification (best-effort)
-        try:
-            send_purchase_notification_email(order)
-        except Exception:
-            pass
+        # Admin notification is sent by the job worker
+        enqueue_order_email(order, 'purchase_notification')
 
         # Initiate payment via Zibal service
         payment = Payment.objects.create(
@@ -158,19 +143,8 @@ class OrderViewSet(viewsets.ModelViewSet):
 
             if new_status == Order.OrderStatus.PAID:
                 grant_product_access(order)
-                # Best-effort: create DRM licenses so the checkout never fails.
-                provision_licenses_for_order(order)
-                try:
-                    send_product_access_granted_email(order)
-                    send_payment_confirmation_email(order)
-                except Exception as e:
-                    logger.warning("Email error in update_status: %s", e)
-                
-                # Send SMS notifications
-                try:
-                    schedule_sms_notifications_for_order(order)
-                except Exception as e:
-                    logger.warning("SMS notification error in update_status: %s", e)
+                # DRM licenses, emails and SMS run in the job worker
+                enqueue_order_fulfillment(order)
 
             return Response({
                 'message': f'Order status updated to {new_status}',
@@ -232,6 +206,7 @@ class TransactionViewSet(viewsets.ModelViewSet):
         return qs
 
     @action(detail=False, methods=['get'])
+    @use_replica
     def stats(self, request):
         """Get summary stats for transactions matching current filters."""
         qs = self.filter_queryset(self.get_queryset())
@@ -283,21 +258,8 @@ class TransactionViewSet(viewsets.ModelViewSet):
             except UserProfile.DoesNotExist:
                 pass
 
-        # Provision DRM licenses best-effort (outside atomic so HTTP calls
-        # cannot block/rollback the order transaction).
-        provision_licenses_for_order(order)
-
-        # Send emails outside atomic block
-        try:
-            send_product_access_granted_email(order)
-        except Exception as e:
-            logger.warning("Email error in perform_create: %s", e)
-        
-        # Send SMS notifications
-        try:
-            schedule_sms_notifications_for_order(order)
-        except Exception as e:
-            logger.warning("SMS notification error in perform_create: %s", e)
+        # DRM licenses, the access email and SMS run in the job worker
+        enqueue_order_fulfillment(order, emails=('product_access_granted',))
 
 
 class SMSNotificationConfigViewSet(viewsets.ModelViewSet):
@@ -395,13 +357,14 @@ class UserAccessViewSet(viewsets.ReadOnlyModelViewSet):
 class AdminDashboardView(APIView):
     permission_classes = [permissions.IsAuthenticated, IsAdminOrFinance]
 
+    @use_replica
     def get(self, request):
         total_orders = Order.objects.count()
         pending_orders = Order.objects.filter(status=Order.OrderStatus.PENDING).count()
-        total_revenue = sum(
-            order.total_amount for order in Order.objects.filter(status=Order.OrderStatus.PAID)
-        )
-        recent_orders = Order.objects.order_by('-created_at')[:10]
+        total_revenue = Order.objects.filter(status=Order.OrderStatus.PAID).aggregate(
+            total=Sum('total_amount')
+        )['total'] or 0
+        recent_orders = with_order_details(Order.objects.order_by('-created_at'))[:10]
         recent_transactions = Transaction.objects.order_by('-created_at')[:10]
 
         return Response({
@@ -590,22 +553,8 @@ class PaymentCallbackView(APIView):
 
                     grant_product_access(payment.order)
 
-                provision_licenses_for_order(payment.order)
-
-                try:
-                    send_product_access_granted_email(payment.order)
-                except Exception as e:
-                    logger.warning("Could not send product access email: %s", e)
-                try:
-                    send_payment_confirmation_email(payment.order)
-                except Exception as e:
-                    logger.warning("Could not send payment confirmation email: %s", e)
-                
-                # Send SMS notifications
-                try:
-                    schedule_sms_notifications_for_order(payment.order)
-                except Exception as e:
-                    logger.warning("SMS notification error in callback: %s", e)
+                    # DRM licenses, emails and SMS run in the job worker
+                    enqueue_order_fulfillment(payment.order)
 
             return redirect(f"{FRONTEND_URL}/payment/success?refNumber={ref_number}&trackId={track_id}")
         else:
@@ -682,13 +631,8 @@ class PaymentInquiryView(APIView):
                 )
                 grant_product_access(payment.order)
 
-            provision_licenses_for_order(payment.order)
-            
-            # Send SMS notifications
-            try:
-                schedule_sms_notifications_for_order(payment.order)
-            except Exception as e:
-                logger.warning("SMS notification error in inquiry: %s", e)
+                # DRM licenses and SMS run in the job worker
+                enqueue_order_fulfillment(payment.order, emails=())
 
         return Response({
             "inquiry_success": success,
@@ -0,0 +1,29 @@
+from django.contrib import admin
+from unfold.admin import ModelAdmin
+from .models import Job, DeadLetterJob
+from .queue import requeue_dead_job
+
+
+@admin.register(Job)
+class JobAdmin(ModelAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'max_attempts', 'run_at', 'finished_at')
+    list_filter = ('status', 'name', 'created_at')
+    search_fields = ('name', 'idempotency_key', 'last_error')
+    readonly_fields = ('created_at', 'updated_at', 'locked_at', 'locked_by', 'finished_at')
+    list_per_page = 50
+
+    actions = ['requeue_jobs']
+
+    def requeue_jobs(self, request, queryset):
+        for job in queryset.filter(status=Job.Status.DEAD):
+            requeue_dead_job(job)
+        self.message_user(request, "Dead jobs requeued.")
+    requeue_jobs.short_description = "Requeue selected dead jobs"
+
+
+@admin.register(DeadLetterJob)
+class DeadLetterJobAdmin(ModelAdmin):
+    list_display = ('job', 'name', 'attempts', 'failed_at')
+    list_filter = ('name', 'failed_at')
+    search_fields = ('name', 'error')
+    readonly_fields = ('job', 'name', 'payload', 'attempts', 'error', 'failed_at')
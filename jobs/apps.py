@@ -0,0 +1,13 @@
+from django.apps import AppConfig
+
+
+class JobsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'jobs'
+    verbose_name = 'Background Jobs'
+
+    def ready(self):
+        # Import every app's tasks module so handlers are registered in both
+        # web processes (enqueue) and the worker (execution).
+        from django.utils.module_loading import autodiscover_modules
+        autodiscover_modules('tasks')
@@ -0,0 +1,76 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from jobs.queue import default_worker_id, purge_finished_jobs, release_stale_jobs, run_pending
+
+
+class Command(BaseCommand):
+    help = "Run the background job worker (emails, SMS, DRM licenses, live streams)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process the currently due jobs and exit',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10,
+            help='Jobs claimed per poll (default: 10)',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=2.0,
+            help='Seconds to wait when the queue is empty (default: 2)',
+        )
+        parser.add_argument(
+            '--stale-after',
+            type=int,
+            default=600,
+            help='Requeue running jobs locked for longer than this many seconds (default: 600)',
+        )
+        parser.add_argument(
+            '--maintenance-interval',
+            type=int,
+            default=300,
+            help='Seconds between requeueing stale jobs and purging old succeeded ones (default: 300)',
+        )
+
+    def handle(self, *args, **options):
+        worker_id = default_worker_id()
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        self.stdout.write(self.style.NOTICE(f"Job worker {worker_id} started"))
+        next_maintenance = 0
+        while not self._stopping:
+            if time.monotonic() >= next_maintenance:
+                self._maintain(options['stale_after'])
+                next_maintenance = time.monotonic() + options['maintenance_interval']
+            processed = run_pending(worker_id, limit=options['batch_size'])
+            if options['once']:
+                if processed:
+                    continue
+                break
+            if not processed:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f"Job worker {worker_id} stopped"))
+
+    def _maintain(self, stale_after):
+        released = release_stale_jobs(stale_after)
+        if released:
+            self.stdout.write(self.style.WARNING(f"Requeued {released} stale job(s)"))
+        retention_days = getattr(settings, 'JOB_RETENTION_DAYS', 7)
+        if retention_days:
+            purged = purge_finished_jobs(retention_days)
+            if purged:
+                self.stdout.write(f"Purged {purged} succeeded job(s) older than {retention_days} day(s)")
+
+    def _stop(self, signum, frame):
+        self._stopping = True
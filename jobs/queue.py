@@ -0,0 +1,218 @@
+"""
+DB-backed background job queue.
+
+Slow side effects (emails, SMS, DRM provisioning, live stream creation) are
+registered as tasks with the `@task` decorator and enqueued as `Job` rows.
+The `run_jobs` management command claims due jobs, runs them, retries
+failures with exponential backoff and moves exhausted jobs to the
+dead-letter table.
+
+Jobs are written in the caller's transaction, so a rolled-back request never
+leaves a job behind. With JOBS_RUN_EAGERLY (tests, single-process dev) each
+job is also executed in-process right after commit.
+"""
+import logging
+import os
+import random
+import socket
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import DeadLetterJob, Job
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for the delay between two attempts of one job
+MAX_BACKOFF_SECONDS = 3600
+
+_registry = {}
+
+
+class UnknownTaskError(Exception):
+    """Raised when a job references a task name that is not registered."""
+
+
+def task(name=None, max_attempts=5, backoff=30):
+    """
+    Register a function as a background task.
+
+    The function is called with the job payload as keyword arguments, so the
+    payload must be JSON-serializable (pass ids, not model instances).
+    """
+    def decorator(func):
+        task_name = name or f"{func.__module__}.{func.__name__}"
+        func.task_name = task_name
+        func.max_attempts = max_attempts
+        func.backoff = backoff
+        _registry[task_name] = func
+        return func
+    return decorator
+
+
+def get_task(name):
+    try:
+        return _registry[name]
+    except KeyError:
+        raise UnknownTaskError(f"No task registered under '{name}'")
+
+
+def enqueue(func, idempotency_key=None, delay=0, **payload):
+    """
+    Enqueue a registered task. Returns the Job, or the existing Job when the
+    idempotency key has already been used.
+    """
+    defaults = {
+        'name': func.task_name,
+        'payload': payload,
+        'max_attempts': func.max_attempts,
+        'backoff_seconds': func.backoff,
+        'run_at': timezone.now() + timedelta(seconds=delay),
+    }
+
+    if idempotency_key:
+        try:
+            with transaction.atomic():
+                job, created = Job.objects.get_or_create(idempotency_key=idempotency_key, defaults=defaults)
+        except IntegrityError:
+            job, created = Job.objects.get(idempotency_key=idempotency_key), False
+        if not created:
+            logger.debug("Job with idempotency key %s already exists (#%s)", idempotency_key, job.id)
+            return job
+    else:
+        job = Job.objects.create(**defaults)
+
+    if getattr(settings, 'JOBS_RUN_EAGERLY', False) and not delay:
+        transaction.on_commit(lambda job_id=job.id: _run_eagerly(job_id), robust=True)
+    return job
+
+
+def _run_eagerly(job_id):
+    if claim_job(job_id, worker_id='eager'):
+        run_job(Job.objects.get(id=job_id))
+
+
+def _backoff_delay(job):
+    delay = min(job.backoff_seconds * (2 ** max(job.attempts - 1, 0)), MAX_BACKOFF_SECONDS)
+    return delay + random.uniform(0, delay * 0.1)
+
+
+def default_worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def claim_job(job_id, worker_id):
+    """Atomically move one pending job to running. Returns True if this worker won it."""
+    return Job.objects.filter(id=job_id, status=Job.Status.PENDING).update(
+        status=Job.Status.RUNNING,
+        locked_at=timezone.now(),
+        locked_by=worker_id,
+        attempts=F('attempts') + 1,
+    ) == 1
+
+
+def claim_due_jobs(worker_id, limit=10):
+    """Claim up to `limit` due jobs, oldest first."""
+    due_ids = Job.objects.filter(
+        status=Job.Status.PENDING,
+        run_at__lte=timezone.now(),
+    ).order_by('run_at', 'id').values_list('id', flat=True)[:limit]
+    claimed = [job_id for job_id in list(due_ids) if claim_job(job_id, worker_id)]
+    return list(Job.objects.filter(id__in=claimed).order_by('run_at', 'id'))
+
+
+def run_job(job):
+    """Execute a claimed job and record its outcome. Returns True on success."""
+    try:
+        handler = get_task(job.name)
+        handler(**job.payload)
+    except Exception as exc:
+        logger.exception("Job %s #%s failed (attempt %s/%s)", job.name, job.id, job.attempts, job.max_attempts)
+        _record_failure(job, f"{exc.__class__.__name__}: {exc}")
+        return False
+
+    Job.objects.filter(id=job.id).update(
+        status=Job.Status.SUCCEEDED,
+        finished_at=timezone.now(),
+        last_error='',
+        updated_at=timezone.now(),
+    )
+    return True
+
+
+def _record_failure(job, error):
+    now = timezone.now()
+    if job.attempts >= job.max_attempts:
+        with transaction.atomic():
+            Job.objects.filter(id=job.id).update(
+                status=Job.Status.DEAD, last_error=error, finished_at=now, updated_at=now,
+            )
+            DeadLetterJob.objects.update_or_create(
+                job=job,
+                defaults={
+                    'name': job.name,
+                    'payload': job.payload,
+                    'attempts': job.attempts,
+                    'error': error,
+                },
+            )
+        logger.error("Job %s #%s moved to dead letter after %s attempts", job.name, job.id, job.attempts)
+        return
+
+    Job.objects.filter(id=job.id).update(
+        status=Job.Status.PENDING,
+        run_at=now + timedelta(seconds=_backoff_delay(job)),
+        last_error=error,
+        locked_at=None,
+        locked_by='',
+        updated_at=now,
+    )
+
+
+def release_stale_jobs(timeout_seconds):
+    """Return jobs whose worker died mid-run to the pending state."""
+    cutoff = timezone.now() - timedelta(seconds=timeout_seconds)
+    return Job.objects.filter(status=Job.Status.RUNNING, locked_at__lt=cutoff).update(
+        status=Job.Status.PENDING,
+        locked_at=None,
+        locked_by='',
+        run_at=timezone.now(),
+    )
+
+
+def purge_finished_jobs(retention_days):
+    """
+    Delete succeeded jobs finished more than `retention_days` ago. Their
+    idempotency keys are freed with them, so keys that must stay unique
+    longer than that need to carry their own date or id.
+    """
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    deleted, _ = Job.objects.filter(status=Job.Status.SUCCEEDED, finished_at__lt=cutoff).delete()
+    return deleted
+
+
+def requeue_dead_job(job):
+    """Give a dead job a fresh set of attempts."""
+    with transaction.atomic():
+        DeadLetterJob.objects.filter(job=job).delete()
+        Job.objects.filter(id=job.id).update(
+            status=Job.Status.PENDING,
+            attempts=0,
+            run_at=timezone.now(),
+            finished_at=None,
+            locked_at=None,
+            locked_by='',
+        )
+
+
+def run_pending(worker_id=None, limit=10):
+    """Claim and run one batch of due jobs. Returns the number of jobs processed."""
+    worker_id = worker_id or default_worker_id()
+    jobs = claim_due_jobs(worker_id, limit=limit)
+    for job in jobs:
+        close_old_connections()
+        run_job(job)
+    return len(jobs)
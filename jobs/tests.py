@@ -0,0 +1,122 @@
+from datetime import timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from jobs.models import DeadLetterJob, Job
+from jobs.queue import enqueue, run_pending, task
+
+calls = []
+
+
+@task(name='jobs.tests.record', max_attempts=2, backoff=10)
+def record(value):
+    calls.append(value)
+
+
+@task(name='jobs.tests.explode', max_attempts=2, backoff=10)
+def explode():
+    raise RuntimeError('provider down')
+
+
+class JobQueueTestCase(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def test_enqueue_is_idempotent(self):
+        first = enqueue(record, idempotency_key='order:1:email', value=1)
+        second = enqueue(record, idempotency_key='order:1:email', value=2)
+
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_worker_runs_due_jobs(self):
+        enqueue(record, value='a')
+        enqueue(record, value='later', delay=3600)
+
+        self.assertEqual(run_pending(limit=10), 1)
+        self.assertEqual(calls, ['a'])
+        self.assertEqual(Job.objects.filter(status=Job.Status.SUCCEEDED).count(), 1)
+        self.assertEqual(Job.objects.filter(status=Job.Status.PENDING).count(), 1)
+
+    def test_failed_job_is_retried_with_backoff_then_dead_lettered(self):
+        job = enqueue(explode)
+
+        run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('provider down', job.last_error)
+
+        Job.objects.filter(id=job.id).update(run_at=timezone.now())
+        run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.Status.DEAD)
+        self.assertTrue(DeadLetterJob.objects.filter(job=job, attempts=2).exists())
+
+    @override_settings(JOBS_RUN_EAGERLY=True)
+    def test_eager_mode_runs_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            job = enqueue(record, value='eager')
+
+        job.refresh_from_db()
+        self.assertEqual(calls, ['eager'])
+        self.assertEqual(job.status, Job.Status.SUCCEEDED)
+
+    def test_worker_purges_old_jobs_and_requeues_stale_ones(self):
+        old, recent, dead, stale = (enqueue(record, value=i, delay=3600) for i in range(4))
+        long_ago = timezone.now() - timedelta(days=8)
+        Job.objects.filter(id__in=[old.id, dead.id]).update(finished_at=long_ago)
+        Job.objects.filter(id__in=[old.id, recent.id]).update(status=Job.Status.SUCCEEDED)
+        Job.objects.filter(id=recent.id).update(finished_at=timezone.now())
+        Job.objects.filter(id=dead.id).update(status=Job.Status.DEAD)
+        Job.objects.filter(id=stale.id).update(status=Job.Status.RUNNING, locked_at=long_ago)
+
+        with override_settings(JOB_RETENTION_DAYS=7):
+            call_command('run_jobs', once=True, stdout=StringIO())
+
+        self.assertFalse(Job.objects.filter(id=old.id).exists())
+        self.assertEqual(set(Job.objects.values_list('id', flat=True)), {recent.id, dead.id, stale.id})
+        # The requeued job was due again and ran in the same pass
+        self.assertEqual(Job.objects.get(id=stale.id).status, Job.Status.SUCCEEDED)
+        self.assertEqual(calls, [3])
+
+
+class OrderFulfillmentJobsTestCase(TestCase):
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        from finance.models import Order
+        User = get_user_model()
+        self.user = User.objects.create_user(username='buyer', password='x', role='student')
+        self.order = Order.objects.create(user=self.user, total_amount=1000, status=Order.OrderStatus.PAID)
+
+    def test_fulfillment_is_enqueued_once_per_order(self):
+        from finance.tasks import enqueue_order_fulfillment
+        enqueue_order_fulfillment(self.order)
+        enqueue_order_fulfillment(self.order)
+
+        self.assertEqual(
+            sorted(Job.objects.values_list('idempotency_key', flat=True)),
+            sorted([
+                f'order:{self.order.id}:licenses',
+                f'order:{self.order.id}:email:product_access_granted',
+                f'order:{self.order.id}:email:payment_confirmation',
+                f'order:{self.order.id}:sms',
+            ])
+        )
+
+    @patch('finance.tasks.send_sms_notifications_for_order')
+    @patch('finance.tasks.provision_licenses_for_order', return_value=[])
+    def test_worker_runs_order_side_effects(self, provision, send_sms):
+        from finance.tasks import enqueue_order_fulfillment
+        enqueue_order_fulfillment(self.order, emails=())
+
+        run_pending()
+
+        provision.assert_called_once()
+        send_sms.assert_called_once()
+        self.assertFalse(Job.objects.exclude(status=Job.Status.SUCCEEDED).exists())
@@ -4,7 +4,7 @@ from .models import Subject, Chapter, Section, Lesson, TopicCategory, Topic, Stu
 
 class TopicSerializer(serializers.ModelSerializer):
     """سریالایزر برای مبحث"""
-    available_tests_count = serializers.ReadOnlyField(source='get_available_tests_count')
+    available_tests_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Topic
@@ -13,6 +13,12 @@ class TopicSerializer(serializers.ModelSerializer):
             'tags', 'estimated_study_time', 'available_tests_count'
         ]
 
+    def get_available_tests_count(self, obj):
+        # KnowledgeTreeView annotates the count instead of querying per topic
+        if hasattr(obj, 'active_tests_count'):
+            return obj.active_tests_count
+        return obj.get_available_tests_count()
+
 
 class FolderSerializer(serializers.ModelSerializer):
     children = serializers.SerializerMethodField()
@@ -25,14 +31,34 @@ class FolderSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'parent', 'description', 'order', 'depth', 'path_ids', 'children', 'questions_count']
 
     def get_children(self, obj):
-        children = obj.children.all().order_by('order', 'id')
+        # FolderViewSet.tree passes the whole tree in the context
+        tree = self.context.get('children')
+        if tree is not None:
+            children = tree.get(obj.id, [])
+        else:
+            children = obj.children.all().order_by('order', 'id')
         return FolderSerializer(children, many=True, context=self.context).data
 
     def get_questions_count(self, obj):
         """Get count of questions directly assigned to this folder"""
+        if hasattr(obj, 'questions_total'):
+            return obj.questions_total
         return obj.questions.count()
 
 
+def _count_prefetched(obj, *relations):
+    """
+    Count the objects at the end of a chain of prefetched relations (e.g. the
+    topics of a chapter), or None if any level was not prefetched.
+    """
+    nodes = [obj]
+    for relation in relations:
+        if any(relation not in getattr(node, '_prefetched_objects_cache', {}) for node in nodes):
+            return None
+        nodes = [child for node in nodes for child in getattr(node, relation).all()]
+    return len(nodes)
+
+
 class TopicCategorySerializer(serializers.ModelSerializer):
     """سریالایزر برای دسته موضوع"""
     topics = TopicSerializer(many=True, read_only=True)
@@ -56,7 +82,8 @@ class LessonSerializer(serializers.ModelSerializer):
         fields = ['id', 'section', 'name', 'order', 'description', 'topic_categories', 'total_topics']
     
     def get_total_topics(self, obj):
-        return Topic.objects.filter(topic_category__lesson=obj).count()
+        count = _count_prefetched(obj, 'topic_categories', 'topics')
+        return count if count is not None else Topic.objects.filter(topic_category__lesson=obj).count()
 
 
 class SectionSerializer(serializers.ModelSerializer):
@@ -69,7 +96,8 @@ class SectionSerializer(serializers.ModelSerializer):
         fields = ['id', 'chapter', 'name', 'order', 'description', 'lessons', 'total_topics']
     
     def get_total_topics(self, obj):
-        return Topic.objects.filter(topic_category__lesson__section=obj).count()
+        count = _count_prefetched(obj, 'lessons', 'topic_categories', 'topics')
+        return count if count is not None else Topic.objects.filter(topic_category__lesson__section=obj).count()
 
 
 class ChapterSerializer(serializers.ModelSerializer):
@@ -82,13 +110,14 @@ class ChapterSerializer(serializers.ModelSerializer):
         fields = ['id', 'subject', 'name', 'order', 'description', 'sections', 'total_topics']
     
     def get_total_topics(self, obj):
-        return Topic.objects.filter(topic_category__lesson__section__chapter=obj).count()
+        count = _count_prefetched(obj, 'sections', 'lessons', 'topic_categories', 'topics')
+        return count if count is not None else obj.get_total_topics()
 
 
 class SubjectSerializer(serializers.ModelSerializer):
     """سریالایزر برای کتاب درسی"""
     chapters = ChapterSerializer(many=True, read_only=True)
-    total_topics = serializers.ReadOnlyField(source='get_total_topics')
+    total_topics = serializers.SerializerMethodField()
     book_file_title = serializers.CharField(source='book_file.title', read_only=True)
     book_file_url = serializers.URLField(source='book_file.arvan_url', read_only=True)
     
@@ -100,6 +129,10 @@ class SubjectSerializer(serializers.ModelSerializer):
             'chapters', 'total_topics'
         ]
 
+    def get_total_topics(self, obj):
+        count = _count_prefetched(obj, 'chapters', 'sections', 'lessons', 'topic_categories', 'topics')
+        return count if count is not None else obj.get_total_topics()
+
 
 class StudentTopicProgressSerializer(serializers.ModelSerializer):
     """سریالایزر برای پیشرفت دانش‌آموز در مبحث"""
@@ -0,0 +1,59 @@
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from accounts.models import User
+from tests.models import Question
+from .models import Chapter, Folder, Lesson, Section, Subject, Topic, TopicCategory
+
+
+class QueryBudgetTestCase(TestCase):
+    """Query counts of the hot knowledge endpoints must not grow with the data."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='teacher', password='x', role='teacher')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_folders(self, prefix):
+        root = Folder.objects.create(name=f'{prefix} root')
+        child = Folder.objects.create(name=f'{prefix} child', parent=root)
+        leaf = Folder.objects.create(name=f'{prefix} leaf', parent=child)
+        question = Question.objects.create(question_text=f'{prefix} question', created_by=self.user)
+        question.folders.add(child, leaf)
+        return leaf
+
+    def test_folder_tree(self):
+        self.add_folders('a')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/knowledge/folders/tree/')
+        self.assertEqual(response.status_code, 200)
+
+        leaf = self.add_folders('b')
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/knowledge/folders/tree/')
+        tree = {root['name']: root for root in response.json()}
+        child = tree['b root']['children'][0]
+        self.assertEqual(child['questions_count'], 1)
+        self.assertEqual(child['children'][0]['path_ids'], leaf.path_ids)
+        self.assertEqual(child['children'][0]['depth'], 2)
+
+    def add_subject(self, name):
+        subject = Subject.objects.create(name=name, grade=10)
+        chapter = Chapter.objects.create(subject=subject, name='Chapter', order=1)
+        section = Section.objects.create(chapter=chapter, name='Section', order=1)
+        lesson = Lesson.objects.create(section=section, name='Lesson', order=1)
+        category = TopicCategory.objects.create(lesson=lesson, name='Category', order=1)
+        for order in range(2):
+            Topic.objects.create(topic_category=category, name=f'Topic {order}', order=order)
+
+    def test_knowledge_tree(self):
+        self.add_subject('Math')
+        with self.assertNumQueries(6):
+            response = self.client.get('/api/knowledge/knowledge-tree/')
+        self.assertEqual(response.status_code, 200)
+
+        self.add_subject('Physics')
+        with self.assertNumQueries(6):
+            response = self.client.get('/api/knowledge/knowledge-tree/')
+        self.assertEqual([subject['total_topics'] for subject in response.json()], [2, 2])
+        self.assertEqual(response.json()[0]['chapters'][0]['total_topics'], 2)
@@ -1,9 +1,11 @@
+from collections import defaultdict
+
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from django.shortcuts import get_object_or_404
-from django.db.models import Count, Avg, Q
+from django.db.models import Count, Avg, Prefetch, Q
 from django.utils import timezone
 
 from .models import Subject, Chapter, Section, Lesson, TopicCategory, Topic, StudentTopicProgress, Folder
@@ -254,8 +256,18 @@ class FolderViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def tree(self, request):
-        roots = Folder.objects.filter(parent__isnull=True).order_by('order', 'id')
-        data = FolderSerializer(roots, many=True).data
+        # Load every folder once and link parents/children in memory, so
+        # depth, path_ids, children and question counts cost no extra queries
+        folders = {
+            folder.id: folder
+            for folder in Folder.objects.annotate(questions_total=Count('questions')).order_by('order', 'id')
+        }
+        children = defaultdict(list)
+        for folder in folders.values():
+            if folder.parent_id is not None:
+                folder.parent = folders[folder.parent_id]
+            children[folder.parent_id].append(folder)
+        data = FolderSerializer(children[None], many=True, context={'children': children}).data
         return Response(data)
 
     @action(detail=False, methods=['get'])
@@ -406,8 +418,11 @@ class KnowledgeTreeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
     
     def get(self, request):
-        subjects = Subject.objects.filter(is_active=True).prefetch_related(
-            'chapters__sections__lessons__topic_categories__topics'
+        topics = Topic.objects.annotate(
+            active_tests_count=Count('topic_tests', filter=Q(topic_tests__is_active=True))
+        )
+        subjects = Subject.objects.filter(is_active=True).select_related('book_file').prefetch_related(
+            Prefetch('chapters__sections__lessons__topic_categories__topics', queryset=topics)
         )
         serializer = SubjectSerializer(subjects, many=True)
         return Response(serializer.data)
@@ -6,6 +6,8 @@ from courses.models import Course
 from tests.models import TestCollection
 from django.utils import timezone
 from django.core.exceptions import ValidationError
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
 
 class Product(models.Model):
@@ -47,10 +49,13 @@ class Product(models.Model):
     @property
     def current_price(self):
         """Get current price considering active discounts"""
-        active_discount = self.discounts.filter(
-            expire_at__gt=timezone.now(),
-            is_active=True
-        ).first()
+        if hasattr(self, 'active_discounts'):
+            active_discount = self.active_discounts[0] if self.active_discounts else None
+        else:
+            active_discount = self.discounts.filter(
+                expire_at__gt=timezone.now(),
+                is_active=True
+            ).first()
         
         if active_discount:
             discount_amount = (self.price * active_discount.percentage) // 100
@@ -59,6 +64,8 @@ class Product(models.Model):
     
     @property
     def has_active_discount(self):
+        if hasattr(self, 'active_discounts'):
+            return bool(self.active_discounts)
         return self.discounts.filter(
             expire_at__gt=timezone.now(),
             is_active=True
@@ -123,6 +130,19 @@ class Discount(models.Model):
         return False
 
 
+def active_discounts_prefetch(prefix=''):
+    """
+    Prefetch each product's active discounts as `active_discounts`, which
+    current_price and has_active_discount then use instead of querying.
+    `prefix` is the path to the products, e.g. 'items__product__'.
+    """
+    return models.Prefetch(
+        f'{prefix}discounts',
+        queryset=Discount.objects.filter(expire_at__gt=timezone.now(), is_active=True).order_by('pk'),
+        to_attr='active_discounts',
+    )
+
+
 class Coupon(models.Model):
     class DiscountType(models.TextChoices):
         PERCENTAGE = 'percentage', _('Percentage')
@@ -187,3 +207,12 @@ class Coupon(models.Model):
 
         return min(discount, total_amount)
 
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Discount)
+@receiver(post_delete, sender=Discount)
+def invalidate_product_pages(sender, instance, **kwargs):
+    """Retire the cached anonymous product pages (see ProductViewSet)."""
+    from api.cache import invalidate_on_commit
+    invalidate_on_commit('products')
@@ -6,7 +6,7 @@ from django.shortcuts import get_object_or_404, redirect, render
 from django.db import transaction
 from django.utils import timezone
 from django.urls import reverse
-from .models import Product, Discount, Coupon
+from .models import Product, Discount, Coupon, active_discounts_prefetch
 from .serializers import (
     ProductSerializer, ProductCreateSerializer, DiscountSerializer,
     DiscountCreateSerializer, CartSerializer, CartItemSerializer,
@@ -16,6 +16,7 @@ from finance.models import Order, OrderItem, UserAccess
 from finance.serializers import OrderSerializer, PurchaseRequestSerializer
 from accounts.utils import send_verification_email
 from django.conf import settings
+from api.http_cache import anonymous_variant, cache_response
 
 
 from .utils import user_has_product_access
@@ -35,12 +36,24 @@ class ProductViewSet(viewsets.ModelViewSet):
         serializer.save(creator=self.request.user)
 
     def get_queryset(self):
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('creator__profile').prefetch_related(
+            active_discounts_prefetch()
+        )
         product_type = self.request.query_params.get('type', None)
         if product_type:
             queryset = queryset.filter(product_type=product_type)
         return queryset
 
+    # `has_access` is per user, so only anonymous visitors share the cached pages.
+    # Discounts start and end on their own, hence the short timeout.
+    @cache_response('products', timeout=60, variant=anonymous_variant)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cache_response('products', timeout=60, variant=anonymous_variant)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     @action(detail=True, methods=['post'])
     def add_to_cart(self, request, pk=None):
         """Add product to cart (session-based for non-authenticated users)"""
@@ -669,8 +682,8 @@ class PurchaseView(APIView):
                 )
             
             # Grant access to digital products and enroll student
-            from finance.views import grant_product_access
-            grant_product_access(order)
+            from finance.services.access import grant_order_access
+            grant_order_access(order)
             
             # Create transaction record for free purchase
             from finance.models import Transaction
@@ -5,6 +5,7 @@ from .models import (
     StudentTestSessionLog, StudentAnswer, StudentProgress, Question, Option, QuestionImage,
     CustomTest, CustomTestSession, CustomTestAnswer
 )
+from .services import recompute_collection_progress
 
 
 class PrimaryKeyInline(TabularInline):
@@ -165,8 +166,11 @@ class StudentProgressAdmin(ModelAdmin):
     actions = ['update_all_progress']
     
     def update_all_progress(self, request, queryset):
-        for progress in queryset:
-            progress.update_progress()
+        students_by_collection = {}
+        for collection_id, student_id in queryset.values_list('test_collection_id', 'student_id'):
+            students_by_collection.setdefault(collection_id, []).append(student_id)
+        for collection in TestCollection.objects.filter(id__in=students_by_collection):
+            recompute_collection_progress(collection, students_by_collection[collection.id])
         self.message_user(request, f"{queryset.count()} پیشرفت بروزرسانی شد.")
     update_all_progress.short_description = "بروزرسانی پیشرفت انتخاب شده‌ها"
 
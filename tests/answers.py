@@ -0,0 +1,149 @@
+"""
+Batched StudentAnswer writer.
+
+Answers streamed over the exam websocket (tests/consumers.py) are not written
+one `update_or_create` at a time. `answer_writer.submit()` queues them in
+memory, where repeated answers to the same question collapse to the latest
+one. A background thread writes the queue every ANSWER_FLUSH_INTERVAL_MS, or
+sooner once ANSWER_FLUSH_BATCH_SIZE answers are waiting, as one upsert per
+batch.
+
+`submit()` returns a Future that resolves once the answer is stored, so
+callers can acknowledge only durable writes. Answers for sessions that were
+completed (or deleted) in the meantime are rejected: the session status is
+checked, with the rows locked, in the same transaction that writes the batch,
+so an answer never lands after completion. Every written batch is published
+to the live exam monitor (tests/monitor.py). Call `flush()` before grading or
+completing a session so nothing queued in this process is left behind; the
+exam websocket's "finish" event does this in the process holding the answers.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+
+from django.conf import settings
+from django.db import OperationalError, close_old_connections, transaction
+
+from .models import StudentAnswer, StudentTestSession
+from .monitor import publish_answers
+
+logger = logging.getLogger(__name__)
+
+
+class SessionClosedError(Exception):
+    """The answer's session was completed before the answer could be written."""
+
+
+class AnswerWriter:
+    def __init__(self, batch_size=None, flush_interval=None, max_retries=4):
+        self.batch_size = batch_size or getattr(settings, 'ANSWER_FLUSH_BATCH_SIZE', 200)
+        self.flush_interval = (flush_interval or getattr(settings, 'ANSWER_FLUSH_INTERVAL_MS', 250)) / 1000
+        self.max_retries = max_retries
+        self._pending = {}
+        self._futures = {}
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, session_id, question_number, answer):
+        """Queue an answer. Returns a Future resolved (with None) once it is written."""
+        future = Future()
+        with self._condition:
+            key = (session_id, question_number)
+            self._pending[key] = answer
+            self._futures.setdefault(key, []).append(future)
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+        self._ensure_thread()
+        return future
+
+    def flush(self):
+        """Write everything queued so far in the calling thread. Returns the number of answers written."""
+        # Writes are serialized so an older batch never lands after a newer one
+        with self._write_lock:
+            with self._condition:
+                pending, self._pending = self._pending, {}
+                futures, self._futures = self._futures, {}
+            if not pending:
+                return 0
+            return self._write(pending, futures)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='answer-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._pending) >= self.batch_size, timeout=self.flush_interval)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Answer writer flush failed")
+
+    def _write(self, pending, futures):
+        error = None
+        for attempt in range(self.max_retries):
+            try:
+                test_ids, answers = self._upsert(pending)
+                break
+            except OperationalError as exc:
+                if "database is locked" in str(exc) and attempt < self.max_retries - 1:
+                    time.sleep(0.2 * (attempt + 1))
+                    continue
+                logger.exception("Failed to write %s answer(s)", len(pending))
+                error = exc
+                break
+
+        if error is None:
+            by_session = defaultdict(dict)
+            for (session_id, question_number), answer in answers.items():
+                by_session[session_id][question_number] = answer
+            for session_id, session_answers in by_session.items():
+                publish_answers(test_ids[session_id], session_id, session_answers)
+
+        for key, key_futures in futures.items():
+            for future in key_futures:
+                if error is not None:
+                    future.set_exception(error)
+                elif key not in answers:
+                    future.set_exception(SessionClosedError(key[0]))
+                else:
+                    future.set_result(None)
+        return 0 if error else len(answers)
+
+    def _upsert(self, pending):
+        """
+        Write the answers of sessions that are not completed. Returns their
+        {session_id: test_id} and the answers written.
+        """
+        with transaction.atomic():
+            # The rows stay locked until commit, so FinishTestView cannot
+            # complete a session between this check and the write (on SQLite
+            # the write fails with "database is locked" and is retried instead)
+            test_ids = dict(
+                StudentTestSession.objects.select_for_update()
+                .filter(id__in={session_id for session_id, _ in pending})
+                .exclude(status='completed')
+                .values_list('id', 'test_id')
+            )
+            answers = {key: value for key, value in pending.items() if key[0] in test_ids}
+            if answers:
+                # One INSERT ... ON CONFLICT per batch, backed by unique_answer_per_question
+                StudentAnswer.objects.bulk_create(
+                    [
+                        StudentAnswer(session_id=session_id, question_number=question_number, answer=answer)
+                        for (session_id, question_number), answer in answers.items()
+                    ],
+                    batch_size=500,
+                    update_conflicts=True,
+                    unique_fields=['session', 'question_number'],
+                    update_fields=['answer'],
+                )
+        return test_ids, answers
+
+answer_writer = AnswerWriter()
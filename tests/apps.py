@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class TestsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tests'
+
+    def ready(self):
+        from finance.services.access import order_access_granted
+        from .models import refresh_progress_on_access_granted
+        order_access_granted.connect(refresh_progress_on_access_granted, dispatch_uid='tests.refresh_progress_on_access_granted')
@@ -0,0 +1,227 @@
+import asyncio
+import json
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from django.utils import timezone
+
+from .answers import SessionClosedError, answer_writer
+from .models import StudentTestSession, Test
+from .monitor import load_exam_stats, monitor_group_name
+
+
+class ExamConsumer(AsyncWebsocketConsumer):
+    """
+    Answer channel for one StudentTestSession: ws/exam/<session_id>/
+
+    The user is authenticated once by JWTAuthMiddleware and the session is
+    loaded once at connect. Client events:
+
+        {"type": "answer", "question_number": 3, "answer": 2, "seq": 17}
+        {"type": "answers", "answers": [{"question_number": 3, "answer": 2}], "seq": 18}
+        {"type": "finish", "seq": 19}
+
+    `answer` may be null to clear a question. Each event is queued on the
+    batched answer writer and acknowledged with {"type": "ack", "seq": ...}
+    once written (or {"type": "error", "seq": ...}). `finish` writes the
+    answers this process still has queued, completes the session, replies
+    {"type": "finished", "seq": ...} and closes; clients that stream answers
+    here should finish here too, since FinishTestView only sees the answers
+    queued in its own process. The server pushes
+    {"type": "tick", "remaining": seconds} every EXAM_TICK_SECONDS from its own
+    clock and {"type": "time_up"} at the session's end time, then closes.
+
+    SubmitAnswerView and FinishTestView remain the HTTP fallback.
+    """
+
+    async def connect(self):
+        self.user = self.scope['user']
+        self.session_id = int(self.scope['url_route']['kwargs']['session_id'])
+        self.pending_acks = set()
+        self.ticker = None
+
+        if not self.user.is_authenticated:
+            await self.close(code=4401)
+            return
+
+        session = await self.get_session()
+        if session is None or session.status != 'active' or session.is_expired():
+            await self.close(code=4403)
+            return
+
+        self.test_id = session.test_id
+        self.end_time = session.end_time
+
+        await self.accept()
+        await self.send_json({
+            'type': 'session',
+            'session_id': self.session_id,
+            'test_id': self.test_id,
+            'end_time': self.end_time.isoformat(),
+            'remaining': self.remaining(),
+        })
+        self.ticker = asyncio.ensure_future(self.tick())
+
+    async def disconnect(self, close_code):
+        if self.ticker is not None:
+            self.ticker.cancel()
+        # Answers already queued are still written; only their acks are dropped
+        for task in self.pending_acks:
+            task.cancel()
+
+    async def receive(self, text_data):
+        try:
+            event = json.loads(text_data)
+        except json.JSONDecodeError:
+            await self.send_json({'type': 'error', 'error': 'Invalid JSON'})
+            return
+
+        seq = event.get('seq')
+        if event.get('type') == 'finish':
+            await self.finish(seq)
+            return
+        if self.remaining() <= 0:
+            await self.send_json({'type': 'error', 'seq': seq, 'error': 'Time is up.'})
+            return
+
+        if event.get('type') == 'answer':
+            items = [event]
+        elif event.get('type') == 'answers' and isinstance(event.get('answers'), list):
+            items = event['answers']
+        else:
+            await self.send_json({'type': 'error', 'seq': seq, 'error': 'Unknown event type'})
+            return
+
+        try:
+            answers = [self.parse_answer(item) for item in items]
+        except (KeyError, ValueError, TypeError):
+            await self.send_json({
+                'type': 'error', 'seq': seq, 'error': 'question_number and answer must be integers'
+            })
+            return
+
+        futures = [
+            asyncio.wrap_future(answer_writer.submit(self.session_id, question_number, answer))
+            for question_number, answer in answers
+        ]
+        task = asyncio.ensure_future(self.ack(seq, futures))
+        self.pending_acks.add(task)
+        task.add_done_callback(self.pending_acks.discard)
+
+    @staticmethod
+    def parse_answer(item):
+        question_number = int(item['question_number'])
+        answer = item['answer']
+        answer = int(answer) if answer not in (None, '') else None
+        return question_number, answer
+
+    async def ack(self, seq, futures):
+        try:
+            await asyncio.gather(*futures)
+        except SessionClosedError:
+            await self.send_json({
+                'type': 'error', 'seq': seq,
+                'error': "You've submitted your answer sheet and you can no longer modify it.",
+            })
+        except Exception:
+            await self.send_json({'type': 'error', 'seq': seq, 'error': 'Answer could not be saved, please retry.'})
+        else:
+            await self.send_json({'type': 'ack', 'seq': seq})
+
+    async def finish(self, seq):
+        await self.complete_session()
+        # Answers written by the flush are acknowledged before the reply
+        await asyncio.gather(*self.pending_acks, return_exceptions=True)
+        await self.send_json({'type': 'finished', 'seq': seq})
+        await self.close()
+
+    async def tick(self):
+        interval = getattr(settings, 'EXAM_TICK_SECONDS', 10)
+        while True:
+            remaining = self.remaining()
+            if remaining <= 0:
+                await self.send_json({'type': 'time_up'})
+                await self.close()
+                return
+            await asyncio.sleep(min(interval, remaining))
+            await self.send_json({'type': 'tick', 'remaining': self.remaining()})
+
+    def remaining(self):
+        return max(0, int((self.end_time - timezone.now()).total_seconds()))
+
+    async def send_json(self, content):
+        await self.send(text_data=json.dumps(content))
+
+    @database_sync_to_async
+    def get_session(self):
+        return StudentTestSession.objects.filter(id=self.session_id, user=self.user).first()
+
+    @database_sync_to_async
+    def complete_session(self):
+        answer_writer.flush()
+        session = StudentTestSession.objects.get(id=self.session_id)
+        if session.status != 'completed':
+            session.exit_time = timezone.now()
+            session.status = 'completed'
+            session.save()
+
+
+class ExamMonitorConsumer(AsyncWebsocketConsumer):
+    """
+    Live counters for one test, for its teacher: ws/exam-monitor/<test_id>/
+
+    Sends {"type": "stats", ...ExamStats.snapshot()} on connect and then at
+    most every EXAM_MONITOR_PUSH_SECONDS while events keep arriving. The
+    database is read once at connect; see tests/monitor.py.
+    """
+
+    async def connect(self):
+        self.user = self.scope['user']
+        self.test_id = int(self.scope['url_route']['kwargs']['test_id'])
+        self.pusher = None
+
+        if not self.user.is_authenticated or not await self.can_monitor():
+            await self.close(code=4403)
+            return
+
+        self.group_name = monitor_group_name(self.test_id)
+        # Join before seeding so no event between the two is lost; replaying
+        # an event onto a fresh snapshot is harmless.
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        self.stats = await database_sync_to_async(load_exam_stats)(self.test_id)
+        await self.accept()
+        await self.push()
+
+    async def disconnect(self, close_code):
+        if self.pusher is not None:
+            self.pusher.cancel()
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def exam_session(self, event):
+        self.stats.apply_session(event['session_id'], event['status'])
+        self.schedule_push()
+
+    async def exam_answers(self, event):
+        answers = {int(question_number): answer for question_number, answer in event['answers'].items()}
+        self.stats.apply_answers(event['session_id'], answers)
+        self.schedule_push()
+
+    def schedule_push(self):
+        if self.pusher is None or self.pusher.done():
+            self.pusher = asyncio.ensure_future(self.push_later())
+
+    async def push_later(self):
+        await asyncio.sleep(getattr(settings, 'EXAM_MONITOR_PUSH_SECONDS', 1))
+        await self.push()
+
+    async def push(self):
+        await self.send(text_data=json.dumps({'type': 'stats', 'test_id': self.test_id, **self.stats.snapshot()}))
+
+    @database_sync_to_async
+    def can_monitor(self):
+        teacher_id = Test.objects.filter(id=self.test_id).values_list('teacher_id', flat=True).first()
+        if teacher_id is None:
+            return False
+        return self.user.id == teacher_id or self.user.is_staff or getattr(self.user, 'role', None) == 'admin'
@@ -0,0 +1,42 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import router, transaction
+from tests.models import StudentTestSessionLog
+from tests.session_logs import decode_entry, finished_spill_files, write_session_logs
+
+
+class Command(BaseCommand):
+    help = "Bulk-load spilled session log files (SESSION_LOG_DIR) into the database (suitable for cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dir',
+            default=getattr(settings, 'SESSION_LOG_DIR', None),
+            help='Spill directory (default: SESSION_LOG_DIR)',
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help="Also load the current hour's files (only when no worker is writing them)",
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        for path in finished_spill_files(options['dir'], include_current=options['all']):
+            with open(path, encoding='utf-8') as spill:
+                entries = []
+                for line in spill:
+                    try:
+                        entries.append(decode_entry(line))
+                    except (ValueError, KeyError, TypeError):
+                        self.stderr.write(f"Skipping malformed line in {path}")
+            # The file is removed only once its rows are committed
+            with transaction.atomic(using=router.db_for_write(StudentTestSessionLog)):
+                written = write_session_logs(entries)
+            os.remove(path)
+            total += written
+            self.stdout.write(f"{os.path.basename(path)}: {written} rows")
+
+        self.stdout.write(self.style.SUCCESS(f"Session logs loaded: {total}"))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from tests.models import TestCollection
+from tests.services import recompute_collection_progress
+
+
+class Command(BaseCommand):
+    help = "Recompute StudentProgress rows for test collections in bulk (suitable for cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--collection-id',
+            type=int,
+            help='Process only specific test collection ID',
+        )
+
+    def handle(self, *args, **options):
+        collections = TestCollection.objects.all()
+        if options['collection_id']:
+            collections = collections.filter(id=options['collection_id'])
+
+        total = 0
+        for collection in collections:
+            written = recompute_collection_progress(collection)
+            total += written
+            self.stdout.write(f"{collection.id} - {collection.name}: {written} progress rows")
+
+        self.stdout.write(self.style.SUCCESS(f"Progress recompute complete. Rows written: {total}"))
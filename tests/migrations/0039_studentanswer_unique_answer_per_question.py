@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-19 11:15
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def remove_duplicate_answers(apps, schema_editor):
+    """Keep only the latest row per (session, question_number) before the constraint is added"""
+    StudentAnswer = apps.get_model('tests', 'StudentAnswer')
+    answers = StudentAnswer.objects.using(schema_editor.connection.alias)
+    duplicates = (
+        answers.values('session_id', 'question_number')
+        .annotate(latest=Max('id'), rows=models.Count('id'))
+        .filter(rows__gt=1)
+    )
+    for row in duplicates.iterator():
+        answers.filter(
+            session_id=row['session_id'], question_number=row['question_number'], id__lt=row['latest']
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0038_customtestanswer'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            remove_duplicate_answers, migrations.RunPython.noop, hints={'model_name': 'studentanswer'}
+        ),
+        migrations.AddConstraint(
+            model_name='studentanswer',
+            constraint=models.UniqueConstraint(fields=('session', 'question_number'), name='unique_answer_per_question'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.4 on 2026-10-19 11:32
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tests', '0039_studentanswer_unique_answer_per_question'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='studenttestsessionlog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='studenttestsessionlog',
+            index=models.Index(fields=['session', 'timestamp'], name='session_log_session_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='studenttestsessionlog',
+            index=models.Index(fields=['timestamp'], name='session_log_ts_idx'),
+        ),
+    ]
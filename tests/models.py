@@ -11,7 +11,7 @@ import hashlib
 from django.conf import settings
 from django.db.models.signals import m2m_changed
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 import uuid
 
 # Base62 character set for secure ID generation
@@ -536,20 +536,65 @@ class StudentTestSession(models.Model):
         
         return False
 
+
+@receiver(post_save, sender=StudentTestSession)
+def publish_session_to_monitor(sender, instance, **kwargs):
+    """Feed entered / active / finished counters of the live exam monitor."""
+    from django.db import transaction
+    from .monitor import publish_session_status
+    transaction.on_commit(lambda: publish_session_status(instance))
+
+
+# Cached public test pages (tests/public_views.py) are retired once the change commits
+
+@receiver(post_save, sender=Test)
+@receiver(post_delete, sender=Test)
+def invalidate_public_test_pages(sender, instance, **kwargs):
+    from api.cache import invalidate_on_commit
+    invalidate_on_commit(f'test:{instance.pk}')
+
+
+@receiver(post_save, sender=PrimaryKey)
+@receiver(post_delete, sender=PrimaryKey)
+def invalidate_public_test_pages_on_key_change(sender, instance, **kwargs):
+    from api.cache import invalidate_on_commit
+    invalidate_on_commit(f'test:{instance.test_id}')
+
+
+@receiver(post_save, sender=TestCollection)
+@receiver(post_save, sender=Folder)
+def invalidate_public_test_catalog(sender, instance, **kwargs):
+    from api.cache import invalidate_on_commit
+    invalidate_on_commit('test-catalog')
+
+
 class StudentTestSessionLog(models.Model):
     session = models.ForeignKey(StudentTestSession, on_delete=models.CASCADE, related_name='logs')
     action = models.CharField(max_length=20, choices=[('login', 'Login'), ('logout', 'Logout')])
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Set when the event happens; rows are written later in batches (tests/session_logs.py)
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
     device_id = models.CharField(max_length=255, blank=True, null=True)
     ip_address = models.GenericIPAddressField(blank=True, null=True)
     user_agent = models.TextField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['session', 'timestamp'], name='session_log_session_ts_idx'),
+            models.Index(fields=['timestamp'], name='session_log_ts_idx'),
+        ]
+
 
 class StudentAnswer(models.Model):
     session = models.ForeignKey(StudentTestSession, on_delete=models.CASCADE, related_name='answers')
     question_number = models.IntegerField()
     answer = models.IntegerField(null=True, blank=True)
 
+    class Meta:
+        constraints = [
+            # One row per question; lets answers be written as upserts
+            models.UniqueConstraint(fields=['session', 'question_number'], name='unique_answer_per_question'),
+        ]
+
 
 class StudentProgress(models.Model):
     """پیشرفت دانش‌آموز در یک مجموعه آزمون"""
@@ -1019,3 +1064,31 @@ class CustomTestAnswer(models.Model):
         """بررسی صحت پاسخ"""
         return self.selected_option == self.question.correct_option
 
+
+# Cached public test pages also list their folders and count their questions
+@receiver(m2m_changed, sender=Test.folders.through)
+@receiver(m2m_changed, sender=Test.questions.through)
+def invalidate_public_test_pages_on_m2m_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    from api.cache import invalidate_on_commit
+    if not reverse:
+        invalidate_on_commit(f'test:{instance.pk}')
+    elif pk_set:
+        invalidate_on_commit(*(f'test:{pk}' for pk in pk_set))
+    else:
+        invalidate_on_commit('test-catalog')
+
+
+# Connected to finance.services.order_access_granted in TestsConfig.ready()
+def refresh_progress_on_access_granted(sender, order, user_id, collection_ids, **kwargs):
+    """A buyer added to collections gets their StudentProgress rows without waiting for a teacher's visit."""
+    from jobs.queue import enqueue
+    from .tasks import refresh_collection_progress
+    for collection_id in collection_ids:
+        enqueue(
+            refresh_collection_progress,
+            idempotency_key=f'progress:{collection_id}:order:{order.id}',
+            collection_id=collection_id,
+            student_ids=[user_id],
+        )
@@ -0,0 +1,144 @@
+"""
+Live exam monitoring.
+
+Teachers watching an exam connect to ExamMonitorConsumer
+(ws/exam-monitor/<test_id>/), which loads the test's sessions, answers and
+answer key once and from then on keeps `ExamStats` up to date from events
+published to the test's monitor group:
+
+- `publish_session_status` on every StudentTestSession save (see the
+  post_save receiver in tests/models.py): entered / active / finished counts
+- `publish_answers` wherever answers are written (SubmitAnswerView,
+  FinishTestView, the batched answer writer): answered-count histogram and
+  the provisional grade of finished sessions
+
+Grading uses the same negatively-marked percentage as TestStatisticsAPIView,
+so watching an exam costs no queries after connect.
+"""
+import logging
+from collections import Counter
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from .models import StudentAnswer, StudentTestSession, Test, TestContentType
+from .services import load_answer_keys, load_typed_keys
+
+logger = logging.getLogger(__name__)
+
+
+def monitor_group_name(test_id):
+    return f'exam_monitor_{test_id}'
+
+
+def _publish(test_id, event):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(monitor_group_name(test_id), event)
+    except Exception:
+        # Monitoring must never break answering or finishing an exam
+        logger.exception("Could not publish exam monitor event for test %s", test_id)
+
+
+def publish_session_status(session):
+    _publish(session.test_id, {
+        'type': 'exam_session',
+        'session_id': session.id,
+        'status': session.status,
+    })
+
+
+def publish_answers(test_id, session_id, answers):
+    """`answers` maps question numbers to the stored answer (None when cleared)."""
+    # JSON object keys are strings; the consumer converts them back
+    _publish(test_id, {
+        'type': 'exam_answers',
+        'session_id': session_id,
+        'answers': {str(question_number): answer for question_number, answer in answers.items()},
+    })
+
+
+class ExamStats:
+    """In-memory counters for one test, fed by session and answer events."""
+
+    def __init__(self, answer_key, total_questions, typed=False):
+        self.answer_key = answer_key
+        self.total_questions = total_questions
+        self.typed = typed
+        self.sessions = {}
+        self.answers = {}
+        self.scores = {}
+
+    def apply_session(self, session_id, status):
+        self.sessions[session_id] = status
+        self.answers.setdefault(session_id, {})
+        self._regrade(session_id)
+
+    def apply_answers(self, session_id, answers):
+        self.answers.setdefault(session_id, {}).update(answers)
+        self.sessions.setdefault(session_id, 'active')
+        self._regrade(session_id)
+
+    def _regrade(self, session_id):
+        if self.sessions.get(session_id) == 'completed':
+            self.scores[session_id] = self.grade(self.answers.get(session_id, {}))
+        else:
+            self.scores.pop(session_id, None)
+
+    def grade(self, answers):
+        if self.total_questions <= 0:
+            return 0
+        correct = 0
+        for question_number, correct_answer in self.answer_key.items():
+            if not self.typed and question_number > self.total_questions:
+                continue
+            answer = answers.get(question_number)
+            if self.typed and not answer:
+                continue
+            if answer is not None and answer == correct_answer:
+                correct += 1
+        percent = (3 * correct - (len(answers) - correct)) / self.total_questions * 100
+        return max(0, percent / 3)
+
+    def snapshot(self):
+        statuses = Counter(self.sessions.values())
+        answered = Counter(
+            sum(1 for answer in self.answers.get(session_id, {}).values() if answer is not None)
+            for session_id in self.sessions
+        )
+        return {
+            'entered': len(self.sessions),
+            'active': statuses['active'],
+            'inactive': statuses['inactive'],
+            'finished': statuses['completed'],
+            'expired': statuses['expired'],
+            'questions': self.total_questions,
+            'answered_histogram': {str(count): sessions for count, sessions in sorted(answered.items())},
+            'graded': len(self.scores),
+            'provisional_average': round(sum(self.scores.values()) / len(self.scores), 2) if self.scores else None,
+        }
+
+
+def load_exam_stats(test_id):
+    """Seed ExamStats for a test from the database (called once per monitor connection)."""
+    content_type = Test.objects.filter(id=test_id).values_list('content_type', flat=True).first()
+    if content_type == TestContentType.TYPED_QUESTION:
+        answer_key = load_typed_keys([test_id]).get(test_id, {})
+        stats = ExamStats(answer_key, len(answer_key), typed=True)
+    else:
+        keys, counts = load_answer_keys([test_id])
+        stats = ExamStats(keys.get(test_id, {}), counts.get(test_id, 0))
+
+    for session_id, status in StudentTestSession.objects.filter(test_id=test_id).values_list('id', 'status'):
+        stats.sessions[session_id] = status
+        stats.answers[session_id] = {}
+    rows = StudentAnswer.objects.filter(session__test_id=test_id).order_by('id').values_list(
+        'session_id', 'question_number', 'answer'
+    )
+    for session_id, question_number, answer in rows:
+        stats.answers.setdefault(session_id, {})[question_number] = answer
+    for session_id in stats.sessions:
+        stats._regrade(session_id)
+    return stats
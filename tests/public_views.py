@@ -3,11 +3,13 @@ from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 from django.shortcuts import get_object_or_404
+from api.http_cache import cache_response
 from .models import Test, TestContentType
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@cache_response('test-poster', tags=('test:{test_id}', 'test-catalog'))
 def test_poster_public(request, test_id):
     """
     Public endpoint for test poster information.
@@ -72,6 +74,7 @@ def test_poster_public(request, test_id):
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
+@cache_response('test-detail', tags=('test:{test_id}', 'test-catalog'))
 def test_detail_public(request, test_id):
     """
     Public endpoint for test detail information.
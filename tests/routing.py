@@ -0,0 +1,7 @@
+from django.urls import re_path
+from . import consumers
+
+websocket_urlpatterns = [
+    re_path(r'^ws/exam/(?P<session_id>\d+)/$', consumers.ExamConsumer.as_asgi()),
+    re_path(r'^ws/exam-monitor/(?P<test_id>\d+)/$', consumers.ExamMonitorConsumer.as_asgi()),
+]
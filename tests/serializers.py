@@ -10,7 +10,7 @@ from PIL import Image
 
 from contents.models import File
 from .models import (
-    Test, PrimaryKey, StudentTestSession, StudentAnswer,
+    Test, PrimaryKey, StudentTestSession, StudentTestSessionLog, StudentAnswer,
     TestCollection, StudentProgress, Question, Option, QuestionImage, DetailedSolutionImage,
     QuestionCollection, TestType, TestContentType
 )
@@ -799,6 +799,18 @@ class StudentProgressSerializer(serializers.ModelSerializer):
         read_only_fields = ['started_at', 'last_activity']
 
 
+class StudentTestSessionLogSerializer(serializers.ModelSerializer):
+    """لاگ ورود و خروج دانش‌آموز از آزمون"""
+    test = serializers.IntegerField(source='session.test_id', read_only=True)
+    user = serializers.IntegerField(source='session.user_id', read_only=True)
+    username = serializers.CharField(source='session.user.username', read_only=True)
+
+    class Meta:
+        model = StudentTestSessionLog
+        fields = ['id', 'session', 'test', 'user', 'username', 'action', 'timestamp', 'device_id', 'ip_address', 'user_agent']
+        read_only_fields = fields
+
+
 class TopicTestCreateSerializer(serializers.ModelSerializer):
     """سریالایزر برای ایجاد آزمون مبحثی"""
     keys = PrimaryKeySerializer(many=True, required=False)
@@ -0,0 +1,169 @@
+"""
+Set-based StudentProgress roll-up for whole test collections.
+
+`StudentProgress.update_progress()` rescoring one student at a time costs a
+handful of queries per completed session. The helpers here load every
+completed session, answer and answer key of a collection in a few queries,
+score them in memory and upsert all progress rows with one `bulk_create`.
+"""
+import time
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import (
+    PrimaryKey, StudentAnswer, StudentProgress, StudentTestSession, Test, TestContentType,
+)
+
+# Minimum number of seconds between two background refreshes of one collection
+PROGRESS_REFRESH_INTERVAL = 60
+
+
+def load_answer_keys(test_ids):
+    """
+    Return ({test_id: {question_number: answer}}, {test_id: key_count}) for PDF
+    tests. Like `primary_keys.filter(...).first()`, the lowest id wins when a
+    question number has more than one key row.
+    """
+    keys = defaultdict(dict)
+    counts = defaultdict(int)
+    rows = PrimaryKey.objects.filter(test_id__in=test_ids).order_by('id').values_list(
+        'test_id', 'question_number', 'answer'
+    )
+    for test_id, question_number, answer in rows:
+        keys[test_id].setdefault(question_number, answer)
+        counts[test_id] += 1
+    return keys, counts
+
+
+def load_typed_keys(test_ids):
+    """
+    Return {test_id: {question_number: correct_option_id}} for typed-question
+    tests, numbering questions by ascending id exactly like the session views.
+    """
+    through = Test.questions.through
+    rows = through.objects.filter(test_id__in=test_ids).order_by('test_id', 'question_id').values_list(
+        'test_id', 'question__correct_option_id'
+    )
+    keys = defaultdict(dict)
+    for test_id, correct_option_id in rows:
+        keys[test_id][len(keys[test_id]) + 1] = correct_option_id
+    return keys
+
+
+def score_sessions(test_collection, student_ids=None):
+    """
+    Score every completed session of the collection.
+
+    Returns {student_id: (completed_tests, total_score)} where total_score is
+    the sum of per-session percentages, matching `StudentProgress.update_progress`.
+    """
+    tests = dict(test_collection.tests.values_list('id', 'content_type'))
+    typed_ids = {tid for tid, ctype in tests.items() if ctype == TestContentType.TYPED_QUESTION}
+    pdf_ids = [tid for tid in tests if tid not in typed_ids]
+
+    pdf_keys, pdf_counts = load_answer_keys(pdf_ids) if pdf_ids else ({}, {})
+    typed_keys = load_typed_keys(typed_ids) if typed_ids else {}
+
+    sessions = StudentTestSession.objects.filter(test_id__in=tests.keys(), status='completed')
+    answers = StudentAnswer.objects.filter(session__test_id__in=tests.keys(), session__status='completed')
+    if student_ids is not None:
+        sessions = sessions.filter(user_id__in=student_ids)
+        answers = answers.filter(session__user_id__in=student_ids)
+
+    session_answers = defaultdict(list)
+    rows = answers.order_by('id').values_list('session_id', 'question_number', 'answer')
+    for session_id, question_number, answer in rows:
+        session_answers[session_id].append((question_number, answer))
+
+    results = defaultdict(lambda: [0, 0.0])
+    for session_id, user_id, test_id in sessions.values_list('id', 'user_id', 'test_id'):
+        totals = results[user_id]
+        totals[0] += 1
+
+        correct_answers = 0
+        if test_id in typed_ids:
+            key = typed_keys.get(test_id, {})
+            total_questions = len(key)
+            # The latest answer per question counts, as in the answer_map lookups
+            answer_map = dict(session_answers.get(session_id, ()))
+            for question_number, correct_option_id in key.items():
+                answer = answer_map.get(question_number)
+                if answer and answer == correct_option_id:
+                    correct_answers += 1
+        else:
+            key = pdf_keys.get(test_id, {})
+            total_questions = pdf_counts.get(test_id, 0)
+            for question_number, answer in session_answers.get(session_id, ()):
+                if question_number in key and key[question_number] == answer:
+                    correct_answers += 1
+
+        if total_questions > 0:
+            totals[1] += (correct_answers / total_questions) * 100
+
+    return {user_id: (completed, score) for user_id, (completed, score) in results.items()}
+
+
+def recompute_collection_progress(test_collection, student_ids=None):
+    """
+    Recompute and upsert StudentProgress rows for a collection in bulk.
+
+    `student_ids` defaults to every accessible student of the collection.
+    Returns the number of rows written.
+    """
+    if student_ids is None:
+        student_ids = list(test_collection.get_accessible_students().values_list('id', flat=True))
+    if not student_ids:
+        return 0
+
+    total_tests = test_collection.tests.count()
+    scores = score_sessions(test_collection, student_ids)
+    now = timezone.now()
+
+    rows, completed_ids = [], []
+    for student_id in student_ids:
+        completed, total_score = scores.get(student_id, (0, 0.0))
+        if completed >= total_tests:
+            completed_ids.append(student_id)
+        rows.append(StudentProgress(
+            test_collection=test_collection,
+            student_id=student_id,
+            completed_tests=completed,
+            total_score=total_score,
+            is_completed=completed >= total_tests,
+            last_activity=now,
+        ))
+
+    with transaction.atomic():
+        StudentProgress.objects.bulk_create(
+            rows,
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['test_collection', 'student'],
+            update_fields=['completed_tests', 'total_score', 'last_activity'],
+        )
+        # Like update_progress(), a completed collection stays completed (e.g. after a test is added)
+        if completed_ids:
+            StudentProgress.objects.filter(
+                test_collection=test_collection, student_id__in=completed_ids, is_completed=False,
+            ).update(is_completed=True)
+    return len(rows)
+
+
+def refresh_collection_progress_async(collection_id):
+    """
+    Enqueue a background recompute of a collection's progress.
+
+    At most one refresh per collection is enqueued every
+    PROGRESS_REFRESH_INTERVAL seconds; extra calls return the existing job.
+    """
+    from jobs.queue import enqueue
+    from .tasks import refresh_collection_progress
+
+    window = int(time.time() // PROGRESS_REFRESH_INTERVAL)
+    return enqueue(
+        refresh_collection_progress,
+        idempotency_key=f'progress:{collection_id}:{window}',
+        collection_id=collection_id,
+    )
@@ -0,0 +1,134 @@
+"""
+Batched StudentTestSessionLog writer.
+
+EnterTestView and ExitTestView record their login/logout audit rows with
+`session_log_writer.record()`, which only appends to an in-memory queue, so
+entering or leaving an exam never waits on an audit insert. A background
+thread writes the queue every SESSION_LOG_FLUSH_INTERVAL_MS, or sooner once
+SESSION_LOG_BATCH_SIZE rows are waiting, with one bulk_create.
+
+With SESSION_LOG_SINK = 'file' the rows are appended to hourly JSONL files
+in SESSION_LOG_DIR instead (one file per process and hour), and
+`manage.py load_session_logs` bulk-loads the finished ones. Batches the
+database refuses are spilled to the same files rather than dropped. Rows
+whose session was deleted in the meantime are skipped.
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import StudentTestSession, StudentTestSessionLog
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('session_id', 'action', 'timestamp', 'device_id', 'ip_address', 'user_agent')
+
+
+def spill_path(directory, when=None):
+    """This process's spill file for the hour of `when` (UTC)."""
+    when = (when or timezone.now()).astimezone(dt_timezone.utc)
+    return os.path.join(directory, f'session-logs-{when:%Y%m%d%H}-{os.getpid()}.jsonl')
+
+
+def finished_spill_files(directory, include_current=False):
+    """Spill files no process writes to anymore (every hour before the current one), oldest first."""
+    current = timezone.now().astimezone(dt_timezone.utc).strftime('%Y%m%d%H')
+    paths = sorted(glob.glob(os.path.join(directory, 'session-logs-*.jsonl')))
+    return [path for path in paths if include_current or os.path.basename(path).split('-')[2] < current]
+
+
+def write_session_logs(entries, batch_size=500):
+    """bulk_create the entries whose session still exists. Returns the number of rows written."""
+    if not entries:
+        return 0
+    existing = set(
+        StudentTestSession.objects.filter(id__in={entry['session_id'] for entry in entries})
+        .values_list('id', flat=True)
+    )
+    rows = [StudentTestSessionLog(**entry) for entry in entries if entry['session_id'] in existing]
+    StudentTestSessionLog.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def decode_entry(line):
+    entry = json.loads(line)
+    entry['timestamp'] = parse_datetime(entry['timestamp'])
+    return {field: entry.get(field) for field in FIELDS}
+
+
+class SessionLogWriter:
+    def __init__(self, batch_size=None, flush_interval=None, sink=None, directory=None):
+        self.batch_size = batch_size or getattr(settings, 'SESSION_LOG_BATCH_SIZE', 500)
+        self.flush_interval = (flush_interval or getattr(settings, 'SESSION_LOG_FLUSH_INTERVAL_MS', 1000)) / 1000
+        self.sink = sink or getattr(settings, 'SESSION_LOG_SINK', 'db')
+        self.directory = directory or getattr(settings, 'SESSION_LOG_DIR', os.path.join('logs', 'session_logs'))
+        self._pending = []
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = None
+
+    def record(self, session_id, action, device_id=None, ip_address=None, user_agent=None):
+        """Queue one audit row, timestamped now."""
+        entry = {
+            'session_id': session_id,
+            'action': action,
+            'timestamp': timezone.now(),
+            'device_id': device_id,
+            'ip_address': ip_address,
+            'user_agent': user_agent,
+        }
+        with self._condition:
+            self._pending.append(entry)
+            if len(self._pending) >= self.batch_size:
+                self._condition.notify()
+        self._ensure_thread()
+
+    def flush(self):
+        """Write everything queued so far in the calling thread. Returns the number of rows stored."""
+        with self._write_lock:
+            with self._condition:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return 0
+            if self.sink == 'file':
+                return self.spill(pending)
+            try:
+                return write_session_logs(pending)
+            except DatabaseError:
+                logger.exception("Failed to write %s session log(s); spilling them to %s", len(pending), self.directory)
+                return self.spill(pending)
+
+    def spill(self, entries):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(spill_path(self.directory), 'a', encoding='utf-8') as spill:
+            for entry in entries:
+                spill.write(json.dumps(dict(entry, timestamp=entry['timestamp'].isoformat()), ensure_ascii=False) + '\n')
+        return len(entries)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='session-log-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._pending) >= self.batch_size, timeout=self.flush_interval)
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Session log writer flush failed")
+
+
+session_log_writer = SessionLogWriter()
+atexit.register(session_log_writer.flush)
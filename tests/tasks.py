@@ -0,0 +1,19 @@
+"""Background jobs for test collections."""
+
+import logging
+
+from jobs.queue import task
+from .models import TestCollection
+from .services import recompute_collection_progress
+
+logger = logging.getLogger(__name__)
+
+
+@task(max_attempts=3, backoff=60)
+def refresh_collection_progress(collection_id, student_ids=None):
+    """Recompute the StudentProgress rows of a collection (only `student_ids`' if given)."""
+    test_collection = TestCollection.objects.filter(id=collection_id).first()
+    if test_collection is None:
+        return
+    written = recompute_collection_progress(test_collection, student_ids)
+    logger.info(f"Refreshed {written} progress rows for test collection {collection_id}")
@@ -0,0 +1,208 @@
+import asyncio
+
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import IntegrityError
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from rest_framework.test import APIClient
+
+from tests.answers import AnswerWriter, answer_writer
+from tests.models import PrimaryKey, StudentAnswer, StudentTestSession
+from tests.monitor import ExamStats
+from tests.routing import websocket_urlpatterns
+from tests.testing import create_exam
+
+User = get_user_model()
+
+
+class ExamConsumerTestCase(TransactionTestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teacher', password='x', role='teacher')
+        self.student = User.objects.create_user(username='student', password='x', role='student')
+        self.test = create_exam(self.teacher)
+        self.session = StudentTestSession.objects.create(user=self.student, test=self.test, status='active')
+
+    def tearDown(self):
+        answer_writer.flush()
+
+    async def _connect(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/exam/{self.session.id}/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    def _answers(self):
+        return dict(StudentAnswer.objects.filter(session=self.session).values_list('question_number', 'answer'))
+
+    async def test_answers_are_acked_after_write(self):
+        communicator, connected = await self._connect(self.student)
+        self.assertTrue(connected)
+        hello = await communicator.receive_json_from()
+        self.assertEqual(hello['type'], 'session')
+        self.assertGreater(hello['remaining'], 3500)
+
+        await communicator.send_json_to({'type': 'answer', 'question_number': 1, 'answer': 2, 'seq': 1})
+        await communicator.send_json_to({'type': 'answers', 'seq': 2, 'answers': [
+            {'question_number': 1, 'answer': 3}, {'question_number': 2, 'answer': None},
+        ]})
+
+        acks = sorted([(await communicator.receive_json_from(timeout=3))['seq'] for _ in range(2)])
+        self.assertEqual(acks, [1, 2])
+        self.assertEqual(await database_sync_to_async(self._answers)(), {1: 3, 2: None})
+        await communicator.disconnect()
+
+    async def test_invalid_answer_is_rejected(self):
+        communicator, _ = await self._connect(self.student)
+        await communicator.receive_json_from()
+
+        await communicator.send_json_to({'type': 'answer', 'question_number': 'x', 'answer': 1, 'seq': 5})
+
+        reply = await communicator.receive_json_from()
+        self.assertEqual((reply['type'], reply['seq']), ('error', 5))
+        await communicator.disconnect()
+
+    async def test_finish_writes_queued_answers_before_completing(self):
+        communicator, _ = await self._connect(self.student)
+        await communicator.receive_json_from()
+
+        await communicator.send_json_to({'type': 'answer', 'question_number': 1, 'answer': 2, 'seq': 1})
+        await communicator.send_json_to({'type': 'finish', 'seq': 2})
+        replies = [await communicator.receive_json_from(timeout=3) for _ in range(2)]
+
+        self.assertEqual([(reply['type'], reply['seq']) for reply in replies], [('ack', 1), ('finished', 2)])
+        self.assertEqual(await database_sync_to_async(self._answers)(), {1: 2})
+        await database_sync_to_async(self.session.refresh_from_db)()
+        self.assertEqual(self.session.status, 'completed')
+        self.assertIsNotNone(self.session.exit_time)
+        self.assertEqual((await communicator.receive_output(timeout=1))['type'], 'websocket.close')
+
+    async def test_other_users_and_closed_sessions_are_refused(self):
+        other = await database_sync_to_async(User.objects.create_user)(username='other', password='x')
+        for user in (AnonymousUser(), other):
+            _, connected = await self._connect(user)
+            self.assertFalse(connected)
+
+        self.session.status = 'completed'
+        await database_sync_to_async(self.session.save)()
+        _, connected = await self._connect(self.student)
+        self.assertFalse(connected)
+
+
+class AnswerWriterTestCase(TransactionTestCase):
+    def setUp(self):
+        teacher = User.objects.create_user(username='teacher', password='x', role='teacher')
+        student = User.objects.create_user(username='student', password='x', role='student')
+        test = create_exam(teacher)
+        self.session = StudentTestSession.objects.create(user=student, test=test, status='active')
+        StudentAnswer.objects.create(session=self.session, question_number=1, answer=1)
+
+    def test_batch_upserts_latest_answers(self):
+        writer = AnswerWriter(batch_size=1000, flush_interval=60000)
+        futures = [
+            writer.submit(self.session.id, 1, 2),
+            writer.submit(self.session.id, 1, 4),
+            writer.submit(self.session.id, 2, 3),
+        ]
+
+        # Locked session lookup and one INSERT ... ON CONFLICT in one transaction
+        with self.assertNumQueries(4):
+            self.assertEqual(writer.flush(), 2)
+
+        self.assertTrue(all(future.done() and future.exception() is None for future in futures))
+        self.assertEqual(
+            dict(StudentAnswer.objects.filter(session=self.session).values_list('question_number', 'answer')),
+            {1: 4, 2: 3},
+        )
+
+    def test_completed_session_rejects_queued_answers(self):
+        writer = AnswerWriter(batch_size=1000, flush_interval=60000)
+        future = writer.submit(self.session.id, 1, 3)
+        StudentTestSession.objects.filter(id=self.session.id).update(status='completed')
+
+        writer.flush()
+
+        self.assertIsNotNone(future.exception())
+        self.assertEqual(StudentAnswer.objects.get(session=self.session, question_number=1).answer, 1)
+
+
+class SubmitAnswerViewTestCase(TransactionTestCase):
+    def setUp(self):
+        teacher = User.objects.create_user(username='teacher', password='x', role='teacher')
+        self.student = User.objects.create_user(username='student', password='x', role='student')
+        self.session = StudentTestSession.objects.create(user=self.student, test=create_exam(teacher), status='active')
+        self.client = APIClient()
+        self.client.force_authenticate(self.student)
+
+    def test_resubmitted_answer_replaces_the_previous_one(self):
+        for answer in (1, 3):
+            response = self.client.post('/api/submit-answer/', {
+                'session_id': self.session.id, 'question_number': 5, 'answer': answer,
+            }, format='json')
+            self.assertEqual(response.status_code, 200)
+
+        self.assertEqual(list(StudentAnswer.objects.values_list('question_number', 'answer')), [(5, 3)])
+        with self.assertRaises(IntegrityError):
+            StudentAnswer.objects.create(session=self.session, question_number=5, answer=2)
+
+
+class ExamMonitorTestCase(TransactionTestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teacher', password='x', role='teacher')
+        self.student = User.objects.create_user(username='student', password='x', role='student')
+        self.test = create_exam(self.teacher)
+        PrimaryKey.objects.bulk_create([
+            PrimaryKey(test=self.test, question_number=q, answer=1) for q in range(1, 4)
+        ])
+
+    async def _connect(self, user):
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/exam-monitor/{self.test.id}/')
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    @override_settings(EXAM_MONITOR_PUSH_SECONDS=0)
+    async def test_counters_follow_session_and_answer_events(self):
+        communicator, connected = await self._connect(self.teacher)
+        self.assertTrue(connected)
+        stats = await communicator.receive_json_from()
+        self.assertEqual((stats['entered'], stats['questions']), (0, 3))
+
+        session = await database_sync_to_async(StudentTestSession.objects.create)(
+            user=self.student, test=self.test, status='active'
+        )
+        stats = await communicator.receive_json_from()
+        self.assertEqual((stats['entered'], stats['active']), (1, 1))
+
+        await asyncio.wrap_future(answer_writer.submit(session.id, 1, 1))
+        await asyncio.wrap_future(answer_writer.submit(session.id, 2, 1))
+        session.status = 'completed'
+        await database_sync_to_async(session.save)()
+
+        while stats['finished'] == 0:
+            stats = await communicator.receive_json_from()
+        self.assertEqual(stats['answered_histogram'], {'2': 1})
+        self.assertEqual(stats['graded'], 1)
+        self.assertAlmostEqual(stats['provisional_average'], 66.67)
+        await communicator.disconnect()
+
+    async def test_students_cannot_monitor(self):
+        _, connected = await self._connect(self.student)
+        self.assertFalse(connected)
+
+
+class ExamStatsTestCase(SimpleTestCase):
+    def test_grading_matches_statistics_view(self):
+        stats = ExamStats({1: 1, 2: 2, 3: 3, 4: 4}, 4)
+        stats.apply_session(10, 'completed')
+        # 2 correct, 1 wrong, 1 blank: (3*2 - 1) / 4 * 100 / 3
+        stats.apply_answers(10, {1: 1, 2: 2, 3: 4})
+        stats.apply_session(11, 'active')
+
+        snapshot = stats.snapshot()
+
+        self.assertEqual((snapshot['entered'], snapshot['active'], snapshot['finished']), (2, 1, 1))
+        self.assertEqual(snapshot['answered_histogram'], {'0': 1, '3': 1})
+        self.assertAlmostEqual(snapshot['provisional_average'], 41.67)
@@ -0,0 +1,112 @@
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from tests.models import (
+    PrimaryKey, StudentAnswer, StudentProgress, StudentTestSession, Test, TestCollection,
+)
+from jobs.models import Job
+from tests.services import recompute_collection_progress, refresh_collection_progress_async
+
+User = get_user_model()
+
+
+class CollectionProgressTestCase(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teacher', password='x', role='teacher')
+        self.alice = User.objects.create_user(username='alice', password='x', role='student')
+        self.bob = User.objects.create_user(username='bob', password='x', role='student')
+        self.collection = TestCollection.objects.create(name='Collection', created_by=self.teacher)
+        self.collection.students.add(self.alice, self.bob)
+
+        now = timezone.now()
+        self.tests = []
+        for i in range(2):
+            test = Test.objects.create(
+                name=f'Test {i}', teacher=self.teacher, test_collection=self.collection,
+                duration=timedelta(hours=1), start_time=now - timedelta(hours=1),
+                end_time=now + timedelta(hours=1),
+            )
+            PrimaryKey.objects.bulk_create([
+                PrimaryKey(test=test, question_number=q, answer=q % 4 + 1) for q in range(1, 5)
+            ])
+            self.tests.append(test)
+
+        # alice finishes both tests, bob only the first one
+        self._complete(self.alice, self.tests[0], {1: 2, 2: 3, 3: 1, 4: 1})
+        self._complete(self.alice, self.tests[1], {1: 2, 2: 1})
+        self._complete(self.bob, self.tests[0], {1: 4})
+
+    def _complete(self, user, test, answers):
+        session = StudentTestSession.objects.create(user=user, test=test, status='completed')
+        StudentAnswer.objects.bulk_create([
+            StudentAnswer(session=session, question_number=q, answer=a) for q, a in answers.items()
+        ])
+
+    def test_bulk_recompute_matches_update_progress(self):
+        expected = {}
+        for student in (self.alice, self.bob):
+            progress = StudentProgress(test_collection=self.collection, student=student)
+            progress.update_progress()
+            expected[student.id] = (progress.completed_tests, progress.total_score, progress.is_completed)
+        StudentProgress.objects.all().delete()
+
+        written = recompute_collection_progress(self.collection)
+        self.assertEqual(written, 2)
+        for progress in StudentProgress.objects.filter(test_collection=self.collection):
+            completed_tests, total_score, is_completed = expected[progress.student_id]
+            self.assertEqual(progress.completed_tests, completed_tests)
+            self.assertAlmostEqual(progress.total_score, total_score)
+            self.assertEqual(progress.is_completed, is_completed)
+
+    def test_recompute_updates_existing_rows(self):
+        recompute_collection_progress(self.collection)
+        self._complete(self.bob, self.tests[1], {1: 2, 2: 3, 3: 4, 4: 1})
+
+        with self.assertNumQueries(13):
+            recompute_collection_progress(self.collection)
+
+        progress = StudentProgress.objects.get(test_collection=self.collection, student=self.bob)
+        self.assertEqual(progress.completed_tests, 2)
+        self.assertAlmostEqual(progress.total_score, 100.0)
+        self.assertTrue(progress.is_completed)
+        self.assertEqual(StudentProgress.objects.filter(test_collection=self.collection).count(), 2)
+
+    def test_teacher_endpoint_creates_missing_rows(self):
+        client = APIClient()
+        client.force_authenticate(user=self.teacher)
+        response = client.get(f'/api/test-collections/{self.collection.id}/student_progress/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(sorted(row['completed_tests'] for row in response.data), [1, 2])
+        self.assertEqual(StudentProgress.objects.filter(test_collection=self.collection).count(), 2)
+
+    def test_completed_collection_stays_completed(self):
+        recompute_collection_progress(self.collection)
+        Test.objects.create(
+            name='Added later', teacher=self.teacher, test_collection=self.collection,
+            duration=timedelta(hours=1), start_time=timezone.now(), end_time=timezone.now() + timedelta(hours=1),
+        )
+        recompute_collection_progress(self.collection)
+
+        progress = StudentProgress.objects.get(test_collection=self.collection, student=self.alice)
+        self.assertEqual(progress.completed_tests, 2)
+        self.assertTrue(progress.is_completed)
+        self.assertFalse(StudentProgress.objects.get(test_collection=self.collection, student=self.bob).is_completed)
+
+    @override_settings(JOBS_RUN_EAGERLY=True)
+    def test_background_refresh_is_a_deduplicated_job(self):
+        recompute_collection_progress(self.collection)
+        self._complete(self.bob, self.tests[1], {1: 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            first = refresh_collection_progress_async(self.collection.id)
+            second = refresh_collection_progress_async(self.collection.id)
+        self.assertEqual(first.id, second.id)
+        self.assertEqual(Job.objects.get(id=first.id).status, Job.Status.SUCCEEDED)
+        progress = StudentProgress.objects.get(test_collection=self.collection, student=self.bob)
+        self.assertEqual(progress.completed_tests, 2)
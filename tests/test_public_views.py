@@ -0,0 +1,39 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from tests.models import PrimaryKey, TestContentType
+from tests.testing import create_exam
+
+User = get_user_model()
+
+
+class PublicTestPageCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        teacher = User.objects.create_user(username='teacher', password='x', role='teacher')
+        self.test = create_exam(teacher)
+        self.test.content_type = TestContentType.PDF
+        self.test.save()
+        PrimaryKey.objects.create(test=self.test, question_number=1, answer=2)
+        self.client = APIClient()
+        self.url = f'/api/question-tests/{self.test.id}/poster/'
+
+    def test_poster_is_served_from_cache_until_its_test_changes(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_questions'], 1)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PrimaryKey.objects.create(test=self.test, question_number=2, answer=1)
+        self.assertEqual(self.client.get(self.url).json()['total_questions'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.test.test_collection.name = 'Renamed'
+            self.test.test_collection.save()
+        self.assertEqual(self.client.get(self.url).json()['collection']['name'], 'Renamed')
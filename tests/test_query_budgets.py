@@ -0,0 +1,45 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from rest_framework.test import APIClient
+
+from tests.models import PrimaryKey, StudentAnswer, StudentTestSession
+from tests.testing import create_exam
+
+User = get_user_model()
+
+
+class StatisticsQueryBudgetTestCase(TestCase):
+    """TestStatisticsAPIView grades every session; its query count must not grow with them."""
+
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teacher', password='x', role='teacher')
+        self.test = create_exam(self.teacher)
+        for question_number, answer in ((1, 1), (2, 2), (3, 3)):
+            PrimaryKey.objects.create(test=self.test, question_number=question_number, answer=answer)
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+        self.url = f'/api/tests/{self.test.id}/statistics/'
+
+    def add_session(self, name, answers):
+        student = User.objects.create_user(username=name, password='x', role='student')
+        session = StudentTestSession.objects.create(user=student, test=self.test, status='completed')
+        StudentAnswer.objects.bulk_create([
+            StudentAnswer(session=session, question_number=question_number, answer=answer)
+            for question_number, answer in answers.items()
+        ])
+
+    def test_statistics(self):
+        self.add_session('alice', {1: 1, 2: 2, 3: 3})
+        with self.assertNumQueries(4):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        self.add_session('bob', {1: 1, 2: 4})
+        self.add_session('carol', {})
+        with self.assertNumQueries(4):
+            data = self.client.get(self.url).json()
+
+        percents = {student['name']: student['percent'] for student in data['students']}
+        # 3 correct of 3; 1 correct and 1 wrong: (3 - 1) / 3 / 3; nothing answered
+        self.assertEqual(percents, {'alice': 100.0, 'bob': 22.22, 'carol': 0.0})
+        self.assertEqual(data['questions_count'], 3)
+        self.assertEqual(data['student_count'], 3)
@@ -0,0 +1,115 @@
+import io
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import OperationalError
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from tests.models import StudentTestSession, StudentTestSessionLog
+from tests.session_logs import SessionLogWriter, session_log_writer
+from tests.testing import create_exam
+
+User = get_user_model()
+
+
+class SessionLogWriterTestCase(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teacher', password='x', role='teacher')
+        self.student = User.objects.create_user(username='student', password='x', role='student')
+        self.test = create_exam(self.teacher)
+        self.directory = tempfile.mkdtemp()
+
+    @mock.patch.object(session_log_writer, '_ensure_thread')
+    def test_enter_and_exit_queue_their_audit_rows(self, ensure_thread):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        response = client.post('/api/enter-test/', {'test_id': self.test.id, 'device_id': 'd1'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(client.post('/api/exit-test/', {'device_id': 'd1'}, format='json').status_code, 200)
+        self.assertFalse(StudentTestSessionLog.objects.exists())
+
+        entered = timezone.now()
+        self.assertEqual(session_log_writer.flush(), 2)
+        logs = list(StudentTestSessionLog.objects.order_by('id'))
+        self.assertEqual([log.action for log in logs], ['login', 'logout'])
+        self.assertEqual(logs[0].device_id, 'd1')
+        # Timestamped when recorded, not when flushed
+        self.assertLessEqual(logs[1].timestamp, entered)
+
+    def test_batch_skips_deleted_sessions(self):
+        session = StudentTestSession.objects.create(user=self.student, test=self.test, status='active')
+        writer = SessionLogWriter(flush_interval=60000, directory=self.directory)
+        writer.record(session.id, 'login')
+        writer.record(session.id + 1, 'login')
+
+        with self.assertNumQueries(2):
+            self.assertEqual(writer.flush(), 1)
+
+    def test_file_sink_is_loaded_later(self):
+        session = StudentTestSession.objects.create(user=self.student, test=self.test, status='active')
+        writer = SessionLogWriter(flush_interval=60000, sink='file', directory=self.directory)
+        writer.record(session.id, 'login', ip_address='10.0.0.1')
+        writer.record(session.id, 'logout')
+        self.assertEqual(writer.flush(), 2)
+        self.assertFalse(StudentTestSessionLog.objects.exists())
+
+        # The current hour's file may still be written to
+        call_command('load_session_logs', dir=self.directory, stdout=io.StringIO())
+        self.assertFalse(StudentTestSessionLog.objects.exists())
+
+        call_command('load_session_logs', dir=self.directory, all=True, stdout=io.StringIO())
+        self.assertEqual(
+            list(StudentTestSessionLog.objects.order_by('id').values_list('action', 'ip_address')),
+            [('login', '10.0.0.1'), ('logout', None)],
+        )
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_refused_batches_are_spilled(self):
+        session = StudentTestSession.objects.create(user=self.student, test=self.test, status='active')
+        writer = SessionLogWriter(flush_interval=60000, directory=self.directory)
+        writer.record(session.id, 'login')
+
+        with mock.patch('tests.session_logs.write_session_logs', side_effect=OperationalError('database is locked')):
+            with self.assertLogs('tests.session_logs', 'ERROR'):
+                writer.flush()
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+
+class SessionLogListViewTestCase(TestCase):
+    def setUp(self):
+        self.teacher = User.objects.create_user(username='teacher', password='x', role='teacher')
+        other = User.objects.create_user(username='other', password='x', role='teacher')
+        student = User.objects.create_user(username='student', password='x', role='student')
+        self.session = StudentTestSession.objects.create(user=student, test=create_exam(self.teacher), status='active')
+        other_session = StudentTestSession.objects.create(user=student, test=create_exam(other), status='inactive')
+        now = timezone.now()
+        StudentTestSessionLog.objects.bulk_create([
+            StudentTestSessionLog(session=self.session, action='login', timestamp=now - timedelta(hours=2)),
+            StudentTestSessionLog(session=self.session, action='logout', timestamp=now - timedelta(minutes=5)),
+            StudentTestSessionLog(session=other_session, action='login', timestamp=now),
+        ])
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def test_teacher_sees_own_tests_newest_first(self):
+        data = self.client.get('/api/session-logs/').json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual([row['action'] for row in data['results']], ['logout', 'login'])
+        self.assertEqual(data['results'][0]['username'], 'student')
+
+    def test_time_range_and_filters(self):
+        since = (timezone.now() - timedelta(hours=1)).isoformat()
+        data = self.client.get('/api/session-logs/', {'since': since, 'session': self.session.id}).json()
+        self.assertEqual([row['action'] for row in data['results']], ['logout'])
+
+        self.assertEqual(self.client.get('/api/session-logs/', {'since': 'yesterday'}).status_code, 400)
+
+    def test_students_are_refused(self):
+        self.client.force_authenticate(User.objects.get(username='student'))
+        self.assertEqual(self.client.get('/api/session-logs/').status_code, 403)
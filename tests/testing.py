@@ -0,0 +1,16 @@
+"""Fixtures shared by the test suites of several apps."""
+from datetime import timedelta
+
+from django.utils import timezone
+
+from tests.models import Test, TestCollection
+
+
+def create_exam(teacher):
+    """A running one-hour exam of `teacher` in a new collection."""
+    now = timezone.now()
+    return Test.objects.create(
+        name='Exam', teacher=teacher, duration=timedelta(hours=1),
+        test_collection=TestCollection.objects.create(name='Collection', created_by=teacher),
+        start_time=now - timedelta(hours=1), end_time=now + timedelta(hours=1),
+    )
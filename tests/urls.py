@@ -11,6 +11,7 @@ from .views import (
     TestDetailView,
     GetAnswersView,
     ExitTestView,
+    SessionLogListView,
     TestCollectionViewSet,
     SecureTestFileView,
     QuestionViewSet,
@@ -58,6 +59,7 @@ urlpatterns = [
     path('get-answer/', GetAnswersView.as_view(), name='get-answer'),
     path('exit-test/', ExitTestView.as_view(), name='exit-test'),
     path('finish-test/', FinishTestView.as_view(), name='finish-test'),
+    path('session-logs/', SessionLogListView.as_view(), name='session-logs'),
 
     path('tests/report/<int:test_id>/', CreateReport.as_view(), name='create-report'),
 
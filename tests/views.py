@@ -3,6 +3,7 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.db import transaction, OperationalError
 from django.db.models import Avg, Q
 from django.http import HttpResponse, Http404
@@ -11,6 +12,7 @@ import re
 import json
 import time
 import secrets
+from collections import defaultdict
 from .models import (
     Test, StudentTestSession, StudentAnswer, PrimaryKey, 
     StudentTestSessionLog, TestCollection, StudentProgress, Question, Option, QuestionImage,
@@ -24,7 +26,16 @@ from .serializers import (
     QuestionSerializer, QuestionCreateSerializer, OptionSerializer, QuestionImageSerializer,
     QuestionTestCreateSerializer, QuestionTestUpdateSerializer, QuestionTestListSerializer,
     QuestionCollectionSerializer, QuestionCollectionDetailSerializer, 
-    QuestionCollectionCreateSerializer, QuestionCollectionUpdateSerializer
+    QuestionCollectionCreateSerializer, QuestionCollectionUpdateSerializer, StudentTestSessionLogSerializer,
+)
+from .answers import answer_writer
+from .session_logs import session_log_writer
+from .pagination import CustomPageNumberPagination
+from accounts.permissions import IsTeacherOrAdmin
+from api.db_routers import use_replica
+from .monitor import ExamStats, publish_answers
+from .services import (
+    load_answer_keys, load_typed_keys, recompute_collection_progress, refresh_collection_progress_async,
 )
 from rest_framework.exceptions import ValidationError
 import pytz
@@ -38,6 +49,7 @@ from openpyxl.styles import Font, PatternFill, Alignment
 class TestStatisticsAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @use_replica
     def get(self, request, test_id):
         try:
             test = Test.objects.get(id=test_id)
@@ -45,47 +57,31 @@ class TestStatisticsAPIView(APIView):
             return Response({"error": "Test not found"}, status=404)
 
         # جمع‌آوری لیست دانش‌آموزان و درصد هرکدام
-        sessions = StudentTestSession.objects.filter(test=test, status='completed').select_related('user')
+        # Answer key, sessions and answers are read once and graded in memory
+        # with the same formula as the live exam monitor.
+        if test.content_type == TestContentType.TYPED_QUESTION:
+            answer_key = load_typed_keys([test.id]).get(test.id, {})
+            stats = ExamStats(answer_key, len(answer_key), typed=True)
+        else:
+            keys, counts = load_answer_keys([test.id])
+            stats = ExamStats(keys.get(test.id, {}), counts.get(test.id, 0))
+
+        sessions = list(
+            StudentTestSession.objects.filter(test=test, status='completed').select_related('user')
+        )
+        answers_by_session = defaultdict(dict)
+        rows = StudentAnswer.objects.filter(session__in=[s.id for s in sessions]).order_by('id').values_list(
+            'session_id', 'question_number', 'answer'
+        )
+        for session_id, question_number, answer in rows:
+            answers_by_session[session_id][question_number] = answer
+
         students = []
         total_percent = 0
-        
         for s in sessions:
-            # محاسبه درصد دانش‌آموز
-            answers = StudentAnswer.objects.filter(session=s)
-            
-            if test.content_type == TestContentType.TYPED_QUESTION:
-                # For typed question tests
-                questions = test.questions.all()
-                total_questions = questions.count()
-                correct_answers = 0
-                
-                answer_map = {a.question_number: a for a in answers}
-                for idx, question in enumerate(sorted(questions, key=lambda q: q.id), 1):
-                    answer = answer_map.get(idx)
-                    if answer and answer.answer:
-                        is_correct = answer.answer == (question.correct_option.id if question.correct_option else None)
-                        if is_correct:
-                            correct_answers += 1
-            else:
-                # For PDF tests
-                total_questions = test.primary_keys.count()
-                correct_answers = 0
-                
-                answer_map = {a.question_number: a for a in answers}
-                for q_num in range(1, total_questions + 1):
-                    answer = answer_map.get(q_num)
-                    try:
-                        correct_key = test.primary_keys.get(question_number=q_num)
-                        if answer and answer.answer == correct_key.answer:
-                            correct_answers += 1
-                    except:
-                        pass
-            
-            # محاسبه درصد
-            percent = ((3*correct_answers - (answers.count() - correct_answers)) / total_questions * 100) if total_questions > 0 else 0
-            percent = max(0, percent/3)  # حداقل صفر
+            percent = stats.grade(answers_by_session[s.id])
             total_percent += percent
-            
+
             students.append({
                 "id": s.user.id,
                 "name": s.user.get_full_name() or s.user.username,
@@ -99,8 +95,8 @@ class TestStatisticsAPIView(APIView):
             "id": test.id,
             "name": test.name,
             "description": test.description,
-            "questions_count": test.questions.count() if test.content_type == TestContentType.TYPED_QUESTION else test.primary_keys.count(),
-            "student_count": sessions.count(),
+            "questions_count": stats.total_questions,
+            "student_count": len(sessions),
             "average_percent": round(avg_percent, 2),
             "students": students,
         }
@@ -618,9 +614,9 @@ class EnterTestView(views.APIView):
             session.save()
 
         # ثبت لاگ ورود
-        StudentTestSessionLog.objects.create(
-            session=session,
-            action='login',
+        session_log_writer.record(
+            session.id,
+            'login',
             device_id=device_id,
             ip_address=self.get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', '')
@@ -640,16 +636,17 @@ class EnterTestView(views.APIView):
 
 def _save_student_answer_with_retry(session, question_number, answer, max_retries=4):
     """
-    Saves a student answer with retry logic for SQLite database lock errors.
-    Retries up to max_retries times with exponential backoff.
+    Upserts a student answer, retrying SQLite "database is locked" errors
+    with a growing backoff (other backends never raise it).
     Returns True on success, raises OperationalError if all retries fail.
     """
     for attempt in range(max_retries):
         try:
-            StudentAnswer.objects.update_or_create(
-                session=session,
-                question_number=question_number,
-                defaults={"answer": answer}
+            StudentAnswer.objects.bulk_create(
+                [StudentAnswer(session=session, question_number=question_number, answer=answer)],
+                update_conflicts=True,
+                unique_fields=['session', 'question_number'],
+                update_fields=['answer'],
             )
             return True
         except OperationalError as e:
@@ -699,6 +696,7 @@ class SubmitAnswerView(generics.CreateAPIView):
                     {"error": "سرور در حال پردازش درخواست‌های زیادی است. لطفاً چند ثانیه صبر کنید و دوباره تلاش کنید."},
                     status=status.HTTP_503_SERVICE_UNAVAILABLE
                 )
+            publish_answers(session.test_id, session.id, {question_number: answer})
             return Response({"message": "Answer submitted."})
 
         # Handle multiple answers format
@@ -715,6 +713,7 @@ class SubmitAnswerView(generics.CreateAPIView):
         if not isinstance(answers, list):
             return Response({"error": "Answers must be a list"}, status=status.HTTP_400_BAD_REQUEST)
 
+        saved = {}
         for a in answers:
             # Validate answer format
             if not isinstance(a, dict):
@@ -732,11 +731,14 @@ class SubmitAnswerView(generics.CreateAPIView):
             try:
                 _save_student_answer_with_retry(session, question_number, answer)
             except OperationalError:
+                publish_answers(session.test_id, session.id, saved)
                 return Response(
                     {"error": "سرور در حال پردازش درخواست‌های زیادی است. لطفاً چند ثانیه صبر کنید و دوباره تلاش کنید."},
                     status=status.HTTP_503_SERVICE_UNAVAILABLE
                 )
+            saved[question_number] = answer
 
+        publish_answers(session.test_id, session.id, saved)
         return Response({"message": "Answers submitted."})
 
 class GetAnswersView(views.APIView):
@@ -810,6 +812,12 @@ class FinishTestView(views.APIView):
         else:
             raise ValidationError("Either session_id or test_id must be provided.")
 
+        # Answers streamed over the exam websocket may still be queued in this
+        # process; write them before the answers sent with this request. Any
+        # queued in another process are rejected once the session completes,
+        # which is why websocket clients finish with the socket's "finish" event.
+        answer_writer.flush()
+
         # Store answers if provided
         if answers:
             if isinstance(answers, str):
@@ -818,6 +826,7 @@ class FinishTestView(views.APIView):
                 except json.JSONDecodeError:
                     return Response({"error": "Invalid JSON in answers"}, status=status.HTTP_400_BAD_REQUEST)
 
+            saved = {}
             for answer_data in answers:
                 question_number = answer_data.get('question_number')
                 answer_value = answer_data.get('answer')
@@ -828,6 +837,8 @@ class FinishTestView(views.APIView):
                         question_number=question_number,
                         defaults={"answer": answer_value}
                     )
+                    saved[question_number] = answer_value
+            publish_answers(session.test_id, session.id, saved)
 
         session.exit_time = timezone.now()
         session.status = 'completed'
@@ -848,9 +859,9 @@ class ExitTestView(views.APIView):
             return Response({"error": "Session not found or inactive."}, status=status.HTTP_404_NOT_FOUND)
 
         # ثبت لاگ خروج موقت
-        StudentTestSessionLog.objects.create(
-            session=session,
-            action='logout',
+        session_log_writer.record(
+            session.id,
+            'logout',
             device_id=device_id,
             ip_address=self.get_client_ip(request),
             user_agent=request.META.get('HTTP_USER_AGENT', '')
@@ -868,9 +879,46 @@ class ExitTestView(views.APIView):
             ip = request.META.get('REMOTE_ADDR')
         return ip
 
+class SessionLogListView(generics.ListAPIView):
+    """
+    Exam login/logout audit log, newest first. Teachers see their own tests,
+    admins everything. Filters: test, session, user, action and an ISO-8601
+    since/until range on the timestamp.
+    """
+    permission_classes = [IsTeacherOrAdmin]
+    serializer_class = StudentTestSessionLogSerializer
+    pagination_class = CustomPageNumberPagination
+
+    def get_queryset(self):
+        user = self.request.user
+        params = self.request.query_params
+        logs = StudentTestSessionLog.objects.select_related('session__user').order_by('-timestamp', '-id')
+        if not (user.role == 'admin' or user.is_staff):
+            logs = logs.filter(session__test__teacher=user)
+
+        for param, lookup in (('test', 'session__test_id'), ('session', 'session_id'), ('user', 'session__user_id')):
+            if params.get(param):
+                try:
+                    logs = logs.filter(**{lookup: int(params[param])})
+                except ValueError:
+                    raise ValidationError({param: 'Must be an integer.'})
+        if params.get('action'):
+            logs = logs.filter(action=params['action'])
+        for param, lookup in (('since', 'timestamp__gte'), ('until', 'timestamp__lt')):
+            if params.get(param):
+                value = parse_datetime(params[param])
+                if value is None:
+                    raise ValidationError({param: 'Must be an ISO-8601 datetime.'})
+                if timezone.is_naive(value):
+                    value = timezone.make_aware(value)
+                logs = logs.filter(**{lookup: value})
+        return logs
+
+
 class CreateReport(views.APIView):
     permission_classes = [IsAuthenticated]
 
+    @use_replica
     def get(self, request, test_id):
         try:
             test = Test.objects.get(id=test_id)
@@ -1133,6 +1181,7 @@ class TestCollectionViewSet(viewsets.ModelViewSet):
         return Response(data)
     
     @action(detail=True, methods=['get'])
+    @use_replica
     def statistics(self, request, pk=None):
         """آمار تفصیلی مجموعه آزمون"""
         user = request.user
@@ -1237,28 +1286,37 @@ class TestCollectionViewSet(viewsets.ModelViewSet):
         
         else:
             # معلم و ادمین پیشرفت همه دانش‌آموزان را می‌بیند
-            students = test_collection.get_accessible_students()
+            # The last snapshot is served; missing rows are computed in bulk and
+            # the rest is refreshed in the background.
+            student_ids = set(test_collection.get_accessible_students().values_list('id', flat=True))
+            progress_qs = StudentProgress.objects.filter(
+                test_collection=test_collection,
+                student_id__in=student_ids
+            ).select_related('student')
+
+            snapshot_ids = set(progress_qs.values_list('student_id', flat=True))
+            missing_ids = student_ids - snapshot_ids
+            if missing_ids:
+                recompute_collection_progress(test_collection, list(missing_ids))
+            if snapshot_ids:
+                refresh_collection_progress_async(test_collection.id)
+
+            total_tests = test_collection.tests.count()
             progress_data = []
-            
-            for student in students:
-                progress, created = StudentProgress.objects.get_or_create(
-                    student=student,
-                    test_collection=test_collection
-                )
-                if created:
-                    progress.update_progress()
-                
+            for progress in progress_qs:
+                student = progress.student
+                progress_percentage = round((progress.completed_tests / total_tests) * 100, 2) if total_tests else 0
                 progress_data.append({
                     'id': progress.id,
                     'student_name': f"{student.first_name} {student.last_name}",
                     'completed_tests': progress.completed_tests,
                     'total_score': progress.total_score,
-                    'progress_percentage': progress.progress_percentage,
+                    'progress_percentage': progress_percentage,
                     'average_score': progress.average_score,
                     'is_completed': progress.is_completed,
                     'last_activity': progress.last_activity
                 })
-            
+
             return Response(progress_data)
     
     @action(detail=True, methods=['get'])
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from unfold.admin import ModelAdmin, TabularInline
-from .models import Ticket, TicketResponse, TicketAttachment
+from .models import Ticket, TicketResponse, TicketAttachment, CachedAIAnswer, AIAnswerCacheDay
 
 class TicketResponseInline(TabularInline):
     model = TicketResponse
@@ -46,3 +46,35 @@ class TicketAttachmentAdmin(ModelAdmin):
             return f"Response: {obj.response.ticket.title}"
         return "N/A"
     get_related_item.short_description = "Related Item"
+
+@admin.register(CachedAIAnswer)
+class CachedAIAnswerAdmin(ModelAdmin):
+    list_display = ('id', 'question_preview', 'course', 'provider', 'hits', 'created_at', 'expires_at')
+    list_filter = ('provider', 'created_at')
+    search_fields = ('question', 'normalized_question', 'answer')
+    exclude = ('signature',)
+    readonly_fields = ('normalized_question', 'question_hash', 'math_hash', 'hits', 'created_at')
+    date_hierarchy = 'created_at'
+    list_per_page = 20
+
+    def question_preview(self, obj):
+        return obj.question[:80]
+    question_preview.short_description = "سوال"
+
+@admin.register(AIAnswerCacheDay)
+class AIAnswerCacheDayAdmin(ModelAdmin):
+    list_display = ('date', 'exact_hits', 'similar_hits', 'misses', 'lookups', 'hit_rate_display')
+    readonly_fields = ('date', 'exact_hits', 'similar_hits', 'misses')
+    date_hierarchy = 'date'
+    list_per_page = 31
+
+    def lookups(self, obj):
+        return obj.lookups
+    lookups.short_description = "تعداد جستجو"
+
+    def hit_rate_display(self, obj):
+        return f"{obj.hit_rate:.0%}" if obj.hit_rate is not None else "-"
+    hit_rate_display.short_description = "نرخ برخورد"
+
+    def has_add_permission(self, request):
+        return False
@@ -1,84 +1,22 @@
-import os
 import time
-import google.generativeai as genai
-from openai import OpenAI
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, viewsets
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
-from django.conf import settings
 from django.db import transaction
 from requests.exceptions import RequestException, ConnectionError
 
+from . import answer_cache
+from .context import build_context, schedule_summary
 from .models import AIConversation, AIMessage
+from .providers import get_provider
 from .serializers import AIConversationSerializer, AIConversationListSerializer, AIMessageSerializer
 from accounts.models import AIAccess
 from django.utils import timezone
 
-# گرفتن API Keys
-GOOGLE_API_KEY = getattr(settings, 'GOOGLE_API_KEY', os.getenv('GOOGLE_API_KEY', ''))
-LLM_API_KEY = getattr(settings, 'LLM_API_KEY', os.getenv('LLM_API_KEY', ''))
-LLM_BASE_URL = getattr(
-    settings,
-    'LLM_BASE_URL',
-    os.getenv(
-        'LLM_BASE_URL',
-        'https://arvancloudai.ir/gateway/models/DeepSeek-V4-Pro/XDSfG8DZnRv7J3fkDqL-w0BgaO__UP8UvQj3lJvG9IZCGm-wENAH5nIRVPrrsk7rnM8ddC7ZIcL_aNxBpRTfRmNy7X3N3CKEiKc4Rzol8liTH7WDcDovs3YQmVqUfWdXWvoWy9yTENirsPA6Wdbk2wq1DsOBFJbfP9yQh9Qfv8xArG7Q3RqqBr3XnhR-8QzWYmBe8dLF4l7spJYnp0s6ES9Y1-qWpB3vTZaTwvcGPEWcrIB6uWDhNXeWXeNcsxJteDJy1A/v1'
-    )
-)
-LLM_MODEL = getattr(settings, 'LLM_MODEL', os.getenv('LLM_MODEL', 'DeepSeek-V4-Pro'))
-
-# انتخاب مدل و کلاینت بر اساس API Key موجود
-if LLM_API_KEY:
-    MODEL = LLM_MODEL
-    client = OpenAI(
-        base_url=LLM_BASE_URL,
-        api_key=LLM_API_KEY,
-    )
-    USE_LIARA = True
-    print(f"Using ArvanCloud API for LLM (Model: {MODEL})")
-elif GOOGLE_API_KEY:
-    MODEL = "gemini-1.5-flash"
-    genai.configure(api_key=GOOGLE_API_KEY)
-    client = None
-    USE_LIARA = False
-    print("Using Google API")
-else:
-    MODEL = None
-    client = None
-    USE_LIARA = False
-    print("No API key configured")
-
-def check_ai_access(user):
-    """
-    چک کردن دسترسی کاربر به هوش مصنوعی
-    """
-    try:
-        ai_access = AIAccess.objects.get(user=user)
-    except AIAccess.DoesNotExist:
-        # اگر دسترسی وجود ندارد، پیش‌فرض ایجاد کن
-        ai_access = AIAccess.objects.create(user=user)
-    
-    # چک کردن مدت زمان دسترسی
-    if not ai_access.is_active:
-        return False, "مدت زمان دسترسی شما به هوش مصنوعی پایان یافته است. لطفاً با پشتیبانی تماس بگیرید.", ai_access
-    
-    # چک کردن تعداد سوالات
-    if ai_access.get_remaining_questions() <= 0:
-        return False, "تعداد سوالات مجاز شما به پایان رسیده است. لطفاً با پشتیبانی تماس بگیرید.", ai_access
-    
-    return True, None, ai_access
-
-def generate_ai_response(question, context_messages=None, max_retries=2):
-    """
-    تابع مشترک برای تولید پاسخ هوش مصنوعی
-    """
-    if not MODEL:
-        raise ValueError("هیچ کلید API تنظیم نشده است")
-    
-    # System prompt برای فرمت صحیح و گاردریل‌های سفت و سخت آموزشی
-    math_formatting_instructions = """
+# System prompt برای فرمت صحیح و گاردریل‌های سفت و سخت آموزشی
+SYSTEM_PROMPT = """
 شما یک استاد و دستیار هوشمند تخصصی تحصیلی و درسی هستید. وظیفه اصلی و انحصاری شما حل مسائل درسی، آموزش مباحث تحصیلی (به‌ویژه ریاضیات، فیزیک، شیمی، زیست و سایر علوم درسی) و ارائه توضیحات دقیق، شفاف و مرحله‌به‌مرحله است.
 
 ==================================================
@@ -126,52 +64,81 @@ def generate_ai_response(question, context_messages=None, max_retries=2):
 - هرگز از فرمت \\( ... \\) یا \\[ ... \\] استفاده نکنید؛ صرفاً از $...$ یا $$...$$ استفاده کنید.
 - هیچ فرمول یا متغیری را بدون $ یا $$ ننویسید.
 """
+
+
+QUOTA_EXHAUSTED_ERROR = "تعداد سوالات مجاز شما به پایان رسیده است. لطفاً با پشتیبانی تماس بگیرید."
+
+
+def check_ai_access(user):
+    """
+    چک کردن دسترسی کاربر به هوش مصنوعی
+    """
+    try:
+        ai_access = AIAccess.objects.get(user=user)
+    except AIAccess.DoesNotExist:
+        # اگر دسترسی وجود ندارد، پیش‌فرض ایجاد کن
+        ai_access = AIAccess.objects.create(user=user)
+    
+    # چک کردن مدت زمان دسترسی
+    if not ai_access.is_active:
+        return False, "مدت زمان دسترسی شما به هوش مصنوعی پایان یافته است. لطفاً با پشتیبانی تماس بگیرید.", ai_access
     
+    # چک کردن تعداد سوالات (بدون کوئری؛ کم کردن سهمیه با consume_question انجام می‌شود)
+    if ai_access.get_remaining_questions() <= 0:
+        return False, QUOTA_EXHAUSTED_ERROR, ai_access
+    
+    return True, None, ai_access
+
+def start_turn(conversation, content, cache_hit=False):
+    """
+    ذخیره پیام کاربر و برگرداندن آن به همراه بافت گفتگو برای مدل
+    """
+    user_message = AIMessage.objects.create(
+        conversation=conversation,
+        role='user',
+        content=content,
+        cache_hit=cache_hit
+    )
+    
+    # اگر عنوان هنوز «گفتگوی جدید» باشد، از متن اولین سوال عنوان مناسب بساز
+    if conversation.title in ['گفتگوی جدید', ''] or conversation.messages.count() <= 2:
+        first_line = content.strip().split('\n')[0].strip()
+        if first_line:
+            new_title = first_line[:45] + ('...' if len(first_line) > 45 else '')
+            conversation.title = new_title
+    
+    # خلاصه گفتگو و آخرین پیام‌ها تا سقف توکن (سوال جدید جداگانه به مدل داده می‌شود)
+    return user_message, build_context(conversation, exclude_id=user_message.id)
+
+def finish_turn(conversation, answer, cache_hit=False):
+    """
+    ذخیره پاسخ هوش مصنوعی و بروزرسانی زمان گفتگو
+    """
+    ai_message = AIMessage.objects.create(
+        conversation=conversation,
+        role='ai',
+        content=answer,
+        cache_hit=cache_hit
+    )
+    # بروزرسانی زمان آخرین بروزرسانی گفتگو (و عنوان جدید)
+    conversation.save(update_fields=['title', 'updated_at'])
+    # پیام‌های قدیمی که در بودجه جا نمی‌شوند در پس‌زمینه خلاصه می‌شوند
+    schedule_summary(conversation)
+    return ai_message
+
+def generate_ai_response(question, context_messages=None, max_retries=2):
+    """
+    تابع مشترک برای تولید پاسخ هوش مصنوعی
+    """
+    provider = get_provider()
+    if provider is None:
+        raise ValueError("هیچ کلید API تنظیم نشده است")
+
     retry_count = 0
     
     while retry_count <= max_retries:
         try:
-            if USE_LIARA:
-                # استفاده از Liara API با OpenAI client
-                messages = [
-                    {"role": "system", "content": math_formatting_instructions}
-                ]
-                
-                # اضافه کردن بافت گفتگو اگر موجود باشد
-                if context_messages:
-                    for msg in context_messages:
-                        role = "user" if msg['role'] == 'user' else "assistant"
-                        messages.append({"role": role, "content": msg['content']})
-                
-                # اضافه کردن سوال جدید
-                messages.append({"role": "user", "content": question})
-                
-                completion = client.chat.completions.create(
-                    model=MODEL,
-                    messages=messages,
-                    timeout=30.0
-                )
-                return completion.choices[0].message.content
-                
-            else:
-                # استفاده از Google Gemini مستقیم
-                model = genai.GenerativeModel(MODEL)
-                
-                # اگر بافت موجود باشد، آن را به سوال اضافه کنیم
-                prompt = f"{math_formatting_instructions}\n\n"
-                
-                if context_messages:
-                    context = []
-                    for msg in context_messages:
-                        context.append(f"{msg['role']}: {msg['content']}")
-                    context_text = '\n'.join(context)
-                    prompt += f"با توجه به گفتگوی قبلی:\n\n{context_text}\n\nسوال جدید: {question}"
-                else:
-                    prompt += f"سوال: {question}"
-                
-                response = model.generate_content(prompt)
-                return response.text
-                
+            return provider.generate(SYSTEM_PROMPT, question, context_messages)
         except (RequestException, ConnectionError) as e:
             retry_count += 1
             print(f"Network error (attempt {retry_count}/{max_retries}): {str(e)}")
@@ -207,12 +174,28 @@ class GeminiAIView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
         
+        # سوال‌های تکراری از حافظه نهان پاسخ داده می‌شوند و از سهمیه کم نمی‌شوند
+        course_id = answer_cache.course_scope(request.user, request.data.get('course'))
+        cached = answer_cache.lookup(question, course_id)
+        
         try:
-            answer = generate_ai_response(question)
+            if cached is not None:
+                answer, provider_label = cached.answer, cached.provider
+            else:
+                if not ai_access.consume_question():
+                    return Response({'error': QUOTA_EXHAUSTED_ERROR}, status=status.HTTP_403_FORBIDDEN)
+                try:
+                    answer = generate_ai_response(question)
+                except Exception:
+                    ai_access.refund_question()
+                    raise
+                provider_label = get_provider().label
+                answer_cache.store(question, answer, course_id, provider_label)
             return Response({
                 'answer': answer,
                 'generated_by_ai': True,
-                'provider': 'Liara' if USE_LIARA else 'Google',
+                'cached': cached is not None,
+                'provider': provider_label,
                 'remaining_questions': ai_access.get_remaining_questions(),
                 'total_questions': ai_access.questions_limit
             })
@@ -271,49 +254,35 @@ class AIConversationViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        # ایجاد پیام کاربر
-        user_message = AIMessage.objects.create(
-            conversation=conversation,
-            role='user',
-            content=content
-        )
-        
-        # اگر عنوان هنوز «گفتگوی جدید» باشد، از متن اولین سوال عنوان مناسب بساز
-        if conversation.title in ['گفتگوی جدید', ''] or conversation.messages.count() <= 2:
-            first_line = content.strip().split('\n')[0].strip()
-            if first_line:
-                new_title = first_line[:45] + ('...' if len(first_line) > 45 else '')
-                conversation.title = new_title
+        # فقط اولین سوال گفتگو بدون بافت است و از حافظه نهان پاسخ داده می‌شود
+        first_question = not conversation.messages.exists()
+        cached = answer_cache.lookup(content, conversation.course_id) if first_question else None
+        if cached is None and not ai_access.consume_question():
+            return Response({'error': QUOTA_EXHAUSTED_ERROR}, status=status.HTTP_403_FORBIDDEN)
+        user_message, context_messages = start_turn(conversation, content, cache_hit=cached is not None)
         
         try:
-            # دریافت 10 پیام آخر برای بافت گفتگو
-            previous_messages = list(
-                conversation.messages.order_by('-created_at')[:10]
-                .values('role', 'content')
-            )
-            # معکوس کردن ترتیب برای درست بودن تاریخچه
-            context_messages = list(reversed(previous_messages))
-            
-            # تولید پاسخ هوش مصنوعی
-            ai_response = generate_ai_response(content, context_messages)
-            
-            # ایجاد پیام هوش مصنوعی
-            ai_message = AIMessage.objects.create(
-                conversation=conversation,
-                role='ai',
-                content=ai_response
-            )
-            
-            # بروزرسانی زمان آخرین بروزرسانی گفتگو
-            conversation.save()
-            
-            print(f"AI Response: {ai_response}")
+            if cached is not None:
+                ai_message = finish_turn(conversation, cached.answer, cache_hit=True)
+                provider_label = cached.provider
+            else:
+                # تولید پاسخ هوش مصنوعی (در صورت خطا سوال به سهمیه برمی‌گردد)
+                try:
+                    ai_response = generate_ai_response(content, context_messages)
+                except Exception:
+                    ai_access.refund_question()
+                    raise
+                ai_message = finish_turn(conversation, ai_response)
+                provider_label = get_provider().label
+                if first_question:
+                    answer_cache.store(content, ai_response, conversation.course_id, provider_label)
             
             return Response({
                 'user_message': AIMessageSerializer(user_message).data,
                 'ai_message': AIMessageSerializer(ai_message).data,
                 'conversation_title': conversation.title,
-                'provider': 'Liara' if USE_LIARA else 'Google',
+                'cached': cached is not None,
+                'provider': provider_label,
                 'remaining_questions': ai_access.get_remaining_questions(),
                 'total_questions': ai_access.questions_limit
             })
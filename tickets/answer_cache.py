@@ -0,0 +1,249 @@
+"""
+AI tutor answer cache.
+
+Students of a course ask the tutor the same textbook questions with small
+differences in spelling, spacing and LaTeX. Answers to stand-alone questions
+(GeminiAIView, and the first question of a conversation) are stored in
+CachedAIAnswer for AI_CACHE_TTL seconds, scoped to the conversation's course
+(or to the whole site when there is none).
+
+`lookup()` normalizes the question (Persian letters and digits, diacritics,
+ZWNJ, punctuation, LaTeX delimiters and spacing commands) and tries:
+
+1. an exact match on the hash of the normalized text;
+2. unless AI_CACHE_SIMILARITY is 0, the most similar cached question with
+   the same numbers and formulas (`math_hash`), by MinHash estimate of the
+   Jaccard similarity of character trigrams, if it reaches the threshold.
+   Questions that differ in a number or a formula never match.
+
+Answers served from the cache do not count against the AI quota. Hits and
+misses are counted per day in the cache. Lookups and stores make no other
+database writes than the hit count of a matched entry. At most once every
+AI_CACHE_MAINTENANCE_INTERVAL seconds a lookup enqueues the
+`maintain_answer_cache` job (tickets/tasks.py). That job adds the counters
+to AIAnswerCacheDay (shown in the admin) and deletes expired entries.
+"""
+import hashlib
+import random
+import re
+import struct
+import time
+import unicodedata
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import AIAnswerCacheDay, CachedAIAnswer
+
+NUM_PERMUTATIONS = 64
+SHINGLE_SIZE = 3
+
+_PRIME = (1 << 61) - 1
+_random = random.Random(1729)
+_PERMUTATIONS = [(_random.randrange(1, _PRIME), _random.randrange(_PRIME)) for _ in range(NUM_PERMUTATIONS)]
+
+_PERSIAN = str.maketrans({
+    'ي': 'ی', 'ى': 'ی', 'ك': 'ک', 'ة': 'ه', 'ۀ': 'ه', 'أ': 'ا', 'إ': 'ا',
+    '\u0640': None,  # tatweel
+    '\u200c': ' ', '\u200d': None, '\u200e': None, '\u200f': None,
+    **{digit: str(value) for value, digit in enumerate('۰۱۲۳۴۵۶۷۸۹')},
+    **{digit: str(value) for value, digit in enumerate('٠١٢٣٤٥٦٧٨٩')},
+})
+_DIACRITICS = re.compile('[\u064b-\u065f\u0670]')
+_MATH = re.compile(r'\$\$(.+?)\$\$|\$(.+?)\$|\\\((.+?)\\\)|\\\[(.+?)\\\]', re.S)
+_LATEX_REWRITES = [
+    (re.compile(r'\\[dt]frac\b'), r'\\frac'),
+    (re.compile(r'\\(?:left|right|displaystyle|limits)\b'), ''),
+    (re.compile(r'\\[,;:! ]'), ''),
+    (re.compile(r'\\(?:cdot|times)\b'), '*'),
+    (re.compile(r'\\(?:leq|le)\b'), '<='),
+    (re.compile(r'\\(?:geq|ge)\b'), '>='),
+    (re.compile(r'\s+'), ''),
+    # x^{2} and x^2 are the same formula
+    (re.compile(r'([\^_])\{(\w)\}'), r'\1\2'),
+]
+_PUNCTUATION = re.compile(r'[^\w\s$]')
+_NUMBER = re.compile(r'\d+(?:\.\d+)?')
+
+
+def _normalize_math(formula):
+    for pattern, replacement in _LATEX_REWRITES:
+        formula = pattern.sub(replacement, formula)
+    return formula
+
+
+def _normalize_text(text):
+    text = _PUNCTUATION.sub(' ', text.lower())
+    return ' '.join(text.split())
+
+
+def normalize_question(question):
+    """Canonical form of a question; formulas are kept (normalized) between $ signs."""
+    text = unicodedata.normalize('NFKC', question).translate(_PERSIAN)
+    text = _DIACRITICS.sub('', text)
+    parts, position = [], 0
+    for match in _MATH.finditer(text):
+        parts.append(_normalize_text(text[position:match.start()]))
+        parts.append(f'${_normalize_math(next(group for group in match.groups() if group is not None))}$')
+        position = match.end()
+    parts.append(_normalize_text(text[position:]))
+    return ' '.join(part for part in parts if part)
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def math_key(normalized):
+    """The formulas of a normalized question, and the numbers written outside them."""
+    formulas = re.findall(r'\$([^$]*)\$', normalized)
+    numbers = _NUMBER.findall(re.sub(r'\$[^$]*\$', ' ', normalized))
+    return '|'.join(formulas) + '#' + ' '.join(numbers)
+
+
+def minhash(normalized):
+    if len(normalized) <= SHINGLE_SIZE:
+        shingles = {normalized}
+    else:
+        shingles = {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+    hashes = [int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'big') for shingle in shingles]
+    return [min((a * value + b) % _PRIME for value in hashes) for a, b in _PERMUTATIONS]
+
+
+def pack_signature(signature):
+    return struct.pack(f'>{NUM_PERMUTATIONS}Q', *signature)
+
+
+def unpack_signature(data):
+    return struct.unpack(f'>{NUM_PERMUTATIONS}Q', bytes(data))
+
+
+def similarity(signature, other):
+    """Estimated Jaccard similarity of the trigram sets behind two signatures."""
+    return sum(a == b for a, b in zip(signature, other)) / NUM_PERMUTATIONS
+
+
+def course_scope(user, course_id):
+    """`course_id` if the user studies or teaches that course, otherwise None (site-wide scope)."""
+    from courses.models import Course
+
+    try:
+        course_id = int(course_id)
+    except (TypeError, ValueError):
+        return None
+    member = Course.objects.filter(Q(students=user) | Q(teacher=user), id=course_id).exists()
+    return course_id if member else None
+
+
+OUTCOMES = ('exact_hits', 'similar_hits', 'misses')
+
+
+def _counter_key(day, outcome):
+    return f'ai-cache:count:{day.isoformat()}:{outcome}'
+
+
+def _count(outcome):
+    key = _counter_key(timezone.localdate(), outcome)
+    cache.add(key, 0, 3 * 24 * 3600)
+    cache.incr(key)
+    _schedule_maintenance()
+
+
+def _schedule_maintenance():
+    from jobs.queue import enqueue
+    from .tasks import maintain_answer_cache
+
+    interval = getattr(settings, 'AI_CACHE_MAINTENANCE_INTERVAL', 300)
+    if not cache.add('ai-cache:maintenance', 1, interval):
+        return
+    enqueue(
+        maintain_answer_cache,
+        idempotency_key=f'ai-cache-maintenance:{int(time.time() // interval)}',
+        delay=interval,
+    )
+
+
+def flush_metrics():
+    """Add the hit/miss counters kept in the cache to the AIAnswerCacheDay rows of today and yesterday."""
+    today = timezone.localdate()
+    for day in (today - timedelta(days=1), today):
+        counts = {}
+        for outcome in OUTCOMES:
+            key = _counter_key(day, outcome)
+            value = cache.get(key) or 0
+            if value:
+                # decr rather than delete keeps lookups counted meanwhile
+                cache.decr(key, value)
+                counts[outcome] = value
+        if not counts:
+            continue
+        increments = {outcome: F(outcome) + value for outcome, value in counts.items()}
+        if AIAnswerCacheDay.objects.filter(date=day).update(**increments):
+            continue
+        try:
+            AIAnswerCacheDay.objects.create(date=day, **counts)
+        except IntegrityError:
+            AIAnswerCacheDay.objects.filter(date=day).update(**increments)
+
+
+def purge_expired():
+    return CachedAIAnswer.objects.filter(expires_at__lte=timezone.now()).delete()[0]
+
+
+def lookup(question, course_id=None):
+    """The live CachedAIAnswer for `question` in the course's scope, or None."""
+    if not getattr(settings, 'AI_CACHE_ENABLED', True):
+        return None
+    normalized = normalize_question(question)
+    live = CachedAIAnswer.objects.filter(course_id=course_id, expires_at__gt=timezone.now())
+
+    outcome = 'exact_hits'
+    entry = live.filter(question_hash=_sha256(normalized)).first()
+    threshold = getattr(settings, 'AI_CACHE_SIMILARITY', 0.85)
+    if entry is None and threshold:
+        outcome = 'similar_hits'
+        entry = _most_similar(live, normalized, threshold)
+    if entry is None:
+        _count('misses')
+        return None
+
+    CachedAIAnswer.objects.filter(pk=entry.pk).update(hits=F('hits') + 1)
+    _count(outcome)
+    return entry
+
+
+def _most_similar(live, normalized, threshold):
+    signature = minhash(normalized)
+    candidates = (
+        live.filter(math_hash=_sha256(math_key(normalized)))
+        .order_by('-created_at')[:getattr(settings, 'AI_CACHE_MAX_CANDIDATES', 200)]
+    )
+    best, best_score = None, threshold
+    for entry in candidates:
+        score = similarity(signature, unpack_signature(entry.signature))
+        if score >= best_score:
+            best, best_score = entry, score
+    return best
+
+
+def store(question, answer, course_id=None, provider=''):
+    """Cache the answer to a stand-alone question for AI_CACHE_TTL seconds."""
+    if not getattr(settings, 'AI_CACHE_ENABLED', True) or not answer:
+        return None
+    now = timezone.now()
+    normalized = normalize_question(question)
+    return CachedAIAnswer.objects.create(
+        course_id=course_id,
+        question=question,
+        normalized_question=normalized,
+        question_hash=_sha256(normalized),
+        math_hash=_sha256(math_key(normalized)),
+        signature=pack_signature(minhash(normalized)),
+        answer=answer,
+        provider=provider,
+        expires_at=now + timedelta(seconds=getattr(settings, 'AI_CACHE_TTL', 7 * 24 * 3600)),
+    )
@@ -0,0 +1,176 @@
+import asyncio
+import json
+import logging
+
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from . import answer_cache
+from .ai import QUOTA_EXHAUSTED_ERROR, SYSTEM_PROMPT, check_ai_access, finish_turn, start_turn
+from .models import AIConversation
+from .providers import get_provider, stream_limiter
+from .serializers import AIMessageSerializer
+
+logger = logging.getLogger(__name__)
+
+
+class AITutorConsumer(AsyncWebsocketConsumer):
+    """
+    Streaming AI tutor for one AIConversation: ws/ai/conversations/<conversation_id>/
+
+    The streaming counterpart of AIConversationViewSet.add_message. The
+    provider call runs on the event loop over the provider's pooled async
+    client, so a slow answer holds a coroutine instead of a worker thread.
+    Client events:
+
+        {"type": "question", "content": "...", "seq": 4}
+
+    The server replies with {"type": "user_message", "seq", "message"}, then
+    {"type": "queued", "seq"} if AI_STREAM_CONCURRENCY streams are already
+    running, {"type": "token", "seq", "text"} for every chunk the provider
+    sends, and {"type": "done", "seq", "message", "conversation_title",
+    "provider", "remaining_questions", "total_questions"} once the answer
+    is stored as an AIMessage, or {"type": "error", "seq", "error"}. A first
+    question found in the answer cache is answered with one token and a done
+    event with "cached": true, without calling the provider or using quota.
+    Other questions take one question of the AIAccess quota when they start,
+    which is given back if the answer fails or is interrupted by a
+    disconnect (and then not stored). One question is answered at a time
+    per connection.
+    """
+
+    async def connect(self):
+        self.user = self.scope['user']
+        self.conversation_id = int(self.scope['url_route']['kwargs']['conversation_id'])
+        self.answering = None
+
+        if not self.user.is_authenticated:
+            await self.close(code=4401)
+            return
+
+        self.conversation = await self.get_conversation()
+        if self.conversation is None:
+            await self.close(code=4403)
+            return
+
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if self.answering is not None:
+            self.answering.cancel()
+
+    async def receive(self, text_data):
+        try:
+            event = json.loads(text_data)
+        except json.JSONDecodeError:
+            await self.send_json({'type': 'error', 'error': 'Invalid JSON'})
+            return
+
+        seq = event.get('seq')
+        content = event.get('content')
+        if event.get('type') != 'question' or not isinstance(content, str) or not content.strip():
+            await self.send_json({'type': 'error', 'seq': seq, 'error': 'لطفاً متن پیام را وارد کنید'})
+            return
+        if self.answering is not None and not self.answering.done():
+            await self.send_json({'type': 'error', 'seq': seq, 'error': 'لطفاً تا پایان پاسخ قبلی صبر کنید'})
+            return
+
+        self.answering = asyncio.ensure_future(self.answer(seq, content))
+
+    async def answer(self, seq, content):
+        access_allowed, access_error, ai_access = await database_sync_to_async(check_ai_access)(self.user)
+        if not access_allowed:
+            await self.send_json({'type': 'error', 'seq': seq, 'error': access_error})
+            return
+        provider = get_provider()
+        if provider is None:
+            await self.send_json({'type': 'error', 'seq': seq, 'error': 'هیچ کلید API تنظیم نشده است'})
+            return
+
+        turn = await self.start_turn(content, ai_access)
+        if turn is None:
+            await self.send_json({'type': 'error', 'seq': seq, 'error': QUOTA_EXHAUSTED_ERROR})
+            return
+        cached, first_question, user_message, context_messages = turn
+        await self.send_json({'type': 'user_message', 'seq': seq, 'message': AIMessageSerializer(user_message).data})
+        if cached is not None:
+            await self.send_json({'type': 'token', 'seq': seq, 'text': cached.answer})
+            ai_message, remaining = await self.store_answer(cached.answer, ai_access, cache_hit=True)
+            await self.done(seq, ai_message, cached.provider, remaining, ai_access, cached=True)
+            return
+
+        answer = None
+        try:
+            answer = await self.stream_answer(seq, provider, content, context_messages)
+        finally:
+            if answer is None:
+                # Busy, failed or interrupted by a disconnect: nothing is stored, so nothing is charged
+                await asyncio.shield(database_sync_to_async(ai_access.refund_question)())
+        if answer is None:
+            return
+
+        ai_message, remaining = await self.store_answer(answer, ai_access)
+        if first_question:
+            await database_sync_to_async(answer_cache.store)(
+                content, answer, self.conversation.course_id, provider.label,
+            )
+        await self.done(seq, ai_message, provider.label, remaining, ai_access)
+
+    async def stream_answer(self, seq, provider, content, context_messages):
+        """Send the provider's answer as token events and return it; None after sending an error."""
+        limiter = stream_limiter()
+        if limiter.locked():
+            await self.send_json({'type': 'queued', 'seq': seq})
+        try:
+            await asyncio.wait_for(limiter.acquire(), getattr(settings, 'AI_STREAM_QUEUE_TIMEOUT', 30.0))
+        except asyncio.TimeoutError:
+            await self.send_json({'type': 'error', 'seq': seq, 'error': 'سرویس هوش مصنوعی مشغول است، لطفاً دوباره تلاش کنید'})
+            return None
+
+        chunks = []
+        try:
+            async for chunk in provider.stream(SYSTEM_PROMPT, content, context_messages):
+                chunks.append(chunk)
+                await self.send_json({'type': 'token', 'seq': seq, 'text': chunk})
+        except Exception:
+            logger.exception("AI tutor stream failed for conversation %s", self.conversation_id)
+            await self.send_json({'type': 'error', 'seq': seq, 'error': 'خطا در دریافت پاسخ از هوش مصنوعی'})
+            return None
+        finally:
+            limiter.release()
+        return ''.join(chunks)
+
+    async def done(self, seq, ai_message, provider_label, remaining, ai_access, cached=False):
+        await self.send_json({
+            'type': 'done',
+            'seq': seq,
+            'message': AIMessageSerializer(ai_message).data,
+            'conversation_title': self.conversation.title,
+            'cached': cached,
+            'provider': provider_label,
+            'remaining_questions': remaining,
+            'total_questions': ai_access.questions_limit,
+        })
+
+    @database_sync_to_async
+    def get_conversation(self):
+        return AIConversation.objects.filter(id=self.conversation_id, user=self.user).first()
+
+    @database_sync_to_async
+    def start_turn(self, content, ai_access):
+        """Store the question; None when it needs the provider and the quota is used up."""
+        # Only the first question of a conversation stands alone and can come from the cache
+        first_question = not self.conversation.messages.exists()
+        cached = answer_cache.lookup(content, self.conversation.course_id) if first_question else None
+        if cached is None and not ai_access.consume_question():
+            return None
+        user_message, context_messages = start_turn(self.conversation, content, cache_hit=cached is not None)
+        return cached, first_question, user_message, context_messages
+
+    @database_sync_to_async
+    def store_answer(self, answer, ai_access, cache_hit=False):
+        return finish_turn(self.conversation, answer, cache_hit=cache_hit), ai_access.get_remaining_questions()
+
+    async def send_json(self, content):
+        await self.send(text_data=json.dumps(content, ensure_ascii=False))
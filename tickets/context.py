@@ -0,0 +1,128 @@
+"""
+Conversation context for the AI tutor.
+
+Each AIMessage stores an approximate token count when it is saved
+(`estimate_tokens`). `build_context()` sends the conversation's rolling
+summary followed by the most recent messages that fit in
+AI_CONTEXT_TOKEN_BUDGET, newest first, instead of a fixed number of
+messages whatever their length.
+
+Messages that no longer fit are folded into AIConversation.summary by the
+`summarize_conversation` job (tickets/tasks.py), which `schedule_summary()`
+enqueues after an answer once the unsummarized messages exceed the budget.
+A summary run keeps the newest half of the budget verbatim, summarizes at
+most AI_SUMMARY_MAX_INPUT_TOKENS of older messages per provider call, and
+only moves the summary forward if no other run did in the meantime.
+"""
+import math
+import re
+
+from django.conf import settings
+from django.db.models import Sum
+
+from .models import AIConversation, AIMessage
+from .providers import get_provider
+
+SUMMARY_PROMPT = """
+شما خلاصه‌نویس گفتگوهای آموزشی هستید. خلاصه قبلی (اگر هست) و ادامه گفتگوی دانش‌آموز با دستیار آموزشی را
+در یک خلاصه کوتاه فارسی ادغام کنید: موضوع و صورت مسائل، فرمول‌ها و نتایج مهم (با $...$)، و نکاتی که دانش‌آموز
+هنوز در آن‌ها مشکل دارد. فقط متن خلاصه را بنویسید.
+"""
+
+_PIECES = re.compile(r'\w+|[^\w\s]')
+
+
+def estimate_tokens(text):
+    """
+    Approximate tokenizer count: ASCII words (LaTeX commands, numbers,
+    English) take about one token per 4 characters, Persian words about one
+    per 2 characters, and every symbol ($, ^, {, ...) one token.
+    """
+    tokens = 0
+    for piece in _PIECES.findall(text or ''):
+        if piece[0].isalnum() or piece[0] == '_':
+            tokens += math.ceil(len(piece) / (4 if piece.isascii() else 2))
+        else:
+            tokens += 1
+    return tokens
+
+
+def token_budget():
+    return getattr(settings, 'AI_CONTEXT_TOKEN_BUDGET', 2000)
+
+
+def _unsummarized(conversation):
+    return AIMessage.objects.filter(conversation_id=conversation.id, id__gt=conversation.summarized_until)
+
+
+def build_context(conversation, exclude_id=None, budget=None):
+    """Context messages for the next question: the summary, then the newest messages within `budget` tokens."""
+    budget = token_budget() if budget is None else budget
+    used = conversation.summary_token_count if conversation.summary else 0
+
+    recent = _unsummarized(conversation).order_by('-id').values_list('id', 'role', 'content', 'token_count')
+    if exclude_id is not None:
+        recent = recent.exclude(id=exclude_id)
+    picked = []
+    for message_id, role, content, tokens in recent[:getattr(settings, 'AI_CONTEXT_MAX_MESSAGES', 50)]:
+        if used + tokens > budget:
+            break
+        used += tokens
+        picked.append({'role': role, 'content': content})
+
+    context = [{'role': 'system', 'content': f'خلاصه گفتگوی قبلی:\n{conversation.summary}'}] if conversation.summary else []
+    return context + picked[::-1]
+
+
+def schedule_summary(conversation):
+    """Enqueue a summary update when the unsummarized messages no longer fit in the budget."""
+    from jobs.queue import enqueue
+    from .tasks import summarize_conversation
+
+    unsummarized = _unsummarized(conversation)
+    tokens = unsummarized.aggregate(total=Sum('token_count'))['total'] or 0
+    if tokens <= token_budget():
+        return None
+    last_id = unsummarized.order_by('-id').values_list('id', flat=True).first()
+    return enqueue(
+        summarize_conversation,
+        idempotency_key=f'ai-summary:{conversation.id}:{last_id}',
+        conversation_id=conversation.id,
+    )
+
+
+def update_summary(conversation):
+    """
+    Fold the oldest unsummarized messages into the summary with one provider
+    call. Returns True if there is more to fold.
+    """
+    provider = get_provider()
+    if provider is None:
+        return False
+
+    # Newest first: everything past the verbatim half of the budget gets summarized
+    keep, kept = token_budget() // 2, 0
+    messages = list(_unsummarized(conversation).order_by('-id').values_list('id', 'role', 'content', 'token_count'))
+    for index, (_, _, _, tokens) in enumerate(messages):
+        if kept + tokens > keep:
+            older = messages[index:][::-1]
+            break
+        kept += tokens
+    else:
+        return False
+
+    limit, batch, batch_tokens = getattr(settings, 'AI_SUMMARY_MAX_INPUT_TOKENS', 6000), [], 0
+    for message in older:
+        if batch and batch_tokens + message[3] > limit:
+            break
+        batch.append(message)
+        batch_tokens += message[3]
+
+    transcript = '\n'.join(f"{'دانش‌آموز' if role == 'user' else 'دستیار'}: {content}" for _, role, content, _ in batch)
+    request = f"خلاصه قبلی:\n{conversation.summary or '-'}\n\nادامه گفتگو:\n{transcript}"
+    summary = provider.generate(SUMMARY_PROMPT, request).strip()
+
+    moved = AIConversation.objects.filter(
+        id=conversation.id, summarized_until=conversation.summarized_until,
+    ).update(summary=summary, summary_token_count=estimate_tokens(summary), summarized_until=batch[-1][0])
+    return bool(moved) and len(batch) < len(older)
@@ -0,0 +1,119 @@
+"""
+A local stand-in for an OpenAI-compatible chat completions endpoint, for the
+tutor tests and for working on the streaming tutor offline:
+
+    python -m tickets.fake_provider 8765
+    LLM_API_KEY=fake LLM_BASE_URL=http://127.0.0.1:8765/v1 python manage.py runserver
+
+It answers every question with ANSWER (or the answer it was built with),
+word by word when the request asks for a stream, `delay` seconds apart. The
+server keeps connections alive (HTTP/1.1, chunked streams), records the
+request bodies in `requests` and the client ports in `connections`, so tests
+can check what the tutor sent and that it reused pooled connections.
+"""
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = 'پاسخ آزمایشی: $x^2 + 1$'
+
+
+class FakeProviderServer:
+    def __init__(self, answer=ANSWER, delay=0.0, port=0):
+        self.answer = answer
+        self.delay = delay
+        self.requests = []
+        self.connections = set()
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}/v1'
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake-ai-provider', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def chunks(self):
+        words = self.answer.split(' ')
+        return [word if i == 0 else ' ' + word for i, word in enumerate(words)]
+
+    def handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                fake.requests.append(body)
+                fake.connections.add(self.client_address[1])
+                if not self.path.endswith('/chat/completions'):
+                    self.send_error(404)
+                    return
+                if body.get('stream'):
+                    self.stream(body.get('model', 'fake'))
+                else:
+                    self.complete(body.get('model', 'fake'))
+
+            def complete(self, model):
+                payload = json.dumps({
+                    'id': 'fake', 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+                    'choices': [{'index': 0, 'finish_reason': 'stop',
+                                 'message': {'role': 'assistant', 'content': fake.answer}}],
+                }).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def stream(self, model):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for chunk in fake.chunks():
+                    time.sleep(fake.delay)
+                    self.event({
+                        'id': 'fake', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                        'choices': [{'index': 0, 'delta': {'content': chunk}, 'finish_reason': None}],
+                    })
+                self.event('[DONE]')
+                self.wfile.write(b'0\r\n\r\n')
+
+            def event(self, data):
+                line = f'data: {data if isinstance(data, str) else json.dumps(data)}\n\n'.encode()
+                self.wfile.write(f'{len(line):x}\r\n'.encode() + line + b'\r\n')
+                self.wfile.flush()
+
+        return Handler
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    server = FakeProviderServer(delay=0.05, port=port)
+    print(f'Fake AI provider on {server.url}')
+    try:
+        server.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
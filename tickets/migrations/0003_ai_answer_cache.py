@@ -0,0 +1,63 @@
+# Generated by Django 5.2.4 on 2026-10-19 11:46
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0013_course_spotplayer_course_id'),
+        ('tickets', '0002_aiconversation_aimessage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIAnswerCacheDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(unique=True, verbose_name='تاریخ')),
+                ('exact_hits', models.PositiveIntegerField(default=0, verbose_name='برخورد دقیق')),
+                ('similar_hits', models.PositiveIntegerField(default=0, verbose_name='برخورد مشابه')),
+                ('misses', models.PositiveIntegerField(default=0, verbose_name='عدم برخورد')),
+            ],
+            options={
+                'verbose_name': 'آمار حافظه نهان هوش مصنوعی',
+                'verbose_name_plural': 'آمار حافظه نهان هوش مصنوعی',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddField(
+            model_name='aiconversation',
+            name='course',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ai_conversations', to='courses.course', verbose_name='دوره'),
+        ),
+        migrations.AddField(
+            model_name='aimessage',
+            name='cache_hit',
+            field=models.BooleanField(default=False, verbose_name='پاسخ از حافظه نهان'),
+        ),
+        migrations.CreateModel(
+            name='CachedAIAnswer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('question', models.TextField(verbose_name='سوال')),
+                ('normalized_question', models.TextField(verbose_name='سوال نرمال\u200cشده')),
+                ('question_hash', models.CharField(max_length=64, verbose_name='هش سوال')),
+                ('math_hash', models.CharField(max_length=64, verbose_name='هش فرمول\u200cها')),
+                ('signature', models.BinaryField(verbose_name='امضای MinHash')),
+                ('answer', models.TextField(verbose_name='پاسخ')),
+                ('provider', models.CharField(blank=True, max_length=50, verbose_name='سرویس\u200cدهنده')),
+                ('hits', models.PositiveIntegerField(default=0, verbose_name='تعداد استفاده')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')),
+                ('expires_at', models.DateTimeField(verbose_name='تاریخ انقضا')),
+                ('course', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='cached_ai_answers', to='courses.course', verbose_name='دوره')),
+            ],
+            options={
+                'verbose_name': 'پاسخ ذخیره\u200cشده هوش مصنوعی',
+                'verbose_name_plural': 'پاسخ\u200cهای ذخیره\u200cشده هوش مصنوعی',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['question_hash', 'course'], name='ai_cache_hash_idx'), models.Index(fields=['math_hash', 'course'], name='ai_cache_math_idx'), models.Index(fields=['expires_at'], name='ai_cache_expires_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.2.4 on 2026-10-19 11:56
+
+import math
+import re
+
+from django.db import migrations, models
+
+_PIECES = re.compile(r'\w+|[^\w\s]')
+
+
+def estimate_tokens(text):
+    """Frozen copy of tickets.context.estimate_tokens as of this migration."""
+    tokens = 0
+    for piece in _PIECES.findall(text or ''):
+        if piece[0].isalnum() or piece[0] == '_':
+            tokens += math.ceil(len(piece) / (4 if piece.isascii() else 2))
+        else:
+            tokens += 1
+    return tokens
+
+
+def count_tokens(apps, schema_editor):
+    AIMessage = apps.get_model('tickets', 'AIMessage')
+    messages = AIMessage.objects.using(schema_editor.connection.alias).only('id', 'content')
+    batch = []
+    for message in messages.iterator(chunk_size=2000):
+        message.token_count = estimate_tokens(message.content)
+        batch.append(message)
+        if len(batch) >= 2000:
+            AIMessage.objects.using(schema_editor.connection.alias).bulk_update(batch, ['token_count'])
+            batch = []
+    AIMessage.objects.using(schema_editor.connection.alias).bulk_update(batch, ['token_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0003_ai_answer_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiconversation',
+            name='summarized_until',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='آخرین پیام خلاصه\u200cشده'),
+        ),
+        migrations.AddField(
+            model_name='aiconversation',
+            name='summary',
+            field=models.TextField(blank=True, verbose_name='خلاصه گفتگو'),
+        ),
+        migrations.AddField(
+            model_name='aiconversation',
+            name='summary_token_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='تعداد توکن خلاصه'),
+        ),
+        migrations.AddField(
+            model_name='aimessage',
+            name='token_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='تعداد توکن'),
+        ),
+        migrations.RunPython(count_tokens, migrations.RunPython.noop),
+    ]
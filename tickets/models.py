@@ -130,6 +130,19 @@ class AIConversation(models.Model):
         verbose_name='کاربر'
     )
     title = models.CharField(max_length=255, verbose_name='عنوان گفتگو')
+    # Scopes the answer cache: questions about the same course share cached answers
+    course = models.ForeignKey(
+        'courses.Course',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='ai_conversations',
+        verbose_name='دوره'
+    )
+    # Rolling summary of the messages up to id `summarized_until` (tickets/context.py)
+    summary = models.TextField(blank=True, verbose_name='خلاصه گفتگو')
+    summary_token_count = models.PositiveIntegerField(default=0, verbose_name='تعداد توکن خلاصه')
+    summarized_until = models.PositiveBigIntegerField(default=0, verbose_name='آخرین پیام خلاصه‌شده')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='تاریخ بروزرسانی')
     
@@ -157,6 +170,10 @@ class AIMessage(models.Model):
     )
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, verbose_name='نقش')
     content = models.TextField(verbose_name='محتوا')
+    # Turns answered from the answer cache do not count against the AI quota
+    cache_hit = models.BooleanField(default=False, verbose_name='پاسخ از حافظه نهان')
+    # Approximate prompt size, set on save (tickets/context.estimate_tokens)
+    token_count = models.PositiveIntegerField(default=0, verbose_name='تعداد توکن')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
     
     class Meta:
@@ -166,3 +183,69 @@ class AIMessage(models.Model):
     
     def __str__(self):
         return f'{self.role}: {self.content[:50]}...'
+
+    def save(self, *args, **kwargs):
+        from .context import estimate_tokens
+        if not self.token_count:
+            self.token_count = estimate_tokens(self.content)
+        super().save(*args, **kwargs)
+
+
+class CachedAIAnswer(models.Model):
+    """پاسخ ذخیره‌شده هوش مصنوعی برای سوالات تکراری (tickets/answer_cache.py)"""
+    course = models.ForeignKey(
+        'courses.Course',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='cached_ai_answers',
+        verbose_name='دوره'
+    )
+    question = models.TextField(verbose_name='سوال')
+    normalized_question = models.TextField(verbose_name='سوال نرمال‌شده')
+    question_hash = models.CharField(max_length=64, verbose_name='هش سوال')
+    # Numbers and formulas of the question; similar questions only match when these are identical
+    math_hash = models.CharField(max_length=64, verbose_name='هش فرمول‌ها')
+    signature = models.BinaryField(verbose_name='امضای MinHash')
+    answer = models.TextField(verbose_name='پاسخ')
+    provider = models.CharField(max_length=50, blank=True, verbose_name='سرویس‌دهنده')
+    hits = models.PositiveIntegerField(default=0, verbose_name='تعداد استفاده')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='تاریخ ایجاد')
+    expires_at = models.DateTimeField(verbose_name='تاریخ انقضا')
+
+    class Meta:
+        verbose_name = 'پاسخ ذخیره‌شده هوش مصنوعی'
+        verbose_name_plural = 'پاسخ‌های ذخیره‌شده هوش مصنوعی'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['question_hash', 'course'], name='ai_cache_hash_idx'),
+            models.Index(fields=['math_hash', 'course'], name='ai_cache_math_idx'),
+            models.Index(fields=['expires_at'], name='ai_cache_expires_idx'),
+        ]
+
+    def __str__(self):
+        return self.question[:50]
+
+
+class AIAnswerCacheDay(models.Model):
+    """آمار روزانه حافظه نهان پاسخ‌های هوش مصنوعی"""
+    date = models.DateField(unique=True, verbose_name='تاریخ')
+    exact_hits = models.PositiveIntegerField(default=0, verbose_name='برخورد دقیق')
+    similar_hits = models.PositiveIntegerField(default=0, verbose_name='برخورد مشابه')
+    misses = models.PositiveIntegerField(default=0, verbose_name='عدم برخورد')
+
+    class Meta:
+        verbose_name = 'آمار حافظه نهان هوش مصنوعی'
+        verbose_name_plural = 'آمار حافظه نهان هوش مصنوعی'
+        ordering = ['-date']
+
+    def __str__(self):
+        return str(self.date)
+
+    @property
+    def lookups(self):
+        return self.exact_hits + self.similar_hits + self.misses
+
+    @property
+    def hit_rate(self):
+        return (self.exact_hits + self.similar_hits) / self.lookups if self.lookups else None
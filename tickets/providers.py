@@ -0,0 +1,202 @@
+"""
+AI tutor providers.
+
+The provider SDKs (openai, google-generativeai and the gRPC/protobuf stack
+behind it) are imported the first time a provider is used, not when
+tickets.ai is imported by URL routing, so a worker that never serves the
+tutor never loads them. `manage.py benchmark_importtime` shows the effect.
+
+Providers register themselves in PROVIDERS. `get_provider()` builds the
+configured one once per process: AI_PROVIDER names it explicitly, otherwise
+the first registered provider whose API key is set is used.
+
+`generate()` blocks the calling thread for the whole answer. `stream()` is
+its async counterpart used by the streaming tutor consumer: it yields the
+answer in chunks as they arrive, over one pooled HTTP client per event loop
+(AI_HTTP_MAX_CONNECTIONS, AI_HTTP_TIMEOUT / AI_HTTP_CONNECT_TIMEOUT), and
+`stream_limiter()` caps the streams a process runs at once
+(AI_STREAM_CONCURRENCY).
+"""
+import asyncio
+import weakref
+from functools import cached_property, lru_cache
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+PROVIDERS = {}
+
+
+def register_provider(cls):
+    PROVIDERS[cls.name] = cls
+    return cls
+
+
+class AIProvider:
+    name = None
+    # Shown to clients as `provider`
+    label = None
+
+    def __init__(self, api_key, model):
+        self.api_key = api_key
+        self.model = model
+
+    @classmethod
+    def from_settings(cls):
+        """The provider built from settings, or None when its API key is not set."""
+        raise NotImplementedError
+
+    def generate(self, system_prompt, question, context_messages=None):
+        """Answer `question`; context_messages are earlier turns as {'role': 'user'|'ai'|'system', 'content': ...}."""
+        raise NotImplementedError
+
+    async def stream(self, system_prompt, question, context_messages=None):
+        """Yield the answer in chunks. Providers without a streaming API answer in one chunk from a thread."""
+        yield await asyncio.to_thread(self.generate, system_prompt, question, context_messages)
+
+
+@register_provider
+class OpenAICompatibleProvider(AIProvider):
+    """Any OpenAI-compatible chat completions endpoint (LLM_BASE_URL)."""
+    name = 'openai'
+    label = 'Liara'
+
+    def __init__(self, api_key, model, base_url, timeout=30.0, connect_timeout=5.0, max_connections=20):
+        super().__init__(api_key, model)
+        self.base_url = base_url
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_connections = max_connections
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def from_settings(cls):
+        api_key = getattr(settings, 'LLM_API_KEY', '')
+        if not api_key:
+            return None
+        return cls(
+            api_key, getattr(settings, 'LLM_MODEL', 'DeepSeek-V4-Pro'), getattr(settings, 'LLM_BASE_URL', None),
+            timeout=getattr(settings, 'AI_HTTP_TIMEOUT', 30.0),
+            connect_timeout=getattr(settings, 'AI_HTTP_CONNECT_TIMEOUT', 5.0),
+            max_connections=getattr(settings, 'AI_HTTP_MAX_CONNECTIONS', 20),
+        )
+
+    @cached_property
+    def client(self):
+        from openai import OpenAI
+        return OpenAI(base_url=self.base_url, api_key=self.api_key)
+
+    def async_client(self):
+        """The running event loop's AsyncOpenAI client; its connection pool is shared by every stream in the loop."""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            import httpx
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(
+                base_url=self.base_url,
+                api_key=self.api_key,
+                # A stream that fails halfway cannot be retried transparently
+                max_retries=0,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=self.max_connections,
+                                        max_keepalive_connections=self.max_connections),
+                    # The read timeout applies between chunks, not to the whole answer
+                    timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                ),
+            )
+            self._async_clients[loop] = client
+        return client
+
+    def messages(self, system_prompt, question, context_messages=None):
+        messages = [{'role': 'system', 'content': system_prompt}]
+        for message in context_messages or ():
+            messages.append({
+                'role': message['role'] if message['role'] in ('user', 'system') else 'assistant',
+                'content': message['content'],
+            })
+        messages.append({'role': 'user', 'content': question})
+        return messages
+
+    def generate(self, system_prompt, question, context_messages=None):
+        completion = self.client.chat.completions.create(
+            model=self.model,
+            messages=self.messages(system_prompt, question, context_messages),
+            timeout=self.timeout,
+        )
+        return completion.choices[0].message.content
+
+    async def stream(self, system_prompt, question, context_messages=None):
+        response = await self.async_client().chat.completions.create(
+            model=self.model,
+            messages=self.messages(system_prompt, question, context_messages),
+            stream=True,
+        )
+        async with response:
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+
+@register_provider
+class GeminiProvider(AIProvider):
+    name = 'gemini'
+    label = 'Google'
+
+    @classmethod
+    def from_settings(cls):
+        api_key = getattr(settings, 'GOOGLE_API_KEY', '')
+        if not api_key:
+            return None
+        return cls(api_key, getattr(settings, 'GEMINI_MODEL', 'gemini-1.5-flash'))
+
+    @cached_property
+    def client(self):
+        import google.generativeai as genai
+        genai.configure(api_key=self.api_key)
+        return genai.GenerativeModel(self.model)
+
+    def prompt(self, system_prompt, question, context_messages=None):
+        prompt = f"{system_prompt}\n\n"
+        if context_messages:
+            context_text = '\n'.join(f"{message['role']}: {message['content']}" for message in context_messages)
+            return prompt + f"با توجه به گفتگوی قبلی:\n\n{context_text}\n\nسوال جدید: {question}"
+        return prompt + f"سوال: {question}"
+
+    def generate(self, system_prompt, question, context_messages=None):
+        return self.client.generate_content(self.prompt(system_prompt, question, context_messages)).text
+
+    async def stream(self, system_prompt, question, context_messages=None):
+        response = await self.client.generate_content_async(
+            self.prompt(system_prompt, question, context_messages), stream=True,
+        )
+        async for chunk in response:
+            if chunk.parts:
+                yield chunk.text
+
+
+@lru_cache(maxsize=None)
+def get_provider():
+    """The configured provider (built once per process), or None when no API key is set."""
+    name = getattr(settings, 'AI_PROVIDER', '')
+    if name:
+        if name not in PROVIDERS:
+            raise ImproperlyConfigured(f"Unknown AI_PROVIDER {name!r}; choose from {', '.join(PROVIDERS)}")
+        return PROVIDERS[name].from_settings()
+    for provider_class in PROVIDERS.values():
+        provider = provider_class.from_settings()
+        if provider is not None:
+            return provider
+    return None
+
+
+_limiters = weakref.WeakKeyDictionary()
+
+
+def stream_limiter():
+    """The running event loop's semaphore for provider streams (AI_STREAM_CONCURRENCY at once)."""
+    loop = asyncio.get_running_loop()
+    limiter = _limiters.get(loop)
+    if limiter is None:
+        limiter = _limiters[loop] = asyncio.Semaphore(getattr(settings, 'AI_STREAM_CONCURRENCY', 8))
+    return limiter
@@ -122,8 +122,8 @@ class AIMessageSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = AIMessage
-        fields = ['id', 'role', 'content', 'created_at']
-        read_only_fields = ['created_at']
+        fields = ['id', 'role', 'content', 'cache_hit', 'created_at']
+        read_only_fields = ['cache_hit', 'created_at']
 
 
 class AIConversationSerializer(serializers.ModelSerializer):
@@ -134,9 +134,16 @@ class AIConversationSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = AIConversation
-        fields = ['id', 'title', 'created_at', 'updated_at', 'messages', 'remaining_questions', 'total_questions']
+        fields = ['id', 'title', 'course', 'created_at', 'updated_at', 'messages', 'remaining_questions', 'total_questions']
         read_only_fields = ['created_at', 'updated_at', 'remaining_questions', 'total_questions']
     
+    def validate_course(self, course):
+        """فقط دوره‌هایی که کاربر در آن‌ها عضو است یا تدریس می‌کند"""
+        user = self.context['request'].user
+        if course is not None and course.teacher_id != user.id and not course.students.filter(id=user.id).exists():
+            raise serializers.ValidationError('شما عضو این دوره نیستید')
+        return course
+    
     def get_remaining_questions(self, obj):
         try:
             from accounts.models import AIAccess
@@ -0,0 +1,22 @@
+"""Background jobs for the AI tutor."""
+
+from jobs.queue import task
+from . import answer_cache
+from .context import update_summary
+from .models import AIConversation
+
+
+@task(max_attempts=3, backoff=60)
+def summarize_conversation(conversation_id):
+    conversation = AIConversation.objects.filter(id=conversation_id).first()
+    if conversation is None:
+        return
+    while update_summary(conversation):
+        conversation.refresh_from_db()
+
+
+@task(max_attempts=3, backoff=60)
+def maintain_answer_cache():
+    """Store the answer cache's hit/miss counters and delete expired entries."""
+    answer_cache.flush_metrics()
+    answer_cache.purge_expired()
@@ -1,3 +1,346 @@
-from django.test import TestCase
+import io
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from channels.db import database_sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import AIAccess, User
+from courses.models import Course
+from jobs.models import Job
+from . import answer_cache
+from .context import build_context, estimate_tokens, schedule_summary, update_summary
+from .fake_provider import FakeProviderServer
+from .models import AIAnswerCacheDay, AIConversation, AIMessage, CachedAIAnswer
+from .providers import AIProvider, GeminiProvider, OpenAICompatibleProvider, get_provider
+from .routing import websocket_urlpatterns
+
+
+class EchoProvider(AIProvider):
+    name = 'echo'
+    label = 'Echo'
+
+    def generate(self, system_prompt, question, context_messages=None):
+        return f'answer to {question}'
+
+
+class ProviderRegistryTestCase(SimpleTestCase):
+    def setUp(self):
+        get_provider.cache_clear()
+        self.addCleanup(get_provider.cache_clear)
+
+    @override_settings(AI_PROVIDER='', LLM_API_KEY='llm-key', GOOGLE_API_KEY='google-key')
+    def test_first_configured_provider_wins(self):
+        provider = get_provider()
+        self.assertIsInstance(provider, OpenAICompatibleProvider)
+        self.assertEqual(provider.label, 'Liara')
+        self.assertIs(get_provider(), provider)
+
+    @override_settings(AI_PROVIDER='', LLM_API_KEY='', GOOGLE_API_KEY='google-key')
+    def test_falls_back_to_gemini(self):
+        self.assertIsInstance(get_provider(), GeminiProvider)
+
+    @override_settings(AI_PROVIDER='gemini', LLM_API_KEY='llm-key', GOOGLE_API_KEY='google-key')
+    def test_explicit_provider(self):
+        self.assertIsInstance(get_provider(), GeminiProvider)
+
+    @override_settings(AI_PROVIDER='', LLM_API_KEY='', GOOGLE_API_KEY='')
+    def test_no_key_configured(self):
+        self.assertIsNone(get_provider())
+
+    @override_settings(AI_PROVIDER='nope')
+    def test_unknown_provider(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_provider()
+
+    def test_openai_messages_map_ai_turns_to_assistant(self):
+        provider = OpenAICompatibleProvider('key', 'model', 'https://llm.example/v1')
+        messages = provider.messages('system', 'q2', [
+            {'role': 'user', 'content': 'q1'},
+            {'role': 'ai', 'content': 'a1'},
+        ])
+        self.assertEqual([message['role'] for message in messages], ['system', 'user', 'assistant', 'user'])
+        self.assertEqual(messages[-1]['content'], 'q2')
+
+    def test_startup_does_not_import_provider_sdks(self):
+        # Fails with CommandError if openai or google.generativeai is imported by the URLconf
+        out = io.StringIO()
+        call_command('benchmark_importtime', runs=1, limit=3, stdout=out)
+        self.assertIn('modules', out.getvalue())
+
+
+class GeminiAIViewTestCase(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user(username='student', password='x', role='student'))
+
+    def test_answer_reports_provider(self):
+        with mock.patch('tickets.ai.get_provider', return_value=EchoProvider('key', 'model')):
+            response = self.client.post('/api/support/ai/answer/', {'question': '2+2?'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['answer'], 'answer to 2+2?')
+        self.assertEqual(response.data['provider'], 'Echo')
+
+    def test_no_provider_configured(self):
+        with mock.patch('tickets.ai.get_provider', return_value=None):
+            response = self.client.post('/api/support/ai/answer/', {'question': '2+2?'}, format='json')
+        self.assertEqual(response.status_code, 500)
+
+    def test_each_question_uses_one_quota_question(self):
+        access = AIAccess.objects.get(user__username='student')
+        with mock.patch('tickets.ai.get_provider', return_value=EchoProvider('key', 'model')):
+            response = self.client.post('/api/support/ai/answer/', {'question': '2+2?'}, format='json')
+        self.assertEqual(response.data['remaining_questions'], access.questions_limit - 1)
+
+        AIAccess.objects.filter(pk=access.pk).update(questions_used=access.questions_limit)
+        with mock.patch('tickets.ai.get_provider', return_value=EchoProvider('key', 'model')):
+            response = self.client.post('/api/support/ai/answer/', {'question': '3+3?'}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_failed_answers_are_refunded(self):
+        provider = EchoProvider('key', 'model')
+        with mock.patch('tickets.ai.get_provider', return_value=provider), \
+                mock.patch.object(provider, 'generate', side_effect=RuntimeError('provider down')):
+            response = self.client.post('/api/support/ai/answer/', {'question': '2+2?'}, format='json')
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(AIAccess.objects.get(user__username='student').questions_used, 0)
+
+
+class AnswerCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_normalization(self):
+        self.assertEqual(
+            answer_cache.normalize_question('حل كن: معادله $x^{2} + 3x = ۴$ را؟'),
+            answer_cache.normalize_question('حل کن معادله $$x^2+3x=4$$ را'),
+        )
+        self.assertEqual(answer_cache.normalize_question(r'\(\dfrac{1}{2}\)'), answer_cache.normalize_question(r'$\frac{1}{2}$'))
+
+    def test_exact_and_similar_hits(self):
+        answer_cache.store('مساحت دایره‌ای به شعاع ۵ را حساب کنید', 'پاسخ', provider='Liara')
+
+        exact = answer_cache.lookup('مساحت دایره ای به شعاع 5 را حساب کنید.')
+        similar = answer_cache.lookup('مساحت دایره ای به شعاع 5 را حساب کن')
+        self.assertEqual(exact.answer, 'پاسخ')
+        self.assertEqual(similar.answer, 'پاسخ')
+        # Different numbers never match, however similar the wording
+        self.assertIsNone(answer_cache.lookup('مساحت دایره‌ای به شعاع ۶ را حساب کنید'))
+
+        self.assertEqual(CachedAIAnswer.objects.get().hits, 2)
+        # Counted in the cache until the maintenance job stores them
+        self.assertFalse(AIAnswerCacheDay.objects.exists())
+        answer_cache.flush_metrics()
+        answer_cache.flush_metrics()
+        day = AIAnswerCacheDay.objects.get()
+        self.assertEqual((day.exact_hits, day.similar_hits, day.misses), (1, 1, 1))
+
+    def test_lookups_write_nothing_and_schedule_maintenance(self):
+        answer_cache.lookup('2+2?')
+        job = Job.objects.get(name='tickets.tasks.maintain_answer_cache')
+        self.assertGreater(job.run_at, timezone.now())
+
+        # A miss reads the exact match and the similar candidates, nothing else
+        with self.assertNumQueries(2):
+            answer_cache.lookup('3+3?')
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_maintenance_purges_expired_answers(self):
+        from .tasks import maintain_answer_cache
+
+        answer_cache.store('2+2?', 'چهار')
+        answer_cache.store('3+3?', 'شش')
+        CachedAIAnswer.objects.filter(question='2+2?').update(expires_at=timezone.now() - timedelta(seconds=1))
+        answer_cache.lookup('3+3?')
+
+        maintain_answer_cache()
+        self.assertEqual(list(CachedAIAnswer.objects.values_list('question', flat=True)), ['3+3?'])
+        self.assertEqual(AIAnswerCacheDay.objects.get().exact_hits, 1)
+
+    @override_settings(AI_CACHE_SIMILARITY=0)
+    def test_similarity_can_be_disabled(self):
+        answer_cache.store('مساحت دایره‌ای به شعاع ۵ را حساب کنید', 'پاسخ')
+        self.assertIsNone(answer_cache.lookup('مساحت دایره ای به شعاع 5 را حساب کن'))
+
+    def test_scope_and_expiry(self):
+        teacher = User.objects.create_user(username='teacher', password='x', role='teacher')
+        course = Course.objects.create(title='Math', teacher=teacher)
+        answer_cache.store('2+2?', 'چهار', course_id=course.id)
+        self.assertIsNone(answer_cache.lookup('2+2?'))
+        self.assertIsNotNone(answer_cache.lookup('2+2?', course.id))
+
+        CachedAIAnswer.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertIsNone(answer_cache.lookup('2+2?', course.id))
+
+    def test_cache_hits_do_not_use_quota(self):
+        student = User.objects.create_user(username='student', password='x', role='student')
+        client = APIClient()
+        client.force_authenticate(student)
+        provider = EchoProvider('key', 'model')
+        with mock.patch('tickets.ai.get_provider', return_value=provider), \
+                mock.patch.object(provider, 'generate', wraps=provider.generate) as generate:
+            responses = []
+            for _ in range(2):
+                conversation = AIConversation.objects.create(user=student, title='گفتگوی جدید')
+                responses.append(client.post(
+                    f'/api/support/ai/conversations/{conversation.id}/add_message/', {'content': '2+2?'}, format='json',
+                ).data)
+        self.assertEqual(generate.call_count, 1)
+        self.assertEqual([response['cached'] for response in responses], [False, True])
+        self.assertEqual(responses[1]['ai_message']['content'], 'answer to 2+2?')
+        self.assertEqual(responses[1]['remaining_questions'], responses[0]['remaining_questions'])
+
+
+class AITutorConsumerTestCase(TransactionTestCase):
+    def setUp(self):
+        self.server = FakeProviderServer(answer='x equals two').start()
+        self.addCleanup(self.server.stop)
+        settings_override = override_settings(AI_PROVIDER='openai', LLM_API_KEY='fake', LLM_BASE_URL=self.server.url)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        get_provider.cache_clear()
+        self.addCleanup(get_provider.cache_clear)
+
+        self.student = User.objects.create_user(username='student', password='x', role='student')
+        self.conversation = AIConversation.objects.create(user=self.student, title='گفتگوی جدید')
+
+    async def _connect(self, user):
+        communicator = WebsocketCommunicator(
+            URLRouter(websocket_urlpatterns), f'/ws/ai/conversations/{self.conversation.id}/'
+        )
+        communicator.scope['user'] = user
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    async def _answer(self, communicator, seq, content):
+        await communicator.send_json_to({'type': 'question', 'content': content, 'seq': seq})
+        events = []
+        while not events or events[-1]['type'] not in ('done', 'error'):
+            events.append(await communicator.receive_json_from(timeout=5))
+        return events
+
+    async def test_answer_is_streamed_and_stored(self):
+        communicator, connected = await self._connect(self.student)
+        self.assertTrue(connected)
+
+        events = await self._answer(communicator, 1, 'x + 2 = 4?')
+        self.assertEqual(events[0]['type'], 'user_message')
+        tokens = [event['text'] for event in events if event['type'] == 'token']
+        self.assertEqual(tokens, ['x', ' equals', ' two'])
+        done = events[-1]
+        self.assertEqual(done['type'], 'done')
+        self.assertEqual(done['message']['content'], 'x equals two')
+        self.assertEqual(done['conversation_title'], 'x + 2 = 4?')
+        self.assertEqual(done['provider'], 'Liara')
+
+        messages = await database_sync_to_async(
+            lambda: list(AIMessage.objects.filter(conversation=self.conversation).values_list('role', 'content'))
+        )()
+        self.assertEqual(messages, [('user', 'x + 2 = 4?'), ('ai', 'x equals two')])
+
+        await self._answer(communicator, 2, 'and x + 3?')
+        await communicator.disconnect()
+        self.assertTrue(all(request['stream'] for request in self.server.requests))
+        self.assertEqual(self.server.requests[0]['messages'][0]['role'], 'system')
+        # Both answers went over the same pooled connection
+        self.assertEqual(len(self.server.connections), 1)
+
+    async def test_expired_access_is_refused(self):
+        await database_sync_to_async(AIAccess.objects.update_or_create)(
+            user=self.student, defaults={'access_duration': timezone.now() - timedelta(days=1)},
+        )
+        communicator, _ = await self._connect(self.student)
+        events = await self._answer(communicator, 1, 'x + 2 = 4?')
+        await communicator.disconnect()
+        self.assertEqual([event['type'] for event in events], ['error'])
+        self.assertEqual(self.server.requests, [])
+
+    async def test_other_users_conversations_are_refused(self):
+        other = await database_sync_to_async(User.objects.create_user)(username='other', password='x')
+        communicator, connected = await self._connect(other)
+        self.assertFalse(connected)
+
+
+class SummaryProvider(AIProvider):
+    name = 'summary'
+    label = 'Summary'
+
+    def generate(self, system_prompt, question, context_messages=None):
+        return 'خلاصه' if 'خلاصه قبلی' in question else f'answer to {question}'
+
+
+class ConversationContextTestCase(TestCase):
+    def setUp(self):
+        self.student = User.objects.create_user(username='student', password='x', role='student')
+        self.conversation = AIConversation.objects.create(user=self.student, title='t')
+
+    def _add(self, role, content):
+        return AIMessage.objects.create(conversation=self.conversation, role=role, content=content)
+
+    def test_token_estimate_is_stored_on_save(self):
+        self.assertEqual(estimate_tokens('$x^2$'), 5)
+        self.assertEqual(estimate_tokens('سلام'), 2)
+        self.assertEqual(self._add('user', 'سلام $x^2$').token_count, 7)
+
+    def test_newest_messages_are_packed_under_the_budget(self):
+        old = self._add('user', 'a ' * 50)
+        recent = [self._add('ai', 'b ' * 10), self._add('user', 'c ' * 10)]
+        question = self._add('user', 'd')
+
+        context = build_context(self.conversation, exclude_id=question.id, budget=25)
+        self.assertEqual([message['content'] for message in context], [recent[0].content, recent[1].content])
+
+        self.conversation.summary, self.conversation.summary_token_count = 'خلاصه', 2
+        self.conversation.summarized_until = old.id
+        context = build_context(self.conversation, exclude_id=question.id, budget=25)
+        self.assertEqual(context[0], {'role': 'system', 'content': 'خلاصه گفتگوی قبلی:\nخلاصه'})
+        self.assertEqual(len(context), 3)
+
+    @override_settings(AI_CONTEXT_TOKEN_BUDGET=20)
+    def test_summary_folds_old_messages(self):
+        self._add('user', 'a ' * 5)
+        self.assertIsNone(schedule_summary(self.conversation))
+        first = self._add('ai', 'b ' * 10)
+        self._add('user', 'c ' * 8)
+        self.assertIsNotNone(schedule_summary(self.conversation))
+        self.assertEqual(Job.objects.filter(name='tickets.tasks.summarize_conversation').count(), 1)
+
+        with mock.patch('tickets.context.get_provider', return_value=SummaryProvider('key', 'model')):
+            update_summary(self.conversation)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary, 'خلاصه')
+        self.assertEqual(self.conversation.summarized_until, first.id)
+
+    @override_settings(AI_CONTEXT_TOKEN_BUDGET=20)
+    def test_stale_summary_runs_do_not_overwrite(self):
+        self._add('user', 'a ' * 15)
+        self._add('ai', 'b ' * 15)
+        stale = AIConversation.objects.get(pk=self.conversation.pk)
+        AIConversation.objects.filter(pk=self.conversation.pk).update(summary='newer', summarized_until=1)
+        with mock.patch('tickets.context.get_provider', return_value=SummaryProvider('key', 'model')):
+            update_summary(stale)
+        self.assertEqual(AIConversation.objects.get(pk=self.conversation.pk).summary, 'newer')
+
+    @override_settings(AI_CONTEXT_TOKEN_BUDGET=12, JOBS_RUN_EAGERLY=True)
+    def test_long_conversations_are_summarized_after_an_answer(self):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        self._add('user', 'a ' * 10)
+        self._add('ai', 'b ' * 10)
+        provider = SummaryProvider('key', 'model')
+        with mock.patch('tickets.ai.get_provider', return_value=provider), \
+                mock.patch('tickets.context.get_provider', return_value=provider), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = client.post(
+                f'/api/support/ai/conversations/{self.conversation.id}/add_message/', {'content': 'c'}, format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.conversation.refresh_from_db()
+        self.assertEqual(self.conversation.summary, 'خلاصه')